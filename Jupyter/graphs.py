@@ -14,7 +14,7 @@ import enum
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
-from garmindb import GarminConnectConfigManager
+from garmindb import GarminConnectConfigManager, DbRegistry
 from garmindb.garmindb import MonitoringDb, Monitoring, MonitoringHeartRate, ActivitiesDb
 from garmindb.summarydb import DaysSummary, WeeksSummary, MonthsSummary, SummaryDb
 
@@ -214,7 +214,7 @@ class Graph():
             period = config[activity]['period']
         if days is None:
             days = config[activity]['days']
-        sum_db = SummaryDb(self.db_params, self.debug)
+        sum_db = DbRegistry.get(SummaryDb, self.db_params, self.debug)
         end_ts = datetime.datetime.now()
         start_ts = end_ts - datetime.timedelta(days=days)
         table = self.__table[period]
@@ -244,7 +244,7 @@ class Graph():
         """Generate a graph for the given date."""
         if date is None:
             date = (datetime.datetime.now() - datetime.timedelta(days=1)).date()
-        mon_db = MonitoringDb(self.db_params, self.debug)
+        mon_db = DbRegistry.get(MonitoringDb, self.db_params, self.debug)
         start_ts = datetime.datetime.combine(date, datetime.datetime.min.time())
         end_ts = datetime.datetime.combine(date, datetime.datetime.max.time())
         hr_data = MonitoringHeartRate.get_for_period(mon_db, start_ts, end_ts, MonitoringHeartRate)
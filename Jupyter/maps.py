@@ -72,9 +72,18 @@ blue_pin = ColoredPin('blue')
 class ActivityMap(Map):
     """Display a map of an activity."""
 
+    @classmethod
+    def __locations(cls, records):
+        if isinstance(records, dict):
+            # arrays from ActivityRecordArrays, missing positions are NaN
+            lats = records['position_lat']
+            longs = records['position_long']
+            return [[lat, long] for lat, long in zip(lats.tolist(), longs.tolist()) if lat == lat and long == long]
+        return [[record.position_lat, record.position_long] for record in records if record.position_lat is not None and record.position_long is not None]
+
     def __init__(self, records, laps=[], width=None, height=None, fullscreen_widget=False):
-        """Return a instance of a ActivityMap."""
-        locations = [[record.position_lat, record.position_long] for record in records if record.position_lat is not None and record.position_long is not None]
+        """Return a instance of a ActivityMap for a list of ActivityRecords or a dict of ActivityRecordArrays arrays."""
+        locations = self.__locations(records)
         lap_locations = [[lap.stop_lat, lap.stop_long] for lap in laps if lap.start_lat is not None and lap.start_long is not None]
         super().__init__(self.centroid(locations), width=width, height=height, fullscreen_widget=fullscreen_widget)
         ant_path = ipyleaflet.AntPath(locations=locations, dash_array=[1, 10], delay=2000, color='#7590ba', pulse_color='#3f6fba')
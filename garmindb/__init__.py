@@ -14,13 +14,17 @@ from .activity_fit_plugin_base import ActivityFitPluginBase
 from .monitoring_fit_plugin_base import MonitoringFitPluginBase
 from .activity_fit_file_processor import ActivityFitFileProcessor
 from .fit_data import FitData
+from .ledger_json_file_processor import LedgerJsonFileProcessor
 from .fit_file_processor import FitFileProcessor
 from .garmin_connect_config_manager import GarminConnectConfigManager
+from .sqlite_pragmas import SqlitePragmas
+from .db_registry import DbRegistry
 from .statistics import Statistics
-from .tcx import Tcx
+from .tcx import Tcx, TcxReader, TcxWriter
 from .monitoring_fit_file_processor import MonitoringFitFileProcessor
 from .sleep_fit_file_processor import SleepFitFileProcessor
 from .export_activities import ActivityExporter
+from .activity_record_arrays import ActivityRecordArrays
 from .open_with_basecamp import OpenWithBaseCamp
 from .open_with_google_earth import OpenWithGoogleEarth
 
@@ -7,12 +7,15 @@ __license__ = "GPL"
 
 import fitfile
 
+from .garmindb import ActivitiesDb
 from .fit_data import FitData
 
 
 class GarminActivitiesFitData(FitData):
     """Class for importing Garmin activity data from FIT files."""
 
+    import_db = ActivitiesDb
+
     def __init__(self, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminActivitiesFitData.
@@ -7,11 +7,15 @@ __license__ = "GPL"
 import logging
 import sys
 
+from sqlalchemy import insert
+
 import fitfile
 
-from .garmindb import File, ActivitiesDb, Activities, ActivityRecords, ActivityLaps, ActivitySplits, ActivitiesDevices, StepsActivities, \
+from .garmindb import ActivitiesDb, Activities, ActivityRecords, ActivityLaps, ActivitySplits, ActivitiesDevices, StepsActivities, \
     CycleActivities, ClimbingActivities, PaddleActivities
 from .fit_file_processor import FitFileProcessor
+from .fit_file_import_context import FitFileImportContext
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -22,53 +26,77 @@ root_logger = logging.getLogger()
 class ActivityFitFileProcessor(FitFileProcessor):
     """Class that takes a parsed activity FIT file object and imports it into a database."""
 
+    def __init__(self, db_params, plugin_manager=None, debug=0, record_arrays=None):
+        """
+        Return a new ActivityFitFileProcessor instance.
+
+        Paramters:
+        db_params (dict): database access configuration
+        plugin_manager (PluginManager): the plugins that handle the FIT file's messages
+        debug (Boolean): if True, debug logging is enabled
+        record_arrays (ActivityRecordArrays): if given, the records of each activity are also written as arrays
+        """
+        super().__init__(db_params, plugin_manager, debug)
+        self.record_arrays = record_arrays
+
     def write_file(self, fit_file):
         """Given a Fit File object, write all of its messages to the DB."""
-        self.activity_fit_file_plugins = [plugin for plugin in self.plugin_manager.get_file_processors('ActivityFit', fit_file).values()]
-        if len(self.activity_fit_file_plugins):
-            root_logger.info("Loaded %d activity plugins %r for file %s", len(self.activity_fit_file_plugins), self.activity_fit_file_plugins, fit_file)
-        # Create the db after setting up the plugins so that plugin tables are handled properly
-        self.garmin_act_db = ActivitiesDb(self.db_params, self.debug - 1)
+        plugins = self._file_plugins('ActivityFit', fit_file)
+        if len(plugins):
+            root_logger.info("Loaded %d activity plugins %r for file %s", len(plugins), plugins, fit_file)
+        self.import_context = FitFileImportContext(fit_file, plugins)
+        # Get the db after setting up the plugins so that any new plugin tables are created
+        self.garmin_act_db = DbRegistry.get(ActivitiesDb, self.db_params, self.debug - 1)
         with self.garmin_db.managed_session() as self.garmin_db_session, self.garmin_act_db.managed_session() as self.garmin_act_db_session:
             self._write_message_types(fit_file, fit_file.message_types)
-
-    def _plugin_dispatch(self, handler_name, *args, **kwargs):
-        return super()._plugin_dispatch(self.activity_fit_file_plugins, handler_name, *args, **kwargs)
+            if self.record_arrays is not None and fitfile.MessageType.record in fit_file.message_types:
+                self.garmin_act_db_session.flush()
+                self.record_arrays.s_write(self.garmin_act_db_session, self.import_context.activity_id)
 
     def _write_device_info_entry(self, fit_file, message_fields):
         device_serial_number = super()._write_device_info_entry(fit_file, message_fields)
         if device_serial_number:
-            activity_id = File.id_from_path(fit_file.filename)
+            activity_id = self.import_context.activity_id
             entry = {'activity_id' : activity_id, 'device_serial_number' : device_serial_number}
             if not ActivitiesDevices.s_exists(self.garmin_act_db_session, entry):
                 root_logger.debug("_write_device_info_entry activity_id %s, device serial number %s doesn't exist", activity_id, device_serial_number)
                 self.garmin_act_db_session.add(ActivitiesDevices(**entry))
 
+    def __write_entries(self, table, entries):
+        if entries:
+            root_logger.debug("Bulk inserting %d %s rows", len(entries), table.__tablename__)
+            self.garmin_act_db_session.execute(insert(table), entries)
+
     def _write_lap(self, fit_file, message_type, messages):
         """Write all lap messages to the database."""
-        for lap_num, message in enumerate(messages):
-            self._write_lap_entry(fit_file, message.fields, lap_num)
+        activity_id = self.import_context.activity_id
+        existing_laps = ActivityLaps.s_get_activity_lap_numbers(self.garmin_act_db_session, activity_id)
+        laps = [self._write_lap_entry(fit_file, activity_id, message.fields, lap_num, existing_laps) for lap_num, message in enumerate(messages)]
+        self.__write_entries(ActivityLaps, [lap for lap in laps if lap is not None])
 
     def _write_split(self, fit_file, message_type, messages):
         """Write all split messages to the database."""
-        for split_num, message in enumerate(messages):
-            self._write_split_entry(fit_file, message.fields, split_num)
+        activity_id = self.import_context.activity_id
+        existing_splits = ActivitySplits.s_get_activity_split_numbers(self.garmin_act_db_session, activity_id)
+        splits = [self._write_split_entry(fit_file, activity_id, message.fields, split_num, existing_splits) for split_num, message in enumerate(messages)]
+        self.__write_entries(ActivitySplits, [split for split in splits if split is not None])
 
     def _write_record(self, fit_file, message_type, messages):
         """Write all record messages to the database."""
-        for record_num, message in enumerate(messages):
-            self._write_record_entry(fit_file, message.fields, record_num)
+        activity_id = self.import_context.activity_id
+        existing_records = ActivityRecords.s_get_activity_record_numbers(self.garmin_act_db_session, activity_id)
+        records = [self._write_record_entry(fit_file, activity_id, message.fields, record_num, existing_records) for record_num, message in enumerate(messages)]
+        self.__write_entries(ActivityRecords, [record for record in records if record is not None])
 
-    def _write_record_entry(self, fit_file, message_fields, record_num):
+    def _write_record_entry(self, fit_file, activity_id, message_fields, record_num, existing_records):
         # We don't get record data from multiple sources so we don't need to coellesce data in the DB.
-        # It's fastest to just write the new data out if it doesn't currently exist.
-        activity_id = File.id_from_path(fit_file.filename)
+        # It's fastest to just write the new data out if it doesn't currently exist. Return the new record for a bulk insert.
         plugin_record = self._plugin_dispatch('write_record_entry', self.garmin_act_db_session, fit_file, activity_id, message_fields, record_num)
-        if not ActivityRecords.s_exists(self.garmin_act_db_session, {'activity_id' : activity_id, 'record' : record_num}):
+        if record_num not in existing_records:
             record = {
                 'activity_id'                       : activity_id,
                 'record'                            : record_num,
-                'timestamp'                         : fit_file.utc_datetime_to_local(message_fields.timestamp),
+                'timestamp'                         : self.import_context.local_datetime(message_fields.timestamp),
                 'position_lat'                      : message_fields.get('position_lat'),
                 'position_long'                     : message_fields.get('position_long'),
                 'distance'                          : message_fields.get('distance'),
@@ -81,19 +109,18 @@ class ActivityFitFileProcessor(FitFileProcessor):
             }
             record.update(plugin_record)
             root_logger.debug("_write_record_entry activity_id %s, record %s doesn't exist", activity_id, record_num)
-            self.garmin_act_db_session.add(ActivityRecords(**record))
+            return record
 
-    def _write_lap_entry(self, fit_file, message_fields, lap_num):
+    def _write_lap_entry(self, fit_file, activity_id, message_fields, lap_num, existing_laps):
         # we don't get laps data from multiple sources so we don't need to coellesce data in the DB.
-        # It's fastest to just write new data out if the it doesn't currently exist.
-        activity_id = File.id_from_path(fit_file.filename)
+        # It's fastest to just write new data out if the it doesn't currently exist. Return the new lap for a bulk insert.
         plugin_lap = self._plugin_dispatch('write_lap_entry', self.garmin_act_db_session, fit_file, activity_id, message_fields, lap_num)
-        if not ActivityLaps.s_exists(self.garmin_act_db_session, {'activity_id' : activity_id, 'lap' : lap_num}):
+        if lap_num not in existing_laps:
             lap = {
-                'activity_id'                       : File.id_from_path(fit_file.filename),
+                'activity_id'                       : activity_id,
                 'lap'                               : lap_num,
-                'start_time'                        : fit_file.utc_datetime_to_local(message_fields.start_time),
-                'stop_time'                         : fit_file.utc_datetime_to_local(message_fields.timestamp),
+                'start_time'                        : self.import_context.local_datetime(message_fields.start_time),
+                'stop_time'                         : self.import_context.local_datetime(message_fields.timestamp),
                 'elapsed_time'                      : message_fields.get('total_elapsed_time'),
                 'moving_time'                       : message_fields.get('total_timer_time'),
                 'start_lat'                         : message_fields.get('start_position_lat'),
@@ -118,20 +145,19 @@ class ActivityFitFileProcessor(FitFileProcessor):
             }
             lap.update(plugin_lap)
             root_logger.debug("writing lap %r for %s", lap, fit_file.filename)
-            self.garmin_act_db_session.add(ActivityLaps(**lap))
+            return lap
 
-    def _write_split_entry(self, fit_file, message_fields, split_num):
+    def _write_split_entry(self, fit_file, activity_id, message_fields, split_num, existing_splits):
         # we don't get splits data from multiple sources so we don't need to coellesce data in the DB.
-        # It's fastest to just write new data out if the it doesn't currently exist.
-        activity_id = File.id_from_path(fit_file.filename)
+        # It's fastest to just write new data out if the it doesn't currently exist. Return the new split for a bulk insert.
         plugin_split = self._plugin_dispatch('write_split_entry', self.garmin_act_db_session, fit_file, activity_id, message_fields, split_num)
 
-        if not ActivitySplits.s_exists(self.garmin_act_db_session, {'activity_id' : activity_id, 'split' : split_num}):
+        if split_num not in existing_splits:
             split = {
-                'activity_id'                       : File.id_from_path(fit_file.filename),
+                'activity_id'                       : activity_id,
                 'split'                             : split_num,
-                'start_time'                        : fit_file.utc_datetime_to_local(message_fields.start_time),
-                'stop_time'                         : fit_file.utc_datetime_to_local(message_fields.timestamp),
+                'start_time'                        : self.import_context.local_datetime(message_fields.start_time),
+                'stop_time'                         : self.import_context.local_datetime(message_fields.timestamp),
                 'elapsed_time'                      : message_fields.get('total_elapsed_time'),
                 'moving_time'                       : message_fields.get('total_timer_time'),
                 'avg_hr'                            : message_fields.get('avg_heart_rate'),
@@ -221,7 +247,7 @@ class ActivityFitFileProcessor(FitFileProcessor):
             # there are some empty splits we want to filter out
             if route.get('grade') is not None and route.get('completed') is not None:
                 root_logger.debug("writing split %r for %s", split, fit_file.filename)
-                self.garmin_act_db_session.add(ActivitySplits(**split))
+                return split
 
     def _write_steps_entry(self, fit_file, activity_id, sub_sport, message_fields):
         steps = {
@@ -316,13 +342,13 @@ class ActivityFitFileProcessor(FitFileProcessor):
         return {'sport' : fitfile.field_enums.name_for_enum(sport), 'sub_sport' : fitfile.field_enums.name_for_enum(sub_sport)}
 
     def _write_session_entry(self, fit_file, message_fields):
-        activity_id = File.id_from_path(fit_file.filename)
+        activity_id = self.import_context.activity_id
         sport = message_fields.sport
         sub_sport = message_fields.sub_sport
         activity = {
             'activity_id'                       : activity_id,
-            'start_time'                        : fit_file.utc_datetime_to_local(message_fields.start_time),
-            'stop_time'                         : fit_file.utc_datetime_to_local(message_fields.timestamp),
+            'start_time'                        : self.import_context.local_datetime(message_fields.start_time),
+            'stop_time'                         : self.import_context.local_datetime(message_fields.timestamp),
             'elapsed_time'                      : message_fields.total_elapsed_time,
             'moving_time'                       : message_fields.get('total_timer_time'),
             'start_lat'                         : message_fields.get('start_position_lat'),
@@ -403,7 +429,7 @@ class ActivityFitFileProcessor(FitFileProcessor):
     def _write_hr_zones_timer_lap_entry(self, fit_file, message_fields):
         """Write lap hz zones message to the database."""
         root_logger.info("writing lap hr zone data %r for %s", message_fields, fit_file.filename)
-        activity_id = File.id_from_path(fit_file.filename)
+        activity_id = self.import_context.activity_id
         lap = {
             'activity_id'   : activity_id,
             'lap'           : message_fields.get('record_num'),
@@ -415,7 +441,7 @@ class ActivityFitFileProcessor(FitFileProcessor):
     def _write_hr_zones_timer_session_entry(self, fit_file, message_fields):
         """Write session hz zones message to the database."""
         root_logger.info("writing session hr zone data %r for %s", message_fields, fit_file.filename)
-        activity_id = File.id_from_path(fit_file.filename)
+        activity_id = self.import_context.activity_id
         session = {
             'activity_id'   : activity_id,
         }
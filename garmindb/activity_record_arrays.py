@@ -0,0 +1,88 @@
+"""Columnar copies of activity records stored as compressed NumPy files so that analysis code can load them quickly."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import os
+import sys
+import logging
+
+from sqlalchemy import select
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .garmindb import ActivityRecords
+
+
+logger = logging.getLogger(__file__)
+logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+class ActivityRecordArrays():
+    """Store the records of each activity as one array per column in a compressed NumPy file. Requires numpy to be installed."""
+
+    columns = ['timestamp', 'position_lat', 'position_long', 'distance', 'altitude', 'hr', 'cadence', 'speed', 'temperature']
+
+    def __init__(self, directory):
+        """Return an instance of ActivityRecordArrays that keeps its files in the given directory."""
+        if numpy is None:
+            raise ImportError('Storing activity records as arrays requires numpy, install it with "pip install numpy"')
+        self.directory = directory
+
+    @classmethod
+    def available(cls):
+        """Return True if the packages needed to store activity records as arrays are installed."""
+        return numpy is not None
+
+    def filename(self, activity_id):
+        """Return the full path of the file holding the activity's record arrays."""
+        return os.path.join(self.directory, f'activity_{activity_id}.npz')
+
+    @classmethod
+    def __to_arrays(cls, rows):
+        columns = list(zip(*rows)) if rows else [()] * len(cls.columns)
+        # Missing values are stored as NaT for timestamps and NaN for everything else.
+        arrays = {'timestamp': numpy.array([numpy.datetime64(value, 'us') if value is not None else numpy.datetime64('NaT') for value in columns[0]], dtype='datetime64[us]')}
+        for name, values in zip(cls.columns[1:], columns[1:]):
+            arrays[name] = numpy.array([value if value is not None else numpy.nan for value in values], dtype=numpy.float64)
+        return arrays
+
+    def s_write(self, session, activity_id):
+        """Write the arrays for an activity from the records in the database and return them."""
+        query = (
+            select(*[getattr(ActivityRecords, column) for column in self.columns])
+            .where(ActivityRecords.activity_id == activity_id)
+            .order_by(ActivityRecords.timestamp)
+        )
+        arrays = self.__to_arrays(session.execute(query).all())
+        filename = self.filename(activity_id)
+        temp_filename = filename + '.tmp.npz'
+        numpy.savez_compressed(temp_filename, **arrays)
+        # replace the old file in one step so that readers never see a partially written file
+        os.replace(temp_filename, filename)
+        logger.debug("Wrote %d records for activity %s to %s", len(arrays['timestamp']), activity_id, filename)
+        return arrays
+
+    def write(self, db, activity_id):
+        """Write the arrays for an activity from the records in the database and return them."""
+        with db.managed_session() as session:
+            return self.s_write(session, activity_id)
+
+    def read(self, activity_id):
+        """Return a dict of arrays, keyed by column name, for the activity's records or None if they haven't been written."""
+        filename = self.filename(activity_id)
+        if not os.path.isfile(filename):
+            return None
+        with numpy.load(filename) as arrays:
+            return {column: arrays[column] for column in self.columns}
+
+    def get(self, db, activity_id):
+        """Return a dict of arrays, keyed by column name, for the activity's records, writing the arrays from the database first if needed."""
+        arrays = self.read(activity_id)
+        if arrays is None:
+            arrays = self.write(db, activity_id)
+        return arrays
@@ -7,13 +7,16 @@ __license__ = "GPL"
 import sys
 import logging
 import datetime
-import calendar
+import bisect
 from tqdm import tqdm
+from sqlalchemy import func, extract
 
 import fitfile
 
 from garmindb import summarydb
-from .garmindb import GarminDb, Attributes, Weight, Stress, RestingHeartRate, IntensityHR, Sleep, SleepEvents
+from .upsert_buffer import UpsertBuffer
+from .db_registry import DbRegistry
+from .garmindb import GarminDb, DirtyRange, Attributes, Weight, Stress, RestingHeartRate, IntensityHR, Sleep, SleepEvents
 from .garmindb import MonitoringDb, Monitoring, MonitoringHeartRate, MonitoringIntensity, MonitoringClimb
 from .garmindb import ActivitiesDb, Activities, StepsActivities
 from .garmindb import GarminSummaryDb, DaysSummary, DailySummary, WeeksSummary, MonthsSummary, YearsSummary
@@ -29,31 +32,42 @@ class Analyze():
     def __init__(self, gc_config, debug):
         """Return an instance of the Analyze class."""
         self.gc_config = gc_config
-        self.garmin_db = GarminDb(self.gc_config.get_db_params(), debug)
-        self.garmin_mon_db = MonitoringDb(self.gc_config.get_db_params(), debug)
-        self.garmin_sum_db = GarminSummaryDb(self.gc_config.get_db_params(), debug)
-        self.sum_db = summarydb.SummaryDb(self.gc_config.get_db_params(), debug)
-        self.garmin_act_db = ActivitiesDb(self.gc_config.get_db_params(), debug)
+        self.garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params(), debug)
+        self.garmin_mon_db = DbRegistry.get(MonitoringDb, self.gc_config.get_db_params(), debug)
+        self.garmin_sum_db = DbRegistry.get(GarminSummaryDb, self.gc_config.get_db_params(), debug)
+        self.sum_db = DbRegistry.get(summarydb.SummaryDb, self.gc_config.get_db_params(), debug)
+        self.garmin_act_db = DbRegistry.get(ActivitiesDb, self.gc_config.get_db_params(), debug)
         self.measurement_system = Attributes.measurements_type(self.garmin_db)
         self.unit_strings = fitfile.units.unit_strings[self.measurement_system]
 
     def __populate_hr_intensity(self, day_date, garmin_mon_session, garmin_sum_session, overwrite=False):
         if IntensityHR.s_row_count_for_day(garmin_sum_session, day_date) == 0 or overwrite:
             monitoring_rows = Monitoring._get_for_day(garmin_mon_session, day_date, not_none_col=Monitoring.intensity)
+            if not monitoring_rows:
+                return
+            # Get the HR values for the whole day, plus the minute after the last intensity value, and merge them with the intensity values in one pass.
+            one_minute = datetime.timedelta(seconds=60)
+            hr_rows = MonitoringHeartRate.s_get_for_period(garmin_mon_session, monitoring_rows[0].timestamp, monitoring_rows[-1].timestamp + one_minute)
+            hr_timestamps = [hr.timestamp for hr in hr_rows]
+            intensity_hr = UpsertBuffer(garmin_sum_session, IntensityHR)
+            hr_index = 0
             previous_ts = None
             for monitoring in monitoring_rows:
                 # Heart rate value is for one minute, reported at the end of the minute. Only take HR values where the
                 # measurement period falls within the activity period.
-                if previous_ts is not None and (monitoring.timestamp - previous_ts).total_seconds() > 60:
-                    hr_rows = MonitoringHeartRate.s_get_for_period(garmin_mon_session, previous_ts, previous_ts + datetime.timedelta(seconds=60), not_none_col=monitoring.timestamp)
-                    for hr in hr_rows:
+                if previous_ts is not None and (monitoring.timestamp - previous_ts) > one_minute:
+                    hr_index = bisect.bisect_left(hr_timestamps, previous_ts, hr_index)
+                    hr_end_index = bisect.bisect_left(hr_timestamps, previous_ts + one_minute, hr_index)
+                    for hr in hr_rows[hr_index:hr_end_index]:
                         entry = {
                             'timestamp'     : hr.timestamp,
                             'intensity'     : monitoring.intensity,
                             'heart_rate'    : hr.heart_rate
                         }
-                        IntensityHR.s_insert_or_update(garmin_sum_session, entry, ignore_none=True)
+                        intensity_hr.add(entry)
+                    hr_index = hr_end_index
                 previous_ts = monitoring.timestamp
+            intensity_hr.flush()
 
     def __populate_sleep_for_day(self, day_date, garmin_session, overwrite=False):
         """Ensure a Sleep row exists for the given day by summarizing SleepEvents if needed."""
@@ -77,154 +91,139 @@ class Analyze():
 
             Sleep.s_insert_or_update(garmin_session, entry, ignore_none=True)
 
-    def __calculate_day_stats(self, day_date, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
-        stats = DailySummary.get_daily_stats(garmin_session, day_date)
-        # prefer getting stats from the daily summary.
-        if stats.get('rhr_avg') is None:
-            stats.update(RestingHeartRate.get_daily_stats(garmin_session, day_date))
-        if stats.get('stress_avg') is None:
-            stats.update(Stress.get_daily_stats(garmin_session, day_date))
-        if stats.get('intensity_time') is None:
-            stats.update(MonitoringIntensity.get_daily_stats(garmin_mon_session, day_date))
-        if stats.get('floors') is None:
-            stats.update(MonitoringClimb.get_daily_stats(garmin_mon_session, day_date, self.measurement_system))
-        if stats.get('steps') is None:
-            stats.update(Monitoring.get_daily_stats(garmin_mon_session, day_date))
-        stats.update(MonitoringHeartRate.get_daily_stats(garmin_mon_session, day_date))
-        stats.update(IntensityHR.get_daily_stats(garmin_sum_session, day_date))
-        stats.update(Weight.get_daily_stats(garmin_session, day_date))
-        stats.update(Sleep.get_daily_stats(garmin_session, day_date))
-        # save it to the db
-        DaysSummary.s_insert_or_update(garmin_sum_session, stats)
-        summarydb.DaysSummary.s_insert_or_update(sum_session, stats)
-
-    def __calculate_days(self, year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
+    def __calculate_day_stats(self, days, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
+        # Get the stats for all of the days from each table with one query per table and merge them per day.
+        daily_summary_stats = DailySummary.s_get_daily_stats_for_days(garmin_session, days)
+        rhr_stats = RestingHeartRate.s_get_daily_stats_for_days(garmin_session, days)
+        stress_stats = Stress.s_get_daily_stats_for_days(garmin_session, days)
+        intensity_stats = MonitoringIntensity.s_get_daily_stats_for_days(garmin_mon_session, days)
+        climb_stats = MonitoringClimb.s_get_daily_stats_for_days(garmin_mon_session, days, self.measurement_system)
+        monitoring_stats = Monitoring.s_get_daily_stats_for_days(garmin_mon_session, days)
+        hr_stats = MonitoringHeartRate.s_get_daily_stats_for_days(garmin_mon_session, days)
+        intensity_hr_stats = IntensityHR.s_get_daily_stats_for_days(garmin_sum_session, days)
+        weight_stats = Weight.s_get_daily_stats_for_days(garmin_session, days)
+        sleep_stats = Sleep.s_get_daily_stats_for_days(garmin_session, days)
+        for day_date in days:
+            stats = daily_summary_stats[day_date]
+            # prefer getting stats from the daily summary.
+            if stats.get('rhr_avg') is None:
+                stats.update(rhr_stats[day_date])
+            if stats.get('stress_avg') is None:
+                stats.update(stress_stats[day_date])
+            if stats.get('intensity_time') is None:
+                stats.update(intensity_stats[day_date])
+            if stats.get('floors') is None:
+                stats.update(climb_stats[day_date])
+            if stats.get('steps') is None:
+                stats.update(monitoring_stats[day_date])
+            stats.update(hr_stats[day_date])
+            stats.update(intensity_hr_stats[day_date])
+            stats.update(weight_stats[day_date])
+            stats.update(sleep_stats[day_date])
+            # save it to the db
+            DaysSummary.s_insert_or_update(garmin_sum_session, stats)
+            summarydb.DaysSummary.s_insert_or_update(sum_session, stats)
+
+    def __calculate_days(self, year, dirty_days, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
         days_mon = Monitoring.s_get_days(garmin_mon_session, year) or []
         days_sleep = SleepEvents.s_get_days(garmin_session, year) or []
         days_all = sorted(set(days_mon) | set(days_sleep))
+        # Days that were imported again may have partial intensity data from a previous import, so overwrite those.
+        overwrite = dirty_days is not None
+        if dirty_days is not None:
+            days_all = [day for day in days_all if day in dirty_days]
 
         if days_all:
-            for day in tqdm(days_all, unit='days'):
-                day_dt = datetime.datetime(year=year, month=1, day=1) + datetime.timedelta(day - 1)
-                self.__populate_hr_intensity(day_dt, garmin_mon_session, garmin_sum_session)
+            day_dts = [datetime.datetime(year=year, month=1, day=1) + datetime.timedelta(day - 1) for day in days_all]
+            for day_dt in tqdm(day_dts, unit='days'):
+                self.__populate_hr_intensity(day_dt, garmin_mon_session, garmin_sum_session, overwrite)
                 # Ensure a summarized Sleep row exists when only SleepEvents are present
                 self.__populate_sleep_for_day(day_dt, garmin_session)
-                self.__calculate_day_stats(day_dt, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
+            self.__calculate_day_stats(day_dts, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
         days = Activities.s_get_days(garmin_act_session, year)
+        if dirty_days is not None:
+            days = [day for day in days if day in dirty_days]
         if len(days):
-            for day in tqdm(days, unit='days'):
-                stats = Activities.get_daily_stats(garmin_act_session, datetime.datetime(year=year, month=1, day=1) + datetime.timedelta(day - 1))
+            day_dts = [datetime.datetime(year=year, month=1, day=1) + datetime.timedelta(day - 1) for day in sorted(days)]
+            for stats in Activities.s_get_daily_stats_for_days(garmin_act_session, day_dts).values():
                 DaysSummary.s_insert_or_update(garmin_sum_session, stats)
                 summarydb.DaysSummary.s_insert_or_update(sum_session, stats)
 
-    def __calculate_week_stats(self, day_dt, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
-        stats = DailySummary.get_weekly_stats(garmin_session, day_dt)
-        # prefer getting stats from the daily summary.
-        if stats.get('rhr_avg') is None:
-            stats.update(RestingHeartRate.get_weekly_stats(garmin_session, day_dt))
-        if stats.get('stress_avg') is None:
-            stats.update(Stress.get_weekly_stats(garmin_session, day_dt))
-        if stats.get('intensity_time') is None:
-            stats.update(MonitoringIntensity.get_weekly_stats(garmin_mon_session, day_dt))
-        if stats.get('floors') is None:
-            stats.update(MonitoringClimb.get_weekly_stats(garmin_mon_session, day_dt, self.measurement_system))
-        if stats.get('steps') is None:
-            stats.update(Monitoring.get_weekly_stats(garmin_mon_session, day_dt))
-        stats.update(MonitoringHeartRate.get_weekly_stats(garmin_mon_session, day_dt))
-        stats.update(IntensityHR.get_weekly_stats(garmin_sum_session, day_dt))
-        stats.update(Weight.get_weekly_stats(garmin_session, day_dt))
-        stats.update(Sleep.get_weekly_stats(garmin_session, day_dt))
-        stats.update(Activities.get_weekly_stats(garmin_act_session, day_dt))
-        # save it to the db
-        WeeksSummary.s_insert_or_update(garmin_sum_session, stats)
-        summarydb.WeeksSummary.s_insert_or_update(sum_session, stats)
-
-    def __calculate_weeks(self, year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
-        for week_starting_day in tqdm(range(1, 365, 7), unit='weeks'):
-            day_dt = datetime.datetime(year=year, month=1, day=1) + datetime.timedelta(week_starting_day - 1)
-            if day_dt < datetime.datetime.now():
-                self.__calculate_week_stats(day_dt, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
-
-    def __calculate_monitoring_month_stats(self, start_day_date, end_day_date, garmin_session, garmin_mon_session, garmin_sum_session, sum_session):
-        stats = DailySummary.get_monthly_stats(garmin_session, start_day_date, end_day_date)
-        # prefer getting stats from the daily summary.
-        if 'rhr_avg' in stats:
-            stats.update(RestingHeartRate.get_monthly_stats(garmin_session, start_day_date, end_day_date))
-        if 'stress_avg' in stats:
-            stats.update(Stress.get_monthly_stats(garmin_session, start_day_date, end_day_date))
-        if 'intensity_time' in stats:
-            stats.update(MonitoringIntensity.get_monthly_stats(garmin_mon_session, start_day_date, end_day_date))
-        if 'floors' in stats:
-            stats.update(MonitoringClimb.get_monthly_stats(garmin_mon_session, start_day_date, end_day_date, self.measurement_system))
-        if 'steps' in stats:
-            stats.update(Monitoring.get_monthly_stats(garmin_mon_session, start_day_date, end_day_date))
-        stats.update(MonitoringHeartRate.get_monthly_stats(garmin_mon_session, start_day_date, end_day_date))
-        stats.update(IntensityHR.get_monthly_stats(garmin_sum_session, start_day_date, end_day_date))
-        stats.update(Weight.get_monthly_stats(garmin_session, start_day_date, end_day_date))
-        stats.update(Sleep.get_monthly_stats(garmin_session, start_day_date, end_day_date))
-        # save it to the db
-        MonthsSummary.s_insert_or_update(garmin_sum_session, stats)
-        summarydb.MonthsSummary.s_insert_or_update(sum_session, stats)
-
-    def __calculate_months(self, year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
-        months = Monitoring.s_get_months(garmin_mon_session, year)
-        if len(months):
-            for month in tqdm(months, unit='months'):
-                start_day_dt = datetime.datetime(year=year, month=month, day=1)
-                end_day_dt = datetime.datetime(year=year, month=month, day=calendar.monthrange(year, month)[1])
-                self.__calculate_monitoring_month_stats(start_day_dt, end_day_dt, garmin_session, garmin_mon_session, garmin_sum_session, sum_session)
-        months = Activities.s_get_months(garmin_act_session, year)
-        if len(months):
-            for month in tqdm(months, unit='months'):
-                stats = Activities.get_monthly_stats(garmin_act_session, datetime.datetime(year=year, month=month, day=1),
-                                                     datetime.datetime(year=year, month=month, day=calendar.monthrange(year, month)[1]))
-                MonthsSummary.s_insert_or_update(garmin_sum_session, stats)
-                summarydb.MonthsSummary.s_insert_or_update(sum_session, stats)
-
-    def __calculate_year_stats(self, year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session):
-        stats = DailySummary.get_yearly_stats(garmin_session, year)
-        # prefer getting stats from the daily summary.
-        if 'rhr_avg' in stats:
-            stats.update(RestingHeartRate.get_yearly_stats(garmin_session, year))
-        if 'stress_avg' in stats:
-            stats.update(Stress.get_yearly_stats(garmin_session, year))
-        if 'intensity_time' in stats:
-            stats.update(MonitoringIntensity.get_yearly_stats(garmin_mon_session, year))
-        if 'floors' in stats:
-            stats.update(MonitoringClimb.get_yearly_stats(garmin_mon_session, year, self.measurement_system))
-        if 'steps' in stats:
-            stats.update(Monitoring.get_yearly_stats(garmin_mon_session, year))
-        stats.update(MonitoringHeartRate.get_yearly_stats(garmin_mon_session, year))
-        stats.update(IntensityHR.get_yearly_stats(garmin_sum_session, year))
-        stats.update(Weight.get_yearly_stats(garmin_session, year))
-        stats.update(Sleep.get_yearly_stats(garmin_session, year))
-        stats.update(Activities.get_yearly_stats(garmin_act_session, year))
-        # save it to the db
-        YearsSummary.s_insert_or_update(garmin_sum_session, stats)
-        summarydb.YearsSummary.s_insert_or_update(sum_session, stats)
-
-    def __calculate_year(self, year):
+    def __write_period_stats(self, garmin_sum_table, sum_table, periods, garmin_sum_session, sum_session, unit, weekly=True):
+        for first_day, stats in tqdm(DaysSummary.s_rollup(garmin_sum_session, periods, weekly).items(), unit=unit):
+            stats['first_day'] = first_day
+            garmin_sum_table.s_insert_or_update(garmin_sum_session, stats)
+            sum_table.s_insert_or_update(sum_session, stats)
+
+    def __calculate_periods(self, year, dirty_days, garmin_sum_session, sum_session):
+        # Weeks, months, and the year are rolled up from the daily summaries. Weeks are ISO weeks (Monday to Sunday) and may cross the year boundary.
+        year_start = datetime.datetime(year=year, month=1, day=1)
+        year_end = datetime.datetime(year=year + 1, month=1, day=1)
+        if dirty_days is None:
+            days = [year_start + datetime.timedelta(day) for day in range((year_end - year_start).days)]
+        else:
+            days = [year_start + datetime.timedelta(day - 1) for day in sorted(dirty_days)]
+        if not days:
+            return
+        weeks = [(first_day, first_day + datetime.timedelta(7)) for first_day in sorted({day - datetime.timedelta(day.weekday()) for day in days})]
+        self.__write_period_stats(WeeksSummary, summarydb.WeeksSummary, weeks, garmin_sum_session, sum_session, 'weeks')
+        months = [(datetime.datetime(year=year, month=month, day=1), datetime.datetime(year=year + month // 12, month=month % 12 + 1, day=1))
+                  for month in sorted({day.month for day in days})]
+        self.__write_period_stats(MonthsSummary, summarydb.MonthsSummary, months, garmin_sum_session, sum_session, 'months', weekly=False)
+        self.__write_period_stats(YearsSummary, summarydb.YearsSummary, [(year_start, year_end)], garmin_sum_session, sum_session, 'years', weekly=False)
+
+    def __calculate_year(self, year, dirty_days=None):
         with self.garmin_db.managed_session() as garmin_session, self.garmin_mon_db.managed_session() as garmin_mon_session, \
                 self.garmin_act_db.managed_session() as garmin_act_session, self.garmin_sum_db.managed_session() as garmin_sum_session, \
                 self.sum_db.managed_session() as sum_session:
-            # calculate part of the years
-            self.__calculate_days(year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
-            self.__calculate_weeks(year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
-            self.__calculate_months(year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
-            # now calculate the year itself
-            self.__calculate_year_stats(year, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
-
-    def summary(self):
-        """Summarize Garmin health data. Daily, weekly, and monthly, tables will be generated."""
-
-        years_mon = Monitoring.get_years(self.garmin_mon_db)
-        years_act = Activities.get_years(self.garmin_act_db)
-        years_sleep = SleepEvents.get_years(self.garmin_db)
-        years_all = sorted(list(set(years_mon + years_act + years_sleep)))
-
-        for year in years_all:
-
-            self.__calculate_year(year)
+            self.__calculate_days(year, dirty_days, garmin_session, garmin_mon_session, garmin_act_session, garmin_sum_session, sum_session)
+            # flush the daily summaries so that the weeks, months, and the year can be rolled up from them
+            garmin_sum_session.flush()
+            self.__calculate_periods(year, dirty_days, garmin_sum_session, sum_session)
+
+    def __dirty_days_by_year(self):
+        """Return a dict of the days of the year, keyed by year, that importers changed since the last summary."""
+        dirty_days = {}
+        for day in DirtyRange.get_days(self.garmin_db):
+            dirty_days.setdefault(day.year, set()).add(day.timetuple().tm_yday)
+        return dirty_days
+
+    @classmethod
+    def __day_of_week(cls, session, col):
+        # the day of the week with Sunday as 0, MySQL doesn't support extracting it
+        if session.get_bind().dialect.name == 'mysql':
+            return func.dayofweek(col) - 1
+        return extract('dow', col)
+
+    def __delete_old_weeks(self):
+        """Delete weekly summaries that don't start on a Monday. Weeks used to be counted from the 1st of January. Return True if any were deleted."""
+        deleted = False
+        for db, table in [(self.garmin_sum_db, WeeksSummary), (self.sum_db, summarydb.WeeksSummary)]:
+            with db.managed_session() as session:
+                if session.query(table).filter(self.__day_of_week(session, table.first_day) != 1).delete(synchronize_session=False) > 0:
+                    deleted = True
+        return deleted
+
+    def summary(self, full=False):
+        """Summarize Garmin health data. Daily, weekly, monthly, and yearly summaries are generated for the days imported since the last summary, or all days if full."""
+        started = datetime.datetime.now()
+        # Replacing weeks from before weeks started on Mondays requires summarizing all of the data again.
+        if self.__delete_old_weeks() or full or DaysSummary.row_count(self.garmin_sum_db) == 0 or summarydb.DaysSummary.row_count(self.sum_db) == 0:
+            years_mon = Monitoring.get_years(self.garmin_mon_db)
+            years_act = Activities.get_years(self.garmin_act_db)
+            years_sleep = SleepEvents.get_years(self.garmin_db)
+            years_all = sorted(list(set(years_mon + years_act + years_sleep)))
+
+            for year in years_all:
+
+                self.__calculate_year(year)
+        else:
+            dirty_days = self.__dirty_days_by_year()
+            logger.info("Summarizing %d changed days", sum(len(days) for days in dirty_days.values()))
+            for year in sorted(dirty_days):
+                self.__calculate_year(year, dirty_days[year])
+        # Ranges recorded by imports that ran while summarizing are kept for the next run.
+        DirtyRange.clear(self.garmin_db, started)
 
     def create_dynamic_views(self):
         """Create database views specific to the data in this database."""
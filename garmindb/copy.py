@@ -7,6 +7,8 @@ __license__ = "GPL"
 import os
 import sys
 import shutil
+import filecmp
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import logging
 from datetime import datetime
@@ -31,34 +33,62 @@ class Copy():
         if not os.path.isdir(device_mount_dir):
             raise RuntimeError(f'Device mount directory {device_mount_dir} not a directory')
 
+    @classmethod
+    def __unchanged(cls, src, dest):
+        """Return True if dest already holds a copy of src."""
+        if not os.path.isfile(dest):
+            return False
+        src_stat = os.stat(src)
+        dest_stat = os.stat(dest)
+        if src_stat.st_size != dest_stat.st_size:
+            return False
+        if int(src_stat.st_mtime) == int(dest_stat.st_mtime):
+            return True
+        # Files copied without their timestamps have to be compared by content. Give matching files the source's timestamps so the next check is cheap.
+        if filecmp.cmp(src, dest, shallow=False):
+            os.utime(dest, (src_stat.st_atime, src_stat.st_mtime))
+            return True
+        return False
+
+    @classmethod
+    def __copy_file(cls, src, dest):
+        shutil.copy2(src, dest)
+        return dest
+
     def __copy(self, src_dir, dest_dir, latest=False, parse_as_ts=False, fn_suffix='WELLNESS'):
-        """Copy FIT files from a USB mounted Garmin device to the given directory."""
+        """Copy new and changed FIT files from a USB mounted Garmin device to the given directory. Return the list of files that were copied."""
         file_names = FileProcessor.dir_to_files(src_dir, fitfile.file.name_regex, latest)
         logger.info("Copying files from %s to %s", src_dir, dest_dir)
-        for file in tqdm(file_names, unit='files'):
-            dest = dest_dir
+        copies = []
+        for file in file_names:
             if parse_as_ts:
                 dt = os.path.basename(file).split('.fit')[0]
                 ts = datetime.strptime(dt, '%Y-%m-%d-%H-%M-%S').timestamp()
                 dest = os.path.join(dest_dir, f'{ts:.0f}') + fn_suffix + '.fit'
-            shutil.copy(file, dest)
+            else:
+                dest = os.path.join(dest_dir, os.path.basename(file))
+            if not self.__unchanged(file, dest):
+                copies.append((file, dest))
+        logger.info("%d of %d files are new or changed", len(copies), len(file_names))
+        with ThreadPoolExecutor(max_workers=self.gc_config.copy_workers()) as executor:
+            return list(tqdm(executor.map(lambda copy: self.__copy_file(*copy), copies), total=len(copies), unit='files'))
 
     def copy_activities(self, activities_dir, latest=False):
-        """Copy activites data FIT files from a USB mounted Garmin device to the given directory."""
+        """Copy activites data FIT files from a USB mounted Garmin device to the given directory. Return the list of files that were copied."""
         device_activities_dir = self.gc_config.device_activities_dir()
-        self.__copy(device_activities_dir, activities_dir, latest, True, '_activities')
+        return self.__copy(device_activities_dir, activities_dir, latest, True, '_activities')
 
     def copy_monitoring(self, monitoring_dir, latest=False):
-        """Copy daily monitoring data FIT files from a USB mounted Garmin device to the given directory."""
+        """Copy daily monitoring data FIT files from a USB mounted Garmin device to the given directory. Return the list of files that were copied."""
         device_monitoring_dir = self.gc_config.device_monitoring_dir()
-        self.__copy(device_monitoring_dir, monitoring_dir, latest)
+        return self.__copy(device_monitoring_dir, monitoring_dir, latest)
 
     def copy_sleep(self, monitoring_dir, latest=False):
-        """Copy daily sleep data FIT files from a USB mounted Garmin device to the given directory."""
+        """Copy daily sleep data FIT files from a USB mounted Garmin device to the given directory. Return the list of files that were copied."""
         device_sleep_dir = self.gc_config.device_sleep_dir()
-        self.__copy(device_sleep_dir, monitoring_dir, latest)
+        return self.__copy(device_sleep_dir, monitoring_dir, latest)
 
     def copy_settings(self, settings_dir):
-        """Copy settings FIT files from a USB mounted Garmin device to the given directory."""
+        """Copy settings FIT files from a USB mounted Garmin device to the given directory. Return the list of files that were copied."""
         device_settings_dir = self.gc_config.device_settings_dir()
-        self.__copy(device_settings_dir, settings_dir)
+        return self.__copy(device_settings_dir, settings_dir)
@@ -0,0 +1,67 @@
+"""A process wide registry of open databases."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import logging
+import threading
+
+from .sqlite_pragmas import SqlitePragmas
+
+
+logger = logging.getLogger(__name__)
+
+
+class DbRegistry():
+    """
+    Hands out one instance, and so one engine and connection pool, per database for the whole process.
+
+    Opening a database creates an engine and checks the database version and every table and view, so it's done once per database.
+    Tables added to a database class later, i.e. by plugins, are created and checked the next time the database is asked for.
+    """
+
+    dbs = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def __key(cls, db_class, db_params):
+        return (db_class, repr(sorted(vars(db_params).items())))
+
+    @classmethod
+    def __init_new_tables(cls, db, initialized_tables):
+        new_tables = [table for table in db.db_tables.values() if table not in initialized_tables]
+        if new_tables:
+            logger.info("%s: initializing new tables %r", db.__class__.__name__, new_tables)
+            db.Base.metadata.create_all(db.engine, tables=[table.__table__ for table in new_tables])
+            for table in new_tables:
+                db.init_table(table)
+            initialized_tables.update(new_tables)
+
+    @classmethod
+    def get(cls, db_class, db_params, debug_level=0):
+        """Return the open instance of the database class for the database parameters, opening it if this is the first request for it."""
+        key = cls.__key(db_class, db_params)
+        with cls.lock:
+            if key in cls.dbs:
+                db, initialized_tables = cls.dbs[key]
+                cls.__init_new_tables(db, initialized_tables)
+            else:
+                logger.debug("Opening %s with %r", db_class.__name__, db_params)
+                db = db_class(db_params, debug_level)
+                cls.dbs[key] = (db, set(db_class.db_tables.values()))
+            return db
+
+    @classmethod
+    def close(cls, db_class, db_params):
+        """Forget the open instance of the database class, if any, and close its connections."""
+        with cls.lock:
+            db, _ = cls.dbs.pop(cls.__key(db_class, db_params), (None, None))
+        if db is not None:
+            db.engine.dispose()
+
+    @classmethod
+    def delete_db(cls, db_class, db_params):
+        """Close and delete a database."""
+        cls.close(db_class, db_params)
+        SqlitePragmas.delete_db(db_class, db_params)
@@ -6,19 +6,27 @@ __license__ = "GPL"
 
 import os
 import sys
-import re
+import io
 import logging
 import datetime
 import time
-import tempfile
 import zipfile
+import zlib
+import hashlib
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from garth import Client as GarthClient
+from garth.auth_tokens import OAuth2Token
 from garth.exc import GarthHTTPError, GarthException
 from tqdm import tqdm
 
 import fitfile.conversions as conversions
 
+from .rate_limiter import RateLimiter
+from .garmindb import GarminDb, ImportLedger, DownloadJob
+from .db_registry import DbRegistry
+
 
 logger = logging.getLogger(__file__)
 logger.addHandler(logging.StreamHandler(stream=sys.stdout))
@@ -47,6 +55,7 @@ class Download():
     # https://connect.garmin.com/modern/proxy/usersummary-service/usersummary/hydration/allData/2019-11-29
 
     download_days_overlap = 3  # Existing donloaded data will be redownloaded and overwritten if it is within this number of days of now.
+    token_refresh_margin = 60  # OAuth2 tokens that expire within this number of seconds are refreshed before making a request.
 
     def __init__(self, gc_config):
         """Create a new Download class instance."""
@@ -55,6 +64,13 @@ class Download():
         self.garth_session_file = self.gc_config.get_session_file()
         self.garth = GarthClient()
         self.garth.configure(domain=self.gc_config.get_garmin_base_domain())
+        self.token_lock = threading.Lock()
+        self.workers = self.gc_config.download_workers()
+        self.rate_limiter = RateLimiter(*self.gc_config.download_rate_limit())
+        (self.retries, self.backoff) = self.gc_config.download_retries()
+        self.range_days = self.gc_config.download_range_days()
+        self.activity_page_size = self.gc_config.download_activity_page_size()
+        self.garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
 
     def __resume_session(self):
         if os.path.isfile(self.garth_session_file):
@@ -94,59 +110,210 @@ class Download():
 
         profile_dir = self.gc_config.get_fit_files_dir()
         self.save_json_to_file(f'{profile_dir}/social-profile', self.garth.profile)
-        self.save_json_to_file(f'{profile_dir}/user-settings', self.garth.connectapi(f'{self.garmin_connect_user_profile_url}/user-settings'), True)
-        self.save_json_to_file(f'{profile_dir}/personal-information', self.garth.connectapi(f'{self.garmin_connect_user_profile_url}/personal-information'), True)
+        self.save_json_to_file(f'{profile_dir}/user-settings', self.__connectapi(f'{self.garmin_connect_user_profile_url}/user-settings'), True)
+        self.save_json_to_file(f'{profile_dir}/personal-information', self.__connectapi(f'{self.garmin_connect_user_profile_url}/personal-information'), True)
 
         self.display_name = self.garth.profile['displayName']
         self.full_name = self.garth.profile['fullName']
         root_logger.info("login: %s (%s)", self.full_name, self.display_name)
         return True
 
-    def __unzip_files(self, outdir):
-        """Unzip and downloaded zipped files into the directory supplied."""
-        root_logger.info("unzip_files: from %s to %s", self.temp_dir, outdir)
-        for filename in os.listdir(self.temp_dir):
-            match = re.search(r'.*\.zip', filename)
-            if match:
-                full_pathname = f'{self.temp_dir}/{filename}'
-                with zipfile.ZipFile(full_pathname, 'r') as files_zip:
-                    try:
-                        files_zip.extractall(outdir)
-                    except Exception as e:
-                        logger.error('Failed to unzip %s to %s: %s', full_pathname, outdir, e)
+    @classmethod
+    def __retryable(cls, error):
+        # Retry when rate limited, on server errors, and when no response was received.
+        response = getattr(error.error, 'response', None)
+        return response is None or response.status_code == 429 or response.status_code >= 500
+
+    def __refresh_token(self):
+        """Refresh the OAuth2 token if it has expired or is about to. The download workers share one client, so one refreshes and the others wait for it."""
+        with self.token_lock:
+            token = self.garth.oauth2_token
+            if self.garth.oauth1_token and (not isinstance(token, OAuth2Token) or token.expires_at < time.time() + self.token_refresh_margin):
+                root_logger.info("Refreshing the OAuth2 token")
+                self.garth.refresh_oauth2()
+                self.__save_session()
+
+    def __request(self, function, *args, **kwargs):
+        """Make a Garmin Connect request when the rate limiter allows it. Retry failed requests with exponential backoff."""
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            self.__refresh_token()
+            try:
+                return function(*args, **kwargs)
+            except GarthHTTPError as e:
+                if attempt >= self.retries or not self.__retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                root_logger.warning("Request failed, retrying in %.1f seconds: %s", delay, e)
+                time.sleep(delay)
+
+    def __connectapi(self, url, params=None):
+        return self.__request(self.garth.connectapi, url, params=params)
+
+    def __run_jobs(self, stat, function, job_groups, unit):
+        """Call function for every group of download jobs using a pool of worker threads and record the results. The workers share the rate limiter."""
+        self.__refresh_token()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(function, jobs): jobs for jobs in job_groups}
+            for future in tqdm(as_completed(futures), total=len(futures), unit=unit):
+                items = [job.item for job in futures[future]]
+                error = future.exception()
+                if error is not None:
+                    root_logger.error("Failed to download %s %s: %s", stat, ', '.join(items), error)
+                    DownloadJob.record(self.garmin_db, stat, items, error)
+                else:
+                    # functions return the files they saved when the names of the files can't be worked out from the job
+                    filenames = future.result()
+                    DownloadJob.record(self.garmin_db, stat, items, data=json.dumps(filenames) if filenames is not None else None)
+        finally:
+            # Don't start any more downloads if interrupted. Jobs that didn't finish are still queued for the next run.
+            executor.shutdown(cancel_futures=True)
+        exhausted = DownloadJob.exhausted(self.garmin_db, stat)
+        if exhausted:
+            root_logger.warning("%d %s downloads have failed %d or more times and are retried every %s unless redone: %s",
+                                len(exhausted), stat, DownloadJob.max_attempts, DownloadJob.exhausted_retry_delay, ', '.join(job.item for job in exhausted))
+
+    @classmethod
+    def __file_matches(cls, filename, member):
+        """Return True if the file already has the same contents as the zip file member."""
+        if not os.path.isfile(filename) or os.path.getsize(filename) != member.file_size:
+            return False
+        crc = 0
+        with open(filename, 'rb') as file:
+            for chunk in iter(lambda: file.read(65536), b''):
+                crc = zlib.crc32(chunk, crc)
+        return crc == member.CRC
+
+    def __unzip_data(self, name, zip_data, outdir):
+        """Extract zipped data held in memory into the directory supplied, skipping files that are already present and unchanged. Return the files in the zip."""
+        root_logger.info("unzip_data: %s to %s", name, outdir)
+        filenames = []
+        try:
+            with zipfile.ZipFile(io.BytesIO(zip_data), 'r') as files_zip:
+                for member in files_zip.infolist():
+                    if member.is_dir():
+                        continue
+                    filename = os.path.join(outdir, member.filename)
+                    filenames.append(filename)
+                    if not self.__file_matches(filename, member):
+                        files_zip.extract(member, outdir)
+        except Exception as e:
+            # Fail the download job so that it's retried and, for activities, the summary that marks the activity as downloaded isn't saved.
+            logger.error('Failed to unzip %s to %s: %s', name, outdir, e)
+            raise
+        return filenames
+
+    def __get_zip_file(self, name, url, outdir):
+        """Download a zip file into memory and extract it into the directory supplied. Return the files in the zip."""
+        response = self.__request(self.garth.get, "connectapi", url, api=True)
+        return self.__unzip_data(name, response.content, outdir)
 
     @classmethod
     def __convert_to_json(cls, object):
         return object.__str__()
 
+    @classmethod
+    def __file_unchanged(cls, filename, data):
+        """Return True if the file already holds exactly the data."""
+        return os.path.getsize(filename) == len(data) and ImportLedger.file_hash(filename) == hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    def __write_file(cls, filename, data):
+        """Write data to a file unless the file already holds the same data. Return True if the file was written."""
+        exists = os.path.isfile(filename)
+        if exists and cls.__file_unchanged(filename, data):
+            # leave the file, and its modification time, alone so that the import ledger skips it
+            logger.debug("Unchanged %s", filename)
+            return False
+        logger.debug("%s %s", 'Overwriting' if exists else 'Saving', filename)
+        with open(filename, 'wb') as file:
+            file.write(data)
+        return True
+
     @classmethod
     def save_json_to_file(cls, filename, json_data, overwrite=False):
-        """Save JSON formatted data to a file."""
+        """Save JSON formatted data to a file. Return True if the file was written."""
         full_filename = f'{filename}.json'
-        exists = os.path.isfile(full_filename)
-        if not exists or overwrite:
-            logger.debug("%s %s", 'Overwriting' if exists else 'Saving', full_filename)
-            with open(full_filename, 'w') as file:
-                file.write(json.dumps(json_data, default=cls.__convert_to_json))
+        if overwrite or not os.path.isfile(full_filename):
+            return cls.__write_file(full_filename, json.dumps(json_data, default=cls.__convert_to_json).encode())
+        return False
 
     def save_binary_file(self, filename, url, overwrite=False):
-        """Save binary data to a file."""
-        exists = os.path.isfile(filename)
-        if not exists or overwrite:
-            logger.debug("%s %s", 'Overwriting' if exists else 'Saving', filename)
-            response = self.garth.get("connectapi", url, api=True)
-            with open(filename, 'wb') as file:
-                for chunk in response:
-                    file.write(chunk)
-
-    def __get_stat(self, stat_function, directory, date, days, overwrite):
-        for day in tqdm(range(0, days), unit='days'):
-            download_date = date + datetime.timedelta(days=day)
-            # always overwrite for yesterday and today since the last download may have been a partial result
-            delta = datetime.datetime.now().date() - download_date
-            stat_function(directory, download_date, overwrite or delta.days <= self.download_days_overlap)
-            # pause for a second between every page access
-            time.sleep(1)
+        """Save binary data to a file. Return True if the file was written."""
+        if overwrite or not os.path.isfile(filename):
+            response = self.__request(self.garth.get, "connectapi", url, api=True)
+            return self.__write_file(filename, response.content)
+        return False
+
+    def __overwrite(self, download_date, overwrite):
+        # always overwrite for yesterday and today since the last download may have been a partial result
+        delta = datetime.datetime.now().date() - download_date
+        return overwrite or delta.days <= self.download_days_overlap
+
+    @classmethod
+    def __job_date(cls, job):
+        return datetime.date.fromisoformat(job.item)
+
+    def __queue_days(self, stat, download_dates, overwrite, files_function, downloaded_dates=()):
+        """Queue a download job for each day. Days that were downloaded before are only downloaded again if they should be overwritten or their files are missing."""
+        redo = [download_date.isoformat() for download_date in download_dates if self.__overwrite(download_date, overwrite)]
+        DownloadJob.queue(self.garmin_db, stat, [download_date.isoformat() for download_date in download_dates], redo,
+                          missing=lambda job: not all(os.path.isfile(filename) for filename in files_function(job)),
+                          done=[download_date.isoformat() for download_date in downloaded_dates])
+
+    def __json_files_function(self, filename_function, directory):
+        """Return a function that returns the JSON file that a day's job saves."""
+        return lambda job: [f'{filename_function(directory, self.__job_date(job))}.json']
+
+    @classmethod
+    def __saved_files(cls, job):
+        """Return the files that a job recorded as saved."""
+        return json.loads(job.data) if job.data else []
+
+    def __get_stat(self, stat, stat_function, directory, date, days, overwrite, files_function):
+        """Queue the days for stat and download all queued days, including ones left over from previous runs."""
+        self.__queue_days(stat, [date + datetime.timedelta(days=day) for day in range(0, days)], overwrite, files_function)
+
+        def get_day(jobs):
+            download_date = self.__job_date(jobs[0])
+            return stat_function(directory, download_date, self.__overwrite(download_date, overwrite))
+        self.__run_jobs(stat, get_day, [[job] for job in DownloadJob.due(self.garmin_db, stat)], 'days')
+
+    def __get_stat_range(self, stat, range_function, filename_function, directory, date, days, overwrite):
+        """Download a stat with one request per range of days. Only days that haven't been downloaded yet or should be overwritten are requested."""
+        download_dates = [date + datetime.timedelta(days=day) for day in range(0, days)]
+        # days with files that were downloaded before jobs were recorded don't need to be downloaded again
+        downloaded = [download_date for download_date in download_dates
+                      if not self.__overwrite(download_date, overwrite) and os.path.isfile(f'{filename_function(directory, download_date)}.json')]
+        self.__queue_days(stat, download_dates, overwrite, self.__json_files_function(filename_function, directory), downloaded)
+        # group the due days into ranges of consecutive days, so that days that don't need downloading aren't requested
+        job_ranges = []
+        for job in DownloadJob.due(self.garmin_db, stat):
+            if (job_ranges and (self.__job_date(job) - self.__job_date(job_ranges[-1][-1])).days == 1
+                    and (self.__job_date(job) - self.__job_date(job_ranges[-1][0])).days < self.range_days):
+                job_ranges[-1].append(job)
+            else:
+                job_ranges.append([job])
+
+        def get_range(jobs):
+            range_function(directory, self.__job_date(jobs[0]), self.__job_date(jobs[-1]))
+        self.__run_jobs(stat, get_range, job_ranges, 'ranges')
+
+    @classmethod
+    def __split_by_day(cls, entries, day_function):
+        entries_by_day = {}
+        for entry in entries or []:
+            entries_by_day.setdefault(day_function(entry), []).append(entry)
+        return entries_by_day
+
+    @classmethod
+    def __days(cls, start, end):
+        return [start + datetime.timedelta(days=day) for day in range((end - start).days + 1)]
+
+    @classmethod
+    def __summary_filename(cls, directory_func, day):
+        return f'{directory_func(day.year)}/daily_summary_{day.strftime("%Y-%m-%d")}'
 
     def __get_summary_day(self, directory_func, date, overwrite=False):
         root_logger.info("get_summary_day: %s", date)
@@ -156,56 +323,58 @@ class Download():
             '_': str(conversions.dt_to_epoch_ms(conversions.date_to_dt(date)))
         }
         url = f'{self.garmin_connect_daily_summary_url}/{self.display_name}'
-        json_filename = f'{directory_func(date.year)}/daily_summary_{date_str}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(url, params=params), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary: %s", e)
+        self.save_json_to_file(self.__summary_filename(directory_func, date), self.__connectapi(url, params=params), overwrite)
 
     def get_daily_summaries(self, directory_func, date, days, overwrite):
         """Download the daily summary data from Garmin Connect and save to a JSON file."""
         root_logger.info("Getting daily summaries: %s (%d)", date, days)
-        self.__get_stat(self.__get_summary_day, directory_func, date, days, overwrite)
+        self.__get_stat('daily_summary', self.__get_summary_day, directory_func, date, days, overwrite,
+                        self.__json_files_function(self.__summary_filename, directory_func))
 
-    def __get_monitoring_day(self, date):
-        root_logger.info("get_monitoring_day: %s to %s", date, self.temp_dir)
-        zip_filename = f'{self.temp_dir}/{date}.zip'
+    def __get_monitoring_day(self, directory_func, date, overwrite=False):
+        root_logger.info("get_monitoring_day: %s", date)
         url = f'{self.garmin_connect_download_service_url}/wellness/{date.strftime("%Y-%m-%d")}'
-        try:
-            self.save_binary_file(zip_filename, url)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary: %s", e)
+        return self.__get_zip_file(f'{date}.zip', url, directory_func(date.year))
 
     def get_monitoring(self, directory_func, date, days):
         """Download the daily monitoring data from Garmin Connect, unzip and save the raw files."""
         root_logger.info("Getting monitoring: %s (%d)", date, days)
-        for day in tqdm(range(0, days), unit='days'):
-            day_date = date + datetime.timedelta(day)
-            self.temp_dir = tempfile.mkdtemp()
-            self.__get_monitoring_day(day_date)
-            self.__unzip_files(directory_func(day_date.year))
-            # pause for a second between every page access
-            time.sleep(1)
-
-    def __get_weight_day(self, directory, day, overwrite=False):
-        root_logger.info("Checking weight: %s overwrite %r", day, overwrite)
-        date_str = day.strftime('%Y-%m-%d')
+        self.__get_stat('monitoring', self.__get_monitoring_day, directory_func, date, days, False, self.__saved_files)
+
+    @classmethod
+    def __weight_filename(cls, directory, day):
+        return f'{directory}/weight_{day.strftime("%Y-%m-%d")}'
+
+    @classmethod
+    def __weight_day(cls, weight):
+        if weight.get('calendarDate'):
+            return weight['calendarDate']
+        # the weight timestamp is milliseconds since the epoch in local time, so it must not be converted with the host's timezone
+        return (datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=weight['date'])).strftime('%Y-%m-%d')
+
+    def __get_weight_range(self, directory, start, end):
+        root_logger.info("Checking weight: %s to %s", start, end)
         params = {
-            'startDate' : date_str,
-            'endDate'   : date_str,
-            '_'         : str(conversions.dt_to_epoch_ms(conversions.date_to_dt(day)))
+            'startDate' : start.strftime('%Y-%m-%d'),
+            'endDate'   : end.strftime('%Y-%m-%d'),
+            '_'         : str(conversions.dt_to_epoch_ms(conversions.date_to_dt(start)))
         }
-        json_filename = f'{directory}/weight_{date_str}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(self.garmin_connect_weight_url, params=params), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary: %s", e)
+        json_data = self.__connectapi(self.garmin_connect_weight_url, params=params)
+        # Save the weights for each day in a file per day like a request for a single day would return.
+        weights_by_day = self.__split_by_day(json_data.get('dateWeightList'), self.__weight_day)
+        for day in self.__days(start, end):
+            date_str = day.strftime('%Y-%m-%d')
+            day_json_data = {
+                'startDate'         : date_str,
+                'endDate'           : date_str,
+                'dateWeightList'    : weights_by_day.get(date_str, [])
+            }
+            self.save_json_to_file(self.__weight_filename(directory, day), day_json_data, True)
 
     def get_weight(self, directory, date, days, overwrite):
-        """Download the sleep data from Garmin Connect and save to a JSON file."""
+        """Download the weight data from Garmin Connect and save to a JSON file per day."""
         root_logger.info("Getting weight: %s (%d)", date, days)
-        self.__get_stat(self.__get_weight_day,
-                        directory, date, days, overwrite)
+        self.__get_stat_range('weight', self.__get_weight_range, self.__weight_filename, directory, date, days, overwrite)
 
     def __get_activity_summaries(self, start, count):
         root_logger.info("get_activity_summaries")
@@ -214,50 +383,58 @@ class Download():
             "limit" : str(count)
         }
         try:
-            return self.garth.connectapi(self.garmin_connect_activity_search_url, params=params)
+            return self.__connectapi(self.garmin_connect_activity_search_url, params=params)
         except GarthHTTPError as e:
             root_logger.error("Exception getting activity summary: %s", e)
 
     def __save_activity_details(self, directory, activity_id_str, overwrite):
         root_logger.debug("save_activity_details")
         json_filename = f'{directory}/activity_details_{activity_id_str}'
-        try:
-            url = f'{self.garmin_connect_activity_service_url}/{activity_id_str}'
-            self.save_json_to_file(
-                json_filename, self.garth.connectapi(url), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary %s", e)
+        url = f'{self.garmin_connect_activity_service_url}/{activity_id_str}'
+        self.save_json_to_file(json_filename, self.__connectapi(url), overwrite)
 
-    def __save_activity_file(self, activity_id_str):
+    def __save_activity_file(self, directory, activity_id_str):
         root_logger.debug("save_activity_file: %s", activity_id_str)
-        zip_filename = f'{self.temp_dir}/activity_{activity_id_str}.zip'
         url = f'{self.garmin_connect_download_service_url}/activity/{activity_id_str}'
-        try:
-            self.save_binary_file(zip_filename, url)
-        except GarthHTTPError as e:
-            root_logger.error("Exception downloading activity file: %s", e)
-
-    def get_activities(self, directory, count, overwrite=False):
-        """Download activities files from Garmin Connect and save the raw files."""
-        self.temp_dir = tempfile.mkdtemp()
-        logger.info("Getting activities: '%s' (%d) temp %s", directory, count, self.temp_dir)
-        activities = self.__get_activity_summaries(0, count)
-        for activity in tqdm(activities or [], unit='activities'):
-            activity_id_str = str(activity['activityId'])
-            activity_name_str = conversions.printable(activity.get('activityName'))
-            root_logger.info("get_activities: %s (%s)", activity_name_str, activity_id_str)
-            json_filename = f'{directory}/activity_{activity_id_str}'
-            if not os.path.isfile(json_filename + '.json') or overwrite:
-                root_logger.info("get_activities: %s <- %r", json_filename, activity)
-                self.__save_activity_details(directory, activity_id_str, overwrite)
-                self.save_json_to_file(json_filename, activity)
-                if not os.path.isfile(f'{directory}/{activity_id_str}.fit') or overwrite:
-                    self.__save_activity_file(activity_id_str)
-                # pause for a second between every page access
-                time.sleep(1)
-            else:
-                root_logger.info("get_activities: skipping download of %s, already present", activity_id_str)
-        self.__unzip_files(directory)
+        self.__get_zip_file(f'activity_{activity_id_str}.zip', url, directory)
+
+    @classmethod
+    def __activity_json_filename(cls, directory, activity):
+        return f'{directory}/activity_{activity["activityId"]}'
+
+    def __get_activity(self, directory, activity, overwrite):
+        activity_id_str = str(activity['activityId'])
+        activity_name_str = conversions.printable(activity.get('activityName'))
+        root_logger.info("get_activities: %s (%s)", activity_name_str, activity_id_str)
+        json_filename = self.__activity_json_filename(directory, activity)
+        root_logger.info("get_activities: %s <- %r", json_filename, activity)
+        self.__save_activity_details(directory, activity_id_str, overwrite)
+        if not os.path.isfile(f'{directory}/{activity_id_str}.fit') or overwrite:
+            self.__save_activity_file(directory, activity_id_str)
+        # Save the summary last, it's what marks the activity as downloaded.
+        self.save_json_to_file(json_filename, activity, overwrite)
+
+    def get_activities(self, directory, count, overwrite=False, latest=False):
+        """Download activities files from Garmin Connect and save the raw files. The activity list is fetched a page at a time, newest first."""
+        logger.info("Getting activities: '%s' (%d)", directory, count)
+        start = 0
+        while start < count:
+            page_size = min(self.activity_page_size, count - start)
+            activities = self.__get_activity_summaries(start, page_size)
+            if not activities:
+                break
+            new_activities = [activity for activity in activities if overwrite or not os.path.isfile(self.__activity_json_filename(directory, activity) + '.json')]
+            activity_ids = [str(activity['activityId']) for activity in new_activities]
+            DownloadJob.queue(self.garmin_db, 'activities', activity_ids, activity_ids, {str(activity['activityId']): json.dumps(activity) for activity in new_activities})
+            # The activities are listed newest first, so when getting the latest activities, once a whole page has already been downloaded,
+            # so have all older activities. Otherwise keep going, older activities may have been missed.
+            if (latest and not new_activities) or len(activities) < page_size:
+                root_logger.info("get_activities: stopping after %d activities", start + len(activities))
+                break
+            start += len(activities)
+        # Download the queued activities, including ones that failed or were interrupted in previous runs.
+        jobs = DownloadJob.due(self.garmin_db, 'activities')
+        self.__run_jobs('activities', lambda jobs: self.__get_activity(directory, json.loads(jobs[0].data), overwrite), [[job] for job in jobs], 'activities')
 
     def get_activity_types(self, directory, overwrite):
         """Download the activity types from Garmin Connect and save to a JSON file."""
@@ -266,71 +443,80 @@ class Download():
         try:
             url = f'{self.garmin_connect_activity_service_url}/activityTypes'
             self.save_json_to_file(
-                json_filename, self.garth.connectapi(url), overwrite)
+                json_filename, self.__connectapi(url), overwrite)
         except GarthHTTPError as e:
             root_logger.error("Exception getting activity types: %s", e)
 
+    @classmethod
+    def __sleep_filename(cls, directory, day):
+        return f'{directory}/sleep_{day}'
+
     def __get_sleep_day(self, directory, date, overwrite=False):
-        json_filename = f'{directory}/sleep_{date}'
         params = {
             'date'                  : date.strftime("%Y-%m-%d"),
             'nonSleepBufferMinutes' : 60
         }
         url = f'{self.garmin_connect_sleep_daily_url}/{self.display_name}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(url, params=params), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary: %s", e)
+        self.save_json_to_file(self.__sleep_filename(directory, date), self.__connectapi(url, params=params), overwrite)
 
     def get_sleep(self, directory, date, days, overwrite):
         """Download the sleep data from Garmin Connect and save to a JSON file."""
         root_logger.info("Getting sleep: %s (%d)", date, days)
-        self.__get_stat(self.__get_sleep_day, directory, date, days, overwrite)
+        self.__get_stat('sleep', self.__get_sleep_day, directory, date, days, overwrite, self.__json_files_function(self.__sleep_filename, directory))
 
-    def __get_rhr_day(self, directory, day, overwrite=False):
-        date_str = day.strftime('%Y-%m-%d')
-        json_filename = f'{directory}/rhr_{date_str}'
+    @classmethod
+    def __rhr_filename(cls, directory, day):
+        return f'{directory}/rhr_{day.strftime("%Y-%m-%d")}'
+
+    def __get_rhr_range(self, directory, start, end):
+        root_logger.info("Checking rhr: %s to %s", start, end)
         params = {
-            'fromDate'  : date_str,
-            'untilDate' : date_str,
+            'fromDate'  : start.strftime('%Y-%m-%d'),
+            'untilDate' : end.strftime('%Y-%m-%d'),
             'metricId'  : 60
         }
         url = f'{self.garmin_connect_rhr}/{self.display_name}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(
-                url, params=params), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary %s", e)
+        json_data = self.__connectapi(url, params=params)
+        # Save the resting heart rate for each day in a file per day like a request for a single day would return.
+        metrics = ((json_data.get('allMetrics') or {}).get('metricsMap') or {}).get('WELLNESS_RESTING_HEART_RATE')
+        rhr_by_day = self.__split_by_day(metrics, lambda rhr: rhr.get('calendarDate'))
+        for day in self.__days(start, end):
+            date_str = day.strftime('%Y-%m-%d')
+            day_json_data = {
+                'statisticsStartDate'   : date_str,
+                'statisticsEndDate'     : date_str,
+                'allMetrics'            : {'metricsMap': {'WELLNESS_RESTING_HEART_RATE': rhr_by_day.get(date_str, [])}}
+            }
+            self.save_json_to_file(self.__rhr_filename(directory, day), day_json_data, True)
 
     def get_rhr(self, directory, date, days, overwrite):
-        """Download the resting heart rate data from Garmin Connect and save to a JSON file."""
+        """Download the resting heart rate data from Garmin Connect and save to a JSON file per day."""
         root_logger.info("Getting rhr: %s (%d)", date, days)
-        self.__get_stat(self.__get_rhr_day, directory, date, days, overwrite)
+        self.__get_stat_range('rhr', self.__get_rhr_range, self.__rhr_filename, directory, date, days, overwrite)
+
+    @classmethod
+    def __hydration_filename(cls, directory_func, day):
+        return f'{directory_func(day.year)}/hydration_{day.strftime("%Y-%m-%d")}'
 
     def __get_hydration_day(self, directory_func, day, overwrite=False):
-        date_str = day.strftime('%Y-%m-%d')
-        json_filename = f'{directory_func(day.year)}/hydration_{date_str}'
-        url = f'{self.garmin_connect_daily_hydration_url}/{date_str}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(url), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting hydration: %s", e)
+        url = f'{self.garmin_connect_daily_hydration_url}/{day.strftime("%Y-%m-%d")}'
+        self.save_json_to_file(self.__hydration_filename(directory_func, day), self.__connectapi(url), overwrite)
 
     def get_hydration(self, directory_func, date, days, overwrite):
         """Download the hydration data from Garmin Connect and save to a JSON file."""
         root_logger.info("Getting hydration: %s (%d)", date, days)
-        self.__get_stat(self.__get_hydration_day, directory_func, date, days, overwrite)
+        self.__get_stat('hydration', self.__get_hydration_day, directory_func, date, days, overwrite,
+                        self.__json_files_function(self.__hydration_filename, directory_func))
+
+    @classmethod
+    def __hrv_filename(cls, directory, day):
+        return f'{directory}/hrv_{day.strftime("%Y-%m-%d")}'
 
     def __get_hrv_day(self, directory, day, overwrite=False):
-        date_str = day.strftime('%Y-%m-%d')
-        json_filename = f'{directory}/hrv_{date_str}'
-        url = f'{self.garmin_connect_hrv_url}/{date_str}'
-        try:
-            self.save_json_to_file(json_filename, self.garth.connectapi(url), overwrite)
-        except GarthHTTPError as e:
-            root_logger.error("Exception getting daily summary %s", e)
+        url = f'{self.garmin_connect_hrv_url}/{day.strftime("%Y-%m-%d")}'
+        self.save_json_to_file(self.__hrv_filename(directory, day), self.__connectapi(url), overwrite)
 
     def get_hrv(self, directory, date, days, overwrite):
         """Download the heart rate variability (HRV) data from Garmin Connect and save to a JSON file."""
         root_logger.info("Getting hrv: %s (%d)", date, days)
-        self.__get_stat(self.__get_hrv_day, directory, date, days, overwrite)
+        self.__get_stat('hrv', self.__get_hrv_day, directory, date, days, overwrite, self.__json_files_function(self.__hrv_filename, directory))
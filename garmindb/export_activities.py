@@ -5,11 +5,22 @@ __copyright__ = "Copyright Tom Goetz"
 __license__ = "GPL"
 
 import os
+import sys
+import logging
+import traceback
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from fitfile import Distance, Speed
 
 from .garmindb import GarminDb, File, Device, ActivitiesDb, Activities, ActivityLaps, ActivityRecords
-from .tcx import Tcx
+from .tcx import TcxWriter
+from .db_registry import DbRegistry
+
+
+logger = logging.getLogger(__file__)
+logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+root_logger = logging.getLogger()
 
 
 class ActivityExporter():
@@ -22,31 +33,80 @@ class ActivityExporter():
         self.measurement_system = measurement_system
         self.debug = debug
 
+    @classmethod
+    def _records_by_lap(cls, laps, records):
+        """Return a list with the records that fall in each lap. The records must be sorted by timestamp."""
+        timestamps = [record.timestamp for record in records]
+        return [records[bisect_left(timestamps, lap.start_time):bisect_right(timestamps, lap.stop_time)] for lap in laps]
+
+    def s_process(self, garmin_act_db_session, garmin_db_session):
+        """Read the activity's data from the databases using the given sessions."""
+        self.activity = Activities.s_get(garmin_act_db_session, self.activity_id)
+        self.laps = sorted(ActivityLaps.s_get_activity(garmin_act_db_session, self.activity_id), key=lambda lap: lap.start_time)
+        records = (
+            garmin_act_db_session.query(ActivityRecords)
+            .filter(ActivityRecords.activity_id == self.activity_id, ActivityRecords.timestamp != None)  # noqa
+            .order_by(ActivityRecords.timestamp).all()
+        )
+        self.lap_records = self._records_by_lap(self.laps, records)
+        file = File.s_get(garmin_db_session, self.activity_id)
+        self.serial_number = file.serial_number
+        self.product = Device.s_get(garmin_db_session, file.serial_number).product
+
     def process(self, db_params):
-        """Process database data for an activity into a an XML tree in TCX format."""
-        garmin_act_db = ActivitiesDb(db_params, self.debug - 1)
-        with garmin_act_db.managed_session() as garmin_act_db_session:
-            activity = Activities.s_get(garmin_act_db_session, self.activity_id)
-            self.tcx = Tcx()
-            self.tcx.create(activity.sport, activity.start_time)
-            laps = ActivityLaps.s_get_activity(garmin_act_db_session, self.activity_id)
-            records = ActivityRecords.s_get_activity(garmin_act_db_session, self.activity_id)
-            for lap in laps:
-                distance = Distance.from_meters_or_feet(lap.distance, self.measurement_system)
-                track = self.tcx.add_lap(lap.start_time, lap.stop_time, distance, lap.calories)
-                for record in records:
-                    if record.timestamp >= lap.start_time and record.timestamp <= lap.stop_time:
-                        alititude = Distance.from_meters_or_feet(record.altitude, self.measurement_system)
-                        speed = Speed.from_kph_or_mph(record.speed, self.measurement_system)
-                        self.tcx.add_point(track, record.timestamp, record.position, alititude, record.hr, speed)
-        gdb = GarminDb(db_params)
-        with gdb.managed_session() as garmin_db_session:
-            file = File.s_get(garmin_db_session, self.activity_id)
-            device = Device.s_get(garmin_db_session, file.serial_number)
-            self.tcx.add_creator(device.product, file.serial_number)
+        """Read the activity's data from the databases."""
+        garmin_act_db = DbRegistry.get(ActivitiesDb, db_params, self.debug - 1)
+        garmin_db = DbRegistry.get(GarminDb, db_params)
+        with garmin_act_db.managed_session() as garmin_act_db_session, garmin_db.managed_session() as garmin_db_session:
+            self.s_process(garmin_act_db_session, garmin_db_session)
 
     def write(self, filename):
         """Write the TCX file to disk."""
         full_path = self.directory + os.path.sep + filename
-        self.tcx.write(full_path)
+        with open(full_path, 'wb') as file:
+            tcx = TcxWriter(file)
+            tcx.start_activity(self.activity.sport, self.activity.start_time)
+            for lap, records in zip(self.laps, self.lap_records):
+                tcx.start_lap(lap.start_time, lap.stop_time, Distance.from_meters_or_feet(lap.distance, self.measurement_system), lap.calories)
+                for record in records:
+                    alititude = Distance.from_meters_or_feet(record.altitude, self.measurement_system)
+                    speed = Speed.from_kph_or_mph(record.speed, self.measurement_system)
+                    tcx.add_point(record.timestamp, record.position, alititude, record.hr, speed)
+                tcx.end_lap()
+            tcx.end_activity(self.product, self.serial_number)
         return full_path
+
+    @classmethod
+    def export(cls, db_params, directory, activity_ids, measurement_system, debug, workers=1):
+        """Export many activities as TCX files, reading them with one session per database and writing them with a pool of threads.
+
+        Return the paths of the files in the order of the activity ids. Activities that fail to export are logged and skipped.
+        """
+        garmin_act_db = DbRegistry.get(ActivitiesDb, db_params, debug - 1)
+        garmin_db = DbRegistry.get(GarminDb, db_params)
+        futures = []
+        pending = set()
+        with garmin_act_db.managed_session() as garmin_act_db_session, garmin_db.managed_session() as garmin_db_session, ThreadPoolExecutor(max_workers=workers) as executor:
+            for activity_id in activity_ids:
+                try:
+                    exporter = cls(directory, activity_id, measurement_system, debug)
+                    exporter.s_process(garmin_act_db_session, garmin_db_session)
+                except Exception as e:
+                    logger.error("Failed to export activity %s: %s", activity_id, e)
+                    root_logger.error("Failed to export activity %s: %s - %s", activity_id, e, traceback.format_exc())
+                    continue
+                future = executor.submit(exporter.write, f'activity_{activity_id}.tcx')
+                futures.append((activity_id, future))
+                pending.add(future)
+                # Limit the number of activities held in memory while waiting to be written.
+                if len(pending) >= workers * 2:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        paths = []
+        for activity_id, future in futures:
+            error = future.exception()
+            if error is not None:
+                logger.error("Failed to export activity %s: %s", activity_id, error)
+                root_logger.error("Failed to export activity %s: %s - %s", activity_id, error, ''.join(traceback.format_exception(error)))
+            else:
+                paths.append(future.result())
+        return paths
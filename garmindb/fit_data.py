@@ -7,21 +7,60 @@ __license__ = "GPL"
 
 import sys
 import logging
+import datetime
 import traceback
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.reduction import ForkingPickler
 from tqdm import tqdm
 
 import fitfile
 from idbutils import FileProcessor
 
+from .garmindb import GarminDb, ImportLedger, DirtyRange, DataCoverage
+
 
 logger = logging.getLogger(__file__)
 logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
 
+def _restore_fit_data(cls, state):
+    data = cls.__new__(cls)
+    vars(data).update(state)
+    return data
+
+
+def _reduce_fit_data(data):
+    # The parse time only file handle and secondary schema callbacks can't be pickled and aren't needed once the file has been decoded.
+    return (_restore_fit_data, (type(data), {key: value for key, value in vars(data).items() if key not in ['file', 'secondary_schemas']}))
+
+
+def _register_fit_data_reducers(cls):
+    for subclass in cls.__subclasses__():
+        ForkingPickler.register(subclass, _reduce_fit_data)
+        _register_fit_data_reducers(subclass)
+
+
+_register_fit_data_reducers(fitfile.data.Data)
+
+
+def _decode_fit_file(file_name, measurement_system):
+    """Decode a FIT file and return a tuple of the file name, the decoded file, and the error and traceback if decoding failed."""
+    try:
+        return (file_name, fitfile.file.File(file_name, measurement_system), None, None)
+    except Exception as e:
+        return (file_name, None, str(e), traceback.format_exc())
+
+
 class FitData():
     """Class for importing FIT files into a database."""
 
+    # the database the imported data is written to, used to invalidate import ledger entries when the database changes
+    import_db = GarminDb
+    # the stat that the days covered by the imported files are recorded as covered for
+    coverage_stat = None
+
     def __init__(self, input_dir, debug, latest=False, recursive=False, fit_types=None, measurement_system=fitfile.field_enums.DisplayMeasure.metric):
         """
         Return an instance of FitData.
@@ -38,22 +77,62 @@ class FitData():
         self.measurement_system = measurement_system
         self.debug = debug
         self.fit_types = fit_types
-        self.file_names = FileProcessor.dir_to_files(input_dir, fitfile.file.name_regex, latest, recursive)
+        self.file_names = sorted(FileProcessor.dir_to_files(input_dir, fitfile.file.name_regex, latest, recursive))
 
     def file_count(self):
         """Return the number of files that will be processed."""
         return len(self.file_names)
 
-    def process_files(self, fit_file_processor):
-        """Import FIT files into the database."""
-        for file_name in tqdm(self.file_names, unit='files'):
-            try:
-                fit_file = fitfile.file.File(file_name, self.measurement_system)
-                if self.fit_types is None or fit_file.type in self.fit_types:
-                    fit_file_processor.write_file(fit_file)
-                    root_logger.debug("Wrote %s to the database", fit_file)
-                else:
-                    root_logger.info("skipping non-matching %s", fit_file)
-            except Exception as e:
-                logger.error("Failed to parse %s: %s", file_name, e)
-                root_logger.error("Failed to parse %s: %s - %s", file_name, e, traceback.format_exc())
+    def __decode_files(self, workers):
+        if workers > 1 and len(self.file_names) > 1:
+            # Decoding is CPU bound and runs in the pool. Results are returned in file name order so that the single writer stays deterministic.
+            # Only a few files are submitted ahead of the writer to limit the number of decoded files held in memory.
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = collections.deque()
+                for file_name in self.file_names:
+                    pending.append(executor.submit(_decode_fit_file, file_name, self.measurement_system))
+                    if len(pending) >= workers * 2:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        else:
+            for file_name in self.file_names:
+                yield _decode_fit_file(file_name, self.measurement_system)
+
+    @classmethod
+    def __file_days(cls, fit_file):
+        start = fit_file.time_created_local
+        if start is None:
+            return []
+        end = max(start, fit_file.time_ended_local or start)
+        return [start.date() + datetime.timedelta(days=day) for day in range((end.date() - start.date()).days + 1)]
+
+    def process_files(self, fit_file_processor, workers=1):
+        """Import FIT files into the database. Files are decoded by a pool of worker processes and written to the database by this process."""
+        importer = self.__class__.__name__
+        garmin_db = fit_file_processor.garmin_db
+        self.file_names = ImportLedger.changed_files(garmin_db, self.file_names, importer, self.import_db)
+        imported_file_names = []
+        dirty_days = set()
+        try:
+            for file_name, fit_file, error, error_traceback in tqdm(self.__decode_files(workers), total=len(self.file_names), unit='files'):
+                if fit_file is None:
+                    logger.error("Failed to parse %s: %s", file_name, error)
+                    root_logger.error("Failed to parse %s: %s - %s", file_name, error, error_traceback)
+                    continue
+                try:
+                    if self.fit_types is None or fit_file.type in self.fit_types:
+                        fit_file_processor.write_file(fit_file)
+                        dirty_days.update(self.__file_days(fit_file))
+                        root_logger.debug("Wrote %s to the database", fit_file)
+                    else:
+                        root_logger.info("skipping non-matching %s", fit_file)
+                    imported_file_names.append(file_name)
+                except Exception as e:
+                    logger.error("Failed to parse %s: %s", file_name, e)
+                    root_logger.error("Failed to parse %s: %s - %s", file_name, e, traceback.format_exc())
+        finally:
+            ImportLedger.record(garmin_db, imported_file_names, importer, self.import_db)
+            DirtyRange.add_days(garmin_db, dirty_days, importer)
+            if self.coverage_stat is not None:
+                DataCoverage.add_days(garmin_db, self.coverage_stat, dirty_days, importer)
@@ -0,0 +1,44 @@
+"""Values derived from a FIT file that are used while importing each of the file's messages."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import datetime
+
+from .garmindb import File
+from .plugin_manager import FilePlugins
+
+
+class FitFileImportContext():
+    """Values derived from a FIT file that the message handlers use, worked out once per file instead of once per message."""
+
+    def __init__(self, fit_file, plugins=None):
+        """
+        Return a new FitFileImportContext instance.
+
+        Paramters:
+        fit_file (FitFile): the file being imported
+        plugins (FilePlugins): the plugins that handle the file's messages
+        """
+        self.fit_file = fit_file
+        (self.file_id, self.file_name) = File.name_and_id_from_path(fit_file.filename)
+        # activities are identified by the id of the file they were imported from
+        self.activity_id = self.file_id
+        self.plugins = plugins or FilePlugins()
+        # the serial number of the device that created the file, set when the file_id message is written
+        self.serial_number = None
+        self.utc_offset = datetime.timedelta(seconds=fit_file.utc_offset) if getattr(fit_file, 'local_tz', None) is not None else datetime.timedelta()
+        self.__db_file_id = None
+
+    def local_datetime(self, dt):
+        """Return a local datetime based on the passed in datetime, converting UTC datetimes with the file's UTC offset like FitFile.utc_datetime_to_local()."""
+        if dt.tzinfo is datetime.timezone.utc:
+            return dt.replace(tzinfo=None) + self.utc_offset
+        return dt.replace(tzinfo=None)
+
+    def s_db_file_id(self, session):
+        """Return the id of the file's entry in the files table."""
+        if self.__db_file_id is None:
+            self.__db_file_id = File.s_get_id(session, self.file_name)
+        return self.__db_file_id
@@ -11,6 +11,10 @@ import traceback
 import fitfile
 
 from .garmindb import GarminDb, File, Device, DeviceInfo, Stress, Attributes
+from .upsert_buffer import UpsertBuffer
+from .fit_file_import_context import FitFileImportContext
+from .plugin_manager import PluginManager
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -33,15 +37,31 @@ class FitFileProcessor():
         self.plugin_manager = plugin_manager
         self.db_params = db_params
         self.debug = debug
-        self.garmin_db = GarminDb(db_params, debug - 1)
-
-    def _plugin_dispatch(self, plugins, handler_name, *args, **kwargs):
-        result = {}
-        for plugin in plugins:
-            function = getattr(plugin, handler_name, None)
-            if function:
-                result.update(function(*args, **kwargs))
-        return result
+        self.garmin_db = DbRegistry.get(GarminDb, db_params, debug - 1)
+        self.__upsert_buffers = {}
+
+    def _upsert(self, session, table, values_dict):
+        """Buffer a row to be inserted, or updated with its non-None values, in a batch with other rows for the same table."""
+        upsert_buffer = self.__upsert_buffers.get(table)
+        if upsert_buffer is None:
+            upsert_buffer = UpsertBuffer(session, table)
+            self.__upsert_buffers[table] = upsert_buffer
+        upsert_buffer.add(values_dict)
+
+    def _flush_upserts(self):
+        """Write all buffered rows to the database."""
+        for upsert_buffer in self.__upsert_buffers.values():
+            upsert_buffer.flush()
+        self.__upsert_buffers = {}
+
+    def _file_plugins(self, file_type, fit_file):
+        """Return the plugins of type file_type that handle the FIT file."""
+        if self.plugin_manager is None:
+            return PluginManager.no_plugins
+        return self.plugin_manager.get_file_plugins(file_type, fit_file)
+
+    def _plugin_dispatch(self, handler_name, *args, **kwargs):
+        return self.import_context.plugins.dispatch(handler_name, *args, **kwargs)
 
     def __write_generic(self, fit_file, message_type, messages):
         """Write all messages of a given message type to the database."""
@@ -63,7 +83,7 @@ class FitFileProcessor():
 
     def _write_file_id(self, fit_file, message_type, messages):
         """Write all file id messages to the database."""
-        self.serial_number = None
+        self.import_context.serial_number = None
         self.manufacturer = None
         self.product = None
         for message in messages:
@@ -82,14 +102,18 @@ class FitFileProcessor():
         # Some ordering is important: 1. create new file entries 2. create new device entries
         #
         priority_message_types = [fitfile.MessageType.file_id, fitfile.MessageType.device_info]
+        # drop any rows left buffered by a previous file that failed to import, they belong to a different session
+        self.__upsert_buffers = {}
         for message_type in priority_message_types:
             self.__write_message_type(fit_file, message_type)
         for message_type in message_types:
             if message_type not in priority_message_types:
                 self.__write_message_type(fit_file, message_type)
+        self._flush_upserts()
 
     def write_file(self, fit_file):
         """Write all data from the FIT file to database files."""
+        self.import_context = FitFileImportContext(fit_file)
         with self.garmin_db.managed_session() as self.garmin_db_session:
             self._write_message_types(fit_file, fit_file.message_types)
 
@@ -98,39 +122,38 @@ class FitFileProcessor():
     #
     def _write_file_id_entry(self, fit_file, message_fields):
         root_logger.debug("file_id fields: %r", message_fields)
-        self.serial_number = message_fields.serial_number
+        self.import_context.serial_number = message_fields.serial_number
         _manufacturer = Device.Manufacturer.convert(message_fields.manufacturer)
         if _manufacturer is not None:
             self.manufacturer = _manufacturer
         self.product = message_fields.product
         device_type = fitfile.MainDeviceType.derive_device_type(self.manufacturer, self.product)
-        if self.serial_number:
+        if self.import_context.serial_number:
             device = {
-                'serial_number' : self.serial_number,
-                'timestamp'     : fit_file.utc_datetime_to_local(message_fields.time_created),
+                'serial_number' : self.import_context.serial_number,
+                'timestamp'     : self.import_context.local_datetime(message_fields.time_created),
                 'device_type'   : fitfile.field_enums.name_for_enum(device_type),
                 'manufacturer'  : self.manufacturer,
                 'product'       : fitfile.field_enums.name_for_enum(self.product),
             }
             Device.s_insert_or_update(self.garmin_db_session, device)
-        (file_id, file_name) = File.name_and_id_from_path(fit_file.filename)
         file = {
-            'id'            : file_id,
-            'name'          : file_name,
+            'id'            : self.import_context.file_id,
+            'name'          : self.import_context.file_name,
             'type'          : File.FileType.convert(message_fields.type),
-            'serial_number' : self.serial_number
+            'serial_number' : self.import_context.serial_number
         }
         File.s_insert_or_update(self.garmin_db_session, file)
 
     def _write_device_info_entry(self, fit_file, message_fields):
-        timestamp = fit_file.utc_datetime_to_local(message_fields.timestamp)
+        timestamp = self.import_context.local_datetime(message_fields.timestamp)
         device_type = message_fields.get('device_type', fitfile.MainDeviceType.fitness_tracker)
         serial_number = message_fields.serial_number
         source_type = message_fields.source_type
         # local devices are part of the main device. Base missing fields off of the main device.
         if source_type is fitfile.field_enums.SourceType.local:
-            if serial_number is None and self.serial_number is not None and device_type is not None:
-                serial_number = Device.local_device_serial_number(self.serial_number, device_type)
+            if serial_number is None and self.import_context.serial_number is not None and device_type is not None:
+                serial_number = Device.local_device_serial_number(self.import_context.serial_number, device_type)
         if serial_number is not None:
             manufacturer = Device.Manufacturer.convert(message_fields.manufacturer)
             device = {
@@ -143,7 +166,7 @@ class FitFileProcessor():
             }
             Device.s_insert_or_update(self.garmin_db_session, device, ignore_none=True)
             device_info = {
-                'file_id'               : File.s_get_id(self.garmin_db_session, fit_file.filename),
+                'file_id'               : self.import_context.s_db_file_id(self.garmin_db_session),
                 'serial_number'         : serial_number,
                 'timestamp'             : timestamp,
                 'cum_operating_time'    : message_fields.cum_operating_time,
@@ -159,7 +182,7 @@ class FitFileProcessor():
             'timestamp' : message_fields.local_timestamp,
             'stress'    : message_fields.stress_level
         }
-        Stress.s_insert_or_update(self.garmin_db_session, stress)
+        self._upsert(self.garmin_db_session, Stress, stress)
 
     def _write_event_entry(self, fit_file, message_fields):
         root_logger.debug("event message: %r", message_fields)
@@ -15,6 +15,7 @@ from idbutils import JsonConfig
 from fitfile import Sport
 
 from .statistics import Statistics
+from .sqlite_pragmas import SqlitePragmas
 from idbutils import DbParams
 
 
@@ -28,9 +29,17 @@ class GarminConnectConfigManager(JsonConfig):
     temp_dir = tempfile.mkdtemp()
     homedir = os.path.expanduser('~')
 
-    def __init__(self, config_dir=None):
+    # SQLite settings used when no db.sqlite_pragmas config is given: WAL lets readers work while an import is writing and
+    # synchronous NORMAL is safe in WAL mode. Imports get a bigger page cache and wait for other writers, i.e. a pipelined download, instead of failing.
+    default_sqlite_pragmas = {
+        'import' : {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 268435456, 'temp_store': 'MEMORY', 'busy_timeout': 30000},
+        'read'   : {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -16384, 'mmap_size': 268435456, 'temp_store': 'MEMORY'}
+    }
+
+    def __init__(self, config_dir=None, sqlite_pragmas_preset='read'):
         """Return a new GarminConnectConfigManager instance."""
         self.enabled_statistics = None
+        self.sqlite_pragmas_preset = sqlite_pragmas_preset
         self.config_dir = config_dir or self.__create_dir_if_needed(self.homedir + os.sep + '.GarminDb')
         config_file = self.config_dir + os.sep + 'GarminConnectConfig.json'
         try:
@@ -78,6 +87,11 @@ class GarminConnectConfigManager(JsonConfig):
         """Return the configured hostname of the database."""
         return self.get_node_value('db', 'host')
 
+    def get_sqlite_pragmas(self):
+        """Return a dict of the SQLite pragmas, from the db.sqlite_pragmas config preset that is in use, to set on each database connection."""
+        presets = self.get_node_value_default('db', 'sqlite_pragmas', self.default_sqlite_pragmas)
+        return presets.get(self.sqlite_pragmas_preset, {})
+
     def get_db_dir(self, test_dir=False):
         """Return the configured directory of where the database will be stored."""
         return self.__create_dir_if_needed(self.get_base_dir(test_dir) + os.sep + 'DBs')
@@ -90,12 +104,15 @@ class GarminConnectConfigManager(JsonConfig):
         }
         if db_type == 'sqlite':
             db_params['db_path'] = self.get_db_dir(test_db)
+            db_params['sqlite_pragmas'] = self.get_sqlite_pragmas()
         elif db_type == "mysql":
             db_params['db_type'] = 'mysql'
             db_params['db_username'] = self.get_db_user()
             db_params['db_password'] = self.get_db_password()
             db_params['db_host'] = self.get_db_host()
-        return DbParams(**db_params)
+        db_params = DbParams(**db_params)
+        SqlitePragmas.register(db_params)
+        return db_params
 
     def get_base_dir(self, test_dir=False):
         """Return the configured directory of where the data files will be stored."""
@@ -132,6 +149,10 @@ class GarminConnectConfigManager(JsonConfig):
         """Return the configured directory of where the activities files will be stored."""
         return self.__create_dir_if_needed(self.__get_fit_files_dir(test_dir) + os.sep + 'Activities')
 
+    def get_activity_record_arrays_dir(self):
+        """Return the configured directory of where the activity record array files will be stored creating it if needed."""
+        return self.__create_dir_if_needed(self.get_base_dir() + os.sep + 'ActivityRecords')
+
     def get_sleep_dir(self):
         """Return the configured directory of where the sleep files will be stored."""
         return self.__create_dir_if_needed(self.get_base_dir() + os.sep + 'Sleep')
@@ -160,6 +181,42 @@ class GarminConnectConfigManager(JsonConfig):
         """Return the unit system (metric, statute) that is configured."""
         return self.get_node_value_default('settings', 'metric', False)
 
+    def activity_record_arrays(self):
+        """Return True if activity records should also be stored as arrays when importing. Requires numpy."""
+        return self.get_node_value_default('settings', 'activity_record_arrays', False)
+
+    def import_workers(self):
+        """Return the number of worker processes to use when decoding FIT files during import."""
+        return self.get_node_value_default('settings', 'import_workers', 1)
+
+    def copy_workers(self):
+        """Return the number of threads to use when copying files from a USB mounted Garmin device."""
+        return self.get_node_value_default('settings', 'copy_workers', 2)
+
+    def download_workers(self):
+        """Return the number of threads to use when downloading data from Garmin Connect."""
+        return self.get_node_value_default('settings', 'download_workers', 4)
+
+    def export_workers(self):
+        """Return the number of threads to use when writing exported activity files."""
+        return self.get_node_value_default('settings', 'export_workers', 4)
+
+    def download_rate_limit(self):
+        """Return a tuple containing the average number of Garmin Connect requests allowed per second and the number of requests allowed in a burst."""
+        return (self.get_node_value_default('settings', 'download_rate', 2.0), self.get_node_value_default('settings', 'download_burst', 4))
+
+    def download_retries(self):
+        """Return a tuple containing the number of times to retry a failed Garmin Connect request and the delay in seconds before the first retry."""
+        return (self.get_node_value_default('settings', 'download_retries', 3), self.get_node_value_default('settings', 'download_backoff', 2.0))
+
+    def download_range_days(self):
+        """Return the number of days to request at once for stats that Garmin Connect returns for a range of days, like weight and resting heart rate."""
+        return self.get_node_value_default('settings', 'download_range_days', 30)
+
+    def download_activity_page_size(self):
+        """Return the number of activities to request per page when getting the list of activities."""
+        return self.get_node_value_default('settings', 'download_activity_page_size', 50)
+
     def get_secure_password(self):
         """Return the Garmin Connect password from secure storage. On MacOS that is the KeyChain."""
         system = platform.system()
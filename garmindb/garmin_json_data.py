@@ -10,10 +10,11 @@ import logging
 import dateutil.parser
 
 import fitfile
-from idbutils import JsonFileProcessor
 
 from .garmin_connect_enums import Event, get_summary_sport, get_details_sport
 from .garmindb import ActivitiesDb, Activities, StepsActivities, PaddleActivities, CycleActivities
+from .ledger_json_file_processor import LedgerJsonFileProcessor
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -21,9 +22,11 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
 
-class GarminJsonActivityData(JsonFileProcessor):
+class GarminJsonActivityData(LedgerJsonFileProcessor):
     """Base class for importing Garmin activity data from JSON formatted Garmin Connect details downloads."""
 
+    import_db = ActivitiesDb
+
     def __init__(self, db_params, file_regex, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminJsonDetailsData.
@@ -37,9 +40,9 @@ class GarminJsonActivityData(JsonFileProcessor):
         debug (Boolean): enable debug logging
 
         """
-        super().__init__(file_regex, input_dir=input_dir, latest=latest, debug=debug)
+        super().__init__(db_params, file_regex, input_dir=input_dir, latest=latest, debug=debug)
         self.measurement_system = measurement_system
-        self.garmin_act_db = ActivitiesDb(db_params, self.debug - 1)
+        self.garmin_act_db = DbRegistry.get(ActivitiesDb, db_params, self.debug - 1)
         self.conversions = {}
 
     def _process_common(self, json_data):
@@ -53,9 +56,11 @@ class GarminJsonActivityData(JsonFileProcessor):
         avg_temperature = self._get_field_obj(json_data, 'averageTemperature', fitfile.Temperature.from_celsius)
         start_time = dateutil.parser.parse(self._get_field(json_data, 'startTimeLocal'), ignoretz=True)
         elapsed_time = fitfile.conversions.secs_to_dt_time(self._get_field(json_data, 'elapsedDuration', int))
+        stop_time = start_time + fitfile.conversions.time_to_timedelta(elapsed_time) if elapsed_time is not None else None
+        self._mark_dirty(start_time, stop_time)
         return {
             'start_time'                : start_time,
-            'stop_time'                 : start_time + fitfile.conversions.time_to_timedelta(elapsed_time) if elapsed_time is not None else None,
+            'stop_time'                 : stop_time,
             'elapsed_time'              : elapsed_time,
             'moving_time'               : fitfile.conversions.secs_to_dt_time(self._get_field(json_data, 'movingDuration', int)),
             'start_lat'                 : self._get_field(json_data, 'startLatitude', float),
@@ -7,13 +7,20 @@ __license__ = "GPL"
 
 import sys
 import logging
+import datetime
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import traceback
+import collections
+
+from sqlalchemy import insert
 
 from idbutils import FileProcessor
-from .tcx import Tcx
+from fitfile import Distance, Speed, conversions
+from .tcx import Tcx, TcxReader
 
-from .garmindb import GarminDb, Device, File, ActivitiesDb, Activities, ActivityRecords, ActivityLaps
+from .garmindb import GarminDb, ImportLedger, DirtyRange, Device, File, ActivitiesDb, Activities, ActivityRecords, ActivityLaps
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -21,9 +28,20 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
 
+def _decode_tcx_file(file_name, measurement_system):
+    """Parse a TCX file and return a tuple of the file name, the database rows for the file, and the error and traceback if parsing failed."""
+    try:
+        return (file_name, GarminTcxData._file_rows(file_name, measurement_system), None, None)
+    except Exception as e:
+        return (file_name, None, str(e), traceback.format_exc())
+
+
 class GarminTcxData():
     """Class for importing Garmin activity data from TCX files."""
 
+    # the database the imported data is written to, used to invalidate import ledger entries when the database changes
+    import_db = ActivitiesDb
+
     def __init__(self, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminTcxData.
@@ -47,102 +65,165 @@ class GarminTcxData():
         """Return the number of files that will be propcessed."""
         return len(self.file_names)
 
-    def __process_record(self, tcx, activity_id, record_number, point):
-        root_logger.debug("Processing record: %r (%d)", point, record_number)
-        if not ActivityRecords.s_exists(self.garmin_act_db_session, {'activity_id' : activity_id, 'record' : record_number}):
-            record = {
-                'activity_id'                       : activity_id,
-                'record'                            : record_number,
-                'timestamp'                         : tcx.get_point_time(point),
-                'hr'                                : tcx.get_point_hr(point),
-                'altitude'                          : tcx.get_point_altitude(point).meters_or_feet(measurement_system=self.measurement_system),
-                'speed'                             : tcx.get_point_speed(point).kph_or_mph(measurement_system=self.measurement_system)
-            }
-            loc = tcx.get_point_loc(point)
-            if loc is not None:
-                record.update({'position_lat': loc.lat_deg, 'position_long': loc.long_deg})
-            self.garmin_act_db_session.add(ActivityRecords(**record))
-
-    def __process_lap(self, tcx, activity_id, lap_number, lap):
-        root_logger.info("Processing lap: %d", lap_number)
-        for record_number, point in enumerate(tcx.get_lap_points(lap)):
-            self.__process_record(tcx, activity_id, record_number, point)
-        if not ActivityLaps.s_exists(self.garmin_act_db_session, {'activity_id' : activity_id, 'lap' : lap_number}):
-            lap_data = {
-                'activity_id'                       : activity_id,
-                'lap'                               : lap_number,
-                'start_time'                        : tcx.get_lap_start(lap),
-                'stop_time'                         : tcx.get_lap_end(lap),
-                'elapsed_time'                      : tcx.get_lap_duration(lap),
-                'distance'                          : tcx.get_lap_distance(lap).meters_or_feet(measurement_system=self.measurement_system),
-                'calories'                          : tcx.get_lap_calories(lap)
-            }
-            start_loc = tcx.get_lap_start_loc(lap)
-            if start_loc is not None:
-                lap_data.update({'start_lat': start_loc.lat_deg, 'start_long': start_loc.long_deg})
-            end_loc = tcx.get_lap_end_loc(lap)
-            if end_loc is not None:
-                lap_data.update({'stop_lat': end_loc.lat_deg, 'stop_long': end_loc.long_deg})
-            root_logger.info("Inserting lap: %r (%d): %r", lap, lap_number, lap_data)
-            self.garmin_act_db_session.add(ActivityLaps(**lap_data))
-
-    def __process_file(self, file_name):
-        tcx = Tcx()
-        tcx.read(file_name)
-        start_time = tcx.start_time
-        (manufacturer, product) = tcx.get_manufacturer_and_product()
-        serial_number = tcx.serial_number
-        device = {
-            'serial_number'     : serial_number,
-            'timestamp'         : start_time,
-            'manufacturer'      : manufacturer,
-            'product'           : product,
-            'hardware_version'  : None,
+    @classmethod
+    def __record_row(cls, activity_id, record_number, point, measurement_system):
+        return {
+            'activity_id'                       : activity_id,
+            'record'                            : record_number,
+            'timestamp'                         : point['time'],
+            'hr'                                : point['hr'],
+            'altitude'                          : Distance.from_meters(point['altitude']).meters_or_feet(measurement_system=measurement_system),
+            'speed'                             : Speed.from_mps(point['speed']).kph_or_mph(measurement_system=measurement_system),
+            'position_lat'                      : point['location'].lat_deg,
+            'position_long'                     : point['location'].long_deg
         }
-        Device.s_insert_or_update(self.garmin_db_session, device, ignore_none=True)
-        root_logger.info("Processing file: %s for manufacturer %s product %s device %s", file_name, manufacturer, product, serial_number)
-        (file_id, file_name) = File.name_and_id_from_path(file_name)
-        file = {
-            'id'            : file_id,
-            'name'          : file_name,
-            'type'          : File.FileType.tcx,
-            'serial_number' : serial_number,
+
+    @classmethod
+    def __lap_row(cls, activity_id, lap_number, lap, measurement_system):
+        points = lap['points']
+        lap_row = {
+            'activity_id'                       : activity_id,
+            'lap'                               : lap_number,
+            'start_time'                        : points[0]['time'] if points else None,
+            'stop_time'                         : points[-1]['time'] if points else None,
+            'elapsed_time'                      : conversions.secs_to_dt_time(lap['duration']),
+            'distance'                          : Distance.from_meters(lap['distance']).meters_or_feet(measurement_system=measurement_system),
+            'calories'                          : lap['calories']
         }
-        File.s_insert_or_update(self.garmin_db_session, file)
+        if points:
+            lap_row.update({'start_lat': points[0]['location'].lat_deg, 'start_long': points[0]['location'].long_deg,
+                            'stop_lat': points[-1]['location'].lat_deg, 'stop_long': points[-1]['location'].long_deg})
+        return lap_row
+
+    @classmethod
+    def __ascent_and_descent(cls, points):
+        altitudes = [point['altitude'] for point in points if point['altitude'] is not None]
+        changes = [next_altitude - altitude for altitude, next_altitude in zip(altitudes, altitudes[1:])]
+        return (Distance.from_meters(sum(change for change in changes if change > 0)), Distance.from_meters(-sum(change for change in changes if change < 0)))
+
+    @classmethod
+    def __avg(cls, values):
+        if values:
+            return sum(values) / len(values)
+
+    @classmethod
+    def _file_rows(cls, file_name, measurement_system):
+        """Parse a TCX file and return a dict of the device, file, activity, lap, and record rows for it. The rows only hold values that can be pickled."""
+        tcx = TcxReader().read(file_name)
+        points = tcx.points
+        start_time = points[0]['time'] if points else None
+        end_time = points[-1]['time'] if points else None
+        serial_number = tcx.get_serial_number()
+        (file_id, name) = File.name_and_id_from_path(file_name)
+        hr_values = [point['hr'] for point in points if point['hr'] is not None]
+        cadence_values = [lap['cadence'] for lap in tcx.laps if lap['cadence'] is not None]
+        (ascent, descent) = cls.__ascent_and_descent(points)
         activity = {
             'activity_id'               : file_id,
             'name'                      : file_id,
             'start_time'                : start_time,
-            'stop_time'                 : tcx.end_time,
-            'laps'                      : tcx.lap_count,
+            'stop_time'                 : end_time,
+            'laps'                      : len(tcx.laps),
             'sport'                     : tcx.sport,
-            'calories'                  : tcx.calories,
-            'distance'                  : tcx.distance.kms_or_miles(self.measurement_system),
-            'avg_hr'                    : tcx.hr_avg,
-            'max_hr'                    : tcx.hr_max,
-            'max_cadence'               : tcx.cadence_max,
-            'avg_cadence'               : tcx.cadence_avg,
-            'ascent'                    : tcx.ascent.meters_or_feet(self.measurement_system),
-            'descent'                   : tcx.descent.meters_or_feet(self.measurement_system)
+            'calories'                  : sum(lap['calories'] for lap in tcx.laps),
+            'distance'                  : Distance.from_meters(sum(lap['distance'] for lap in tcx.laps)).kms_or_miles(measurement_system),
+            'avg_hr'                    : cls.__avg(hr_values),
+            'max_hr'                    : max(hr_values, default=None),
+            'max_cadence'               : max(cadence_values, default=None),
+            'avg_cadence'               : cls.__avg(cadence_values),
+            'ascent'                    : ascent.meters_or_feet(measurement_system),
+            'descent'                   : descent.meters_or_feet(measurement_system)
         }
-        start_loc = tcx.start_loc
-        if start_loc is not None:
-            activity.update({'start_lat': start_loc.lat_deg, 'start_long': start_loc.long_deg})
-        end_loc = tcx.end_loc
-        if end_loc is not None:
-            activity.update({'stop_lat': end_loc.lat_deg, 'stop_long': end_loc.long_deg})
-        Activities.s_insert_or_update(self.garmin_act_db_session, activity, ignore_none=True, ignore_zero=True)
-        for lap_number, lap in enumerate(tcx.laps):
-            self.__process_lap(tcx, file_id, lap_number, lap)
-
-    def process_files(self, db_params):
-        """Import data from TCX files into the database."""
-        garmin_db = GarminDb(db_params, self.debug - 1)
-        garmin_act_db = ActivitiesDb(db_params, self.debug - 1)
-        with garmin_db.managed_session() as self.garmin_db_session, garmin_act_db.managed_session() as self.garmin_act_db_session:
-            for file_name in tqdm(self.file_names, unit='files'):
+        if points:
+            activity.update({'start_lat': points[0]['location'].lat_deg, 'start_long': points[0]['location'].long_deg,
+                             'stop_lat': points[-1]['location'].lat_deg, 'stop_long': points[-1]['location'].long_deg})
+        days = []
+        if start_time is not None:
+            end_time = max(start_time, end_time)
+            days = [start_time.date() + datetime.timedelta(days=day) for day in range((end_time.date() - start_time.date()).days + 1)]
+        return {
+            'device'    : {
+                'serial_number'     : serial_number,
+                'timestamp'         : start_time,
+                'product'           : tcx.product,
+                'hardware_version'  : None,
+            },
+            'file'      : {
+                'id'            : file_id,
+                'name'          : name,
+                'serial_number' : serial_number,
+            },
+            'activity'  : activity,
+            'laps'      : [cls.__lap_row(file_id, lap_number, lap, measurement_system) for lap_number, lap in enumerate(tcx.laps)],
+            # records are numbered across all of the laps of the activity
+            'records'   : [cls.__record_row(file_id, record_number, point, measurement_system) for record_number, point in enumerate(points)],
+            'days'      : days
+        }
+
+    def __decode_files(self, workers):
+        if workers > 1 and len(self.file_names) > 1:
+            # Parsing is CPU bound and runs in the pool. Results are returned in file name order so that the single writer stays deterministic.
+            # Only a few files are submitted ahead of the writer to limit the number of decoded files held in memory.
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = collections.deque()
+                for file_name in self.file_names:
+                    pending.append(executor.submit(_decode_tcx_file, file_name, self.measurement_system))
+                    if len(pending) >= workers * 2:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        else:
+            for file_name in self.file_names:
+                yield _decode_tcx_file(file_name, self.measurement_system)
+
+    @classmethod
+    def __insert_new(cls, session, table, rows, existing, key):
+        new_rows = [row for row in rows if row[key] not in existing]
+        if new_rows:
+            root_logger.debug("Bulk inserting %d %s rows", len(new_rows), table.__tablename__)
+            session.execute(insert(table), new_rows)
+
+    def __write_file(self, garmin_db, garmin_act_db, rows):
+        (manufacturer, _) = Tcx._manufacturer_and_product(rows['device']['product'])
+        with garmin_db.managed_session() as garmin_db_session:
+            Device.s_insert_or_update(garmin_db_session, dict(rows['device'], manufacturer=manufacturer), ignore_none=True)
+            File.s_insert_or_update(garmin_db_session, dict(rows['file'], type=File.FileType.tcx))
+        activity_id = rows['activity']['activity_id']
+        with garmin_act_db.managed_session() as garmin_act_db_session:
+            Activities.s_insert_or_update(garmin_act_db_session, rows['activity'], ignore_none=True, ignore_zero=True)
+            self.__insert_new(garmin_act_db_session, ActivityLaps, rows['laps'], ActivityLaps.s_get_activity_lap_numbers(garmin_act_db_session, activity_id), 'lap')
+            self.__insert_new(garmin_act_db_session, ActivityRecords, rows['records'],
+                              ActivityRecords.s_get_activity_record_numbers(garmin_act_db_session, activity_id), 'record')
+            if self.record_arrays is not None:
+                self.record_arrays.s_write(garmin_act_db_session, activity_id)
+
+    def process_files(self, db_params, workers=1, record_arrays=None):
+        """
+        Import data from TCX files into the database. Files are parsed by a pool of worker processes and written to the database by this process.
+
+        If record_arrays, an ActivityRecordArrays instance, is given the records of each activity are also written as arrays.
+        """
+        self.record_arrays = record_arrays
+        garmin_db = DbRegistry.get(GarminDb, db_params, self.debug - 1)
+        garmin_act_db = DbRegistry.get(ActivitiesDb, db_params, self.debug - 1)
+        importer = self.__class__.__name__
+        self.file_names = ImportLedger.changed_files(garmin_db, self.file_names, importer, self.import_db)
+        imported_file_names = []
+        dirty_days = set()
+        try:
+            for file_name, rows, error, error_traceback in tqdm(self.__decode_files(workers), total=len(self.file_names), unit='files'):
+                if rows is None:
+                    logger.error('Failed to processes TCX file %s: %s', file_name, error)
+                    root_logger.error('Failed to processes TCX file %s: %s', file_name, error_traceback)
+                    continue
                 try:
-                    self.__process_file(file_name)
+                    root_logger.info("Processing file: %s for device %s", file_name, rows['device'])
+                    self.__write_file(garmin_db, garmin_act_db, rows)
+                    dirty_days.update(rows['days'])
+                    imported_file_names.append(file_name)
                 except Exception as e:
                     logger.error('Failed to processes TCX file %s: %s', file_name, e)
                     root_logger.error('Failed to processes TCX file %s: %s', file_name, traceback.format_exc())
+        finally:
+            ImportLedger.record(garmin_db, imported_file_names, importer, self.import_db)
+            DirtyRange.add_days(garmin_db, dirty_days, importer)
@@ -6,7 +6,7 @@ __license__ = "GPL"
 
 # flake8: noqa
 
-from .garmin_db import GarminDb, Attributes, Device, DeviceInfo, File, Weight, Stress, Sleep, SleepEvents, RestingHeartRate, DailySummary, Hrv
+from .garmin_db import GarminDb, Attributes, Device, DeviceInfo, File, ImportLedger, DirtyRange, DownloadJob, DataCoverage, Weight, Stress, Sleep, SleepEvents, RestingHeartRate, DailySummary, Hrv
 from .monitoring_db import MonitoringDb, MonitoringInfo, MonitoringHeartRate, MonitoringIntensity, MonitoringClimb, Monitoring, \
     MonitoringRespirationRate, MonitoringPulseOx, MonitoringHrvValue, MonitoringHrvStatus
 from .activities_db import ActivitiesDb, Activities, ActivityLaps, ActivityRecords, ActivitiesDevices, ActivitySplits, SportActivities, StepsActivities, \
@@ -6,7 +6,7 @@ __license__ = "GPL"
 
 import logging
 import datetime
-from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, Time, Enum, ForeignKey, PrimaryKeyConstraint, desc, literal_column
+from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, Time, Enum, ForeignKey, PrimaryKeyConstraint, Index, desc, literal_column
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -14,6 +14,9 @@ from sqlalchemy.ext.hybrid import hybrid_property
 import fitfile
 import idbutils
 
+from .stats_by_day import StatsByDay
+from .indexed_db_object import IndexedDbObject
+
 
 logger = logging.getLogger(__name__)
 
@@ -92,7 +95,7 @@ class ActivitiesCommon(idbutils.DbObject):
         self.stop_long = stop_location.long_deg
 
 
-class Activities(ActivitiesDb.Base, ActivitiesCommon):
+class Activities(ActivitiesDb.Base, IndexedDbObject, ActivitiesCommon):
     """Class represents a database table that contains data about recorded activities."""
 
     __tablename__ = 'activities'
@@ -119,6 +122,12 @@ class Activities(ActivitiesDb.Base, ActivitiesCommon):
     training_effect = Column(Float)
     anaerobic_training_effect = Column(Float)
 
+    __table_args__ = (
+        Index('ix_activities_sport_start_time', 'sport', 'start_time'),
+        # most activities aren't on a course, so only index the ones that are
+        Index('ix_activities_course_id_start_time', 'course_id', 'start_time', sqlite_where=course_id.isnot(None), postgresql_where=course_id.isnot(None)),
+    )
+
     def is_steps_activity(self):
         """Return if the activity is a steps based activity."""
         return self.sport in ['walking', 'running', 'hiking']
@@ -181,6 +190,17 @@ class Activities(ActivitiesDb.Base, ActivitiesCommon):
         }
         return stats
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dicts of stats for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .row_count('activities')
+            .col_sum('activities_calories', cls.calories)
+            .col_sum('activities_distance', cls.distance)
+            .s_get(session, days)
+        )
+
 
 class ActivityLaps(ActivitiesDb.Base, ActivitiesCommon):
     """Class that holds data for an activity lap."""
@@ -213,6 +233,11 @@ class ActivityLaps(ActivitiesDb.Base, ActivitiesCommon):
         """Return all laps for a given activity_id."""
         return session.query(cls).filter(cls.activity_id == activity_id).all()
 
+    @classmethod
+    def s_get_activity_lap_numbers(cls, session, activity_id):
+        """Return the set of lap numbers already stored for a given activity_id."""
+        return {row[0] for row in session.query(cls.lap).filter(cls.activity_id == activity_id).all()}
+
     @classmethod
     def get_activity(cls, db, activity_id):
         """Return all laps for a given activity_id."""
@@ -264,6 +289,11 @@ class ActivitySplits(ActivitiesDb.Base, ActivitiesCommon):
         """Return all splits for a given activity_id."""
         return session.query(cls).filter(cls.activity_id == activity_id).all()
 
+    @classmethod
+    def s_get_activity_split_numbers(cls, session, activity_id):
+        """Return the set of split numbers already stored for a given activity_id."""
+        return {row[0] for row in session.query(cls.split).filter(cls.activity_id == activity_id).all()}
+
     @classmethod
     def get_activity(cls, db, activity_id):
         """Return all splits for a given activity_id."""
@@ -271,7 +301,7 @@ class ActivitySplits(ActivitiesDb.Base, ActivitiesCommon):
             return cls.s_get_activity(session, activity_id)
 
 
-class ActivityRecords(ActivitiesDb.Base, idbutils.DbObject):
+class ActivityRecords(ActivitiesDb.Base, IndexedDbObject):
     """Encapsilates record for a single point in time from an activity."""
 
     __tablename__ = 'activity_records'
@@ -293,13 +323,22 @@ class ActivityRecords(ActivitiesDb.Base, idbutils.DbObject):
     speed = Column(Float)           # kmph or mph
     temperature = Column(Float)     # C or F
 
-    __table_args__ = (PrimaryKeyConstraint("activity_id", "record"),)
+    __table_args__ = (
+        PrimaryKeyConstraint("activity_id", "record"),
+        # records are read back in time order per activity and matched to laps by timestamp range
+        Index('ix_activity_records_activity_id_timestamp', 'activity_id', 'timestamp'),
+    )
 
     @classmethod
     def s_get_activity(cls, session, activity_id):
         """Return all records for a given activity_id."""
         return session.query(cls).filter(cls.activity_id == activity_id).all()
 
+    @classmethod
+    def s_get_activity_record_numbers(cls, session, activity_id):
+        """Return the set of record numbers already stored for a given activity_id."""
+        return {row[0] for row in session.query(cls.record).filter(cls.activity_id == activity_id).all()}
+
     @classmethod
     def get_activity(cls, db, activity_id):
         """Return all records for a given activity_id."""
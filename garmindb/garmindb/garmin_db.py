@@ -8,12 +8,16 @@ import os
 import datetime
 import logging
 import re
-from sqlalchemy import Column, Integer, DateTime, Time, Float, String, Enum, ForeignKey, func, PrimaryKeyConstraint
+import hashlib
+from sqlalchemy import Column, Integer, DateTime, Time, Float, String, Enum, ForeignKey, func, PrimaryKeyConstraint, Index
 from sqlalchemy.ext.hybrid import hybrid_property
 
 import fitfile
 import idbutils
 
+from .stats_by_day import StatsByDay
+from .indexed_db_object import IndexedDbObject
+
 
 logger = logging.getLogger(__name__)
 
@@ -179,6 +183,360 @@ class File(GarminDb.Base, idbutils.DbObject):
         return id
 
 
+class ImportLedger(GarminDb.Base, idbutils.DbObject):
+    """Class that records which source files have been imported so that unchanged files are not parsed again."""
+
+    __tablename__ = 'import_ledger'
+
+    db = GarminDb
+    table_version = 1
+
+    path = Column(String, nullable=False)
+    importer = Column(String, nullable=False)
+    size = Column(Integer)
+    mtime = Column(Float)
+    hash = Column(String)
+    # the database the importer writes to and the version of that database when the file was imported
+    db_name = Column(String)
+    schema_version = Column(Integer)
+    timestamp = Column(DateTime)
+
+    __table_args__ = (PrimaryKeyConstraint("path", "importer"),)
+
+    @classmethod
+    def file_hash(cls, pathname):
+        """Return a hash of the contents of a file."""
+        file_hash = hashlib.sha256()
+        with open(pathname, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    @classmethod
+    def s_get_importer(cls, session, importer):
+        """Return a dict of ledger entries keyed by path for the given importer."""
+        return {entry.path: entry for entry in session.query(cls).filter(cls.importer == importer).all()}
+
+    @classmethod
+    def __entry_matches(cls, entry, path, stat, import_db):
+        if entry is None or entry.db_name != import_db.db_name or entry.schema_version != import_db.db_version:
+            return False
+        if entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return True
+        # The file was touched, only reparse it if the contents changed.
+        if entry.size == stat.st_size and entry.hash == cls.file_hash(path):
+            entry.mtime = stat.st_mtime
+            return True
+        return False
+
+    @classmethod
+    def s_changed_files(cls, session, pathnames, importer, import_db):
+        """Return the pathnames that are new or have changed since they were last imported by importer into import_db."""
+        entries = cls.s_get_importer(session, importer)
+        changed = []
+        for pathname in pathnames:
+            path = os.path.abspath(pathname)
+            if not cls.__entry_matches(entries.get(path), path, os.stat(path), import_db):
+                changed.append(pathname)
+        logger.info("%s: %d of %d files are new or changed", importer, len(changed), len(pathnames))
+        return changed
+
+    @classmethod
+    def changed_files(cls, db, pathnames, importer, import_db):
+        """Return the pathnames that are new or have changed since they were last imported by importer into import_db."""
+        with db.managed_session() as session:
+            return cls.s_changed_files(session, pathnames, importer, import_db)
+
+    @classmethod
+    def s_record(cls, session, pathnames, importer, import_db):
+        """Record that the files have been imported by importer into import_db."""
+        now = datetime.datetime.now()
+        for pathname in pathnames:
+            path = os.path.abspath(pathname)
+            stat = os.stat(path)
+            entry = {
+                'path'              : path,
+                'importer'          : importer,
+                'size'              : stat.st_size,
+                'mtime'             : stat.st_mtime,
+                'hash'              : cls.file_hash(path),
+                'db_name'           : import_db.db_name,
+                'schema_version'    : import_db.db_version,
+                'timestamp'         : now
+            }
+            session.merge(cls(**entry))
+
+    @classmethod
+    def record(cls, db, pathnames, importer, import_db):
+        """Record that the files have been imported by importer into import_db."""
+        with db.managed_session() as session:
+            cls.s_record(session, pathnames, importer, import_db)
+
+    @classmethod
+    def delete_for_dbs(cls, db, db_names):
+        """Remove the ledger entries for files imported into the named databases so that they will be imported again."""
+        with db.managed_session() as session:
+            session.query(cls).filter(cls.db_name.in_(db_names)).delete(synchronize_session=False)
+
+
+class DirtyRange(GarminDb.Base, idbutils.DbObject):
+    """Class that records the ranges of days that importers changed so that only those days have to be summarized again."""
+
+    __tablename__ = 'dirty_ranges'
+
+    db = GarminDb
+    table_version = 1
+
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    importer = Column(String, nullable=False)
+    timestamp = Column(DateTime)
+
+    __table_args__ = (PrimaryKeyConstraint("start", "end", "importer"),)
+
+    @classmethod
+    def __day(cls, day):
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        return datetime.datetime.combine(day, datetime.time.min)
+
+    @classmethod
+    def s_add(cls, session, start, end, importer):
+        """Record that importer changed data for the days from start to end inclusive."""
+        start_day = cls.__day(start)
+        end_day = cls.__day(end) if end is not None else start_day
+        entry = {
+            'start'     : min(start_day, end_day),
+            'end'       : max(start_day, end_day),
+            'importer'  : importer,
+            'timestamp' : datetime.datetime.now()
+        }
+        session.merge(cls(**entry))
+
+    @classmethod
+    def add(cls, db, start, end, importer):
+        """Record that importer changed data for the days from start to end inclusive."""
+        with db.managed_session() as session:
+            cls.s_add(session, start, end, importer)
+
+    @classmethod
+    def add_days(cls, db, days, importer):
+        """Record that importer changed data for the given days. Consecutive days are recorded as a single range."""
+        with db.managed_session() as session:
+            start = end = None
+            for day in sorted({cls.__day(day) for day in days}):
+                if end is not None and day - end > datetime.timedelta(days=1):
+                    cls.s_add(session, start, end, importer)
+                    start = None
+                if start is None:
+                    start = day
+                end = day
+            if start is not None:
+                cls.s_add(session, start, end, importer)
+
+    @classmethod
+    def s_get_days(cls, session):
+        """Return a sorted list of the dates covered by all recorded ranges."""
+        days = set()
+        for dirty_range in session.query(cls).all():
+            day = dirty_range.start.date()
+            while day <= dirty_range.end.date():
+                days.add(day)
+                day += datetime.timedelta(days=1)
+        return sorted(days)
+
+    @classmethod
+    def get_days(cls, db):
+        """Return a sorted list of the dates covered by all recorded ranges."""
+        with db.managed_session() as session:
+            return cls.s_get_days(session)
+
+    @classmethod
+    def clear(cls, db, before):
+        """Remove the ranges that were recorded before the given time."""
+        with db.managed_session() as session:
+            session.query(cls).filter(cls.timestamp < before).delete(synchronize_session=False)
+
+
+class DownloadJob(GarminDb.Base, idbutils.DbObject):
+    """Class that records downloads from Garmin Connect, one per stat and day or activity, so that interrupted downloads resume and failed ones are retried."""
+
+    __tablename__ = 'download_jobs'
+
+    db = GarminDb
+    table_version = 1
+
+    pending = 'pending'
+    failed = 'failed'
+    done = 'done'
+
+    # failed jobs are retried after a delay that doubles with every attempt
+    retry_delay = datetime.timedelta(minutes=1)
+    max_retry_delay = datetime.timedelta(days=1)
+    # jobs that have failed this many times are only retried after a cool down, unless they are redone
+    max_attempts = 10
+    exhausted_retry_delay = datetime.timedelta(days=7)
+
+    stat = Column(String, nullable=False)
+    # the day, as YYYY-MM-DD, or the activity id that the job downloads
+    item = Column(String, nullable=False)
+    status = Column(String, nullable=False, default=pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String)
+    next_retry = Column(DateTime)
+    # JSON encoded data needed to run the job or, for jobs that save files with names that aren't known in advance, the files it saved
+    data = Column(String)
+    timestamp = Column(DateTime)
+
+    __table_args__ = (PrimaryKeyConstraint("stat", "item"),)
+
+    @classmethod
+    def s_get_stat(cls, session, stat):
+        """Return a dict of jobs keyed by item for the given stat."""
+        return {job.item: job for job in session.query(cls).filter(cls.stat == stat).all()}
+
+    @classmethod
+    def queue(cls, db, stat, items, redo=(), data=None, missing=None, done=()):
+        """
+        Add jobs for the items that don't have one. Jobs for items in redo are run again, with their attempts reset, even if they are done or failed.
+
+        Done jobs are also run again if missing returns True for them. Jobs that are added for items in done, that were downloaded before jobs were recorded, start as done.
+        """
+        redo = set(redo)
+        done = set(done)
+        data = data or {}
+        now = datetime.datetime.now()
+        with db.managed_session() as session:
+            jobs = cls.s_get_stat(session, stat)
+            for item in items:
+                job = jobs.get(item)
+                if job is None:
+                    session.add(cls(stat=stat, item=item, status=cls.done if item in done else cls.pending, attempts=0, data=data.get(item), timestamp=now))
+                elif (item in redo and job.status != cls.pending) or (job.status == cls.done and missing is not None and missing(job)):
+                    job.status = cls.pending
+                    job.attempts = 0
+                    job.next_retry = None
+                    job.data = data.get(item, job.data)
+                    job.timestamp = now
+
+    @classmethod
+    def due(cls, db, stat):
+        """Return the jobs for stat that are not done and not waiting to be retried, ordered by item."""
+        with db.managed_session() as session:
+            return (
+                session.query(cls)
+                .filter(cls.stat == stat, cls.status != cls.done)
+                .filter((cls.next_retry == None) | (cls.next_retry <= datetime.datetime.now()))  # noqa
+                .order_by(cls.item)
+                .all()
+            )
+
+    @classmethod
+    def record(cls, db, stat, items, error=None, data=None):
+        """Record the result of running the jobs for the items. If error is given the jobs failed and are scheduled to be retried. JSON encoded data is saved with the jobs if given."""
+        now = datetime.datetime.now()
+        with db.managed_session() as session:
+            for job in session.query(cls).filter(cls.stat == stat, cls.item.in_(items)).all():
+                job.attempts += 1
+                job.timestamp = now
+                if error is None:
+                    job.status = cls.done
+                    job.last_error = None
+                    job.next_retry = None
+                    if data is not None:
+                        job.data = data
+                else:
+                    job.status = cls.failed
+                    job.last_error = str(error)
+                    if job.attempts >= cls.max_attempts:
+                        job.next_retry = now + cls.exhausted_retry_delay
+                    else:
+                        job.next_retry = now + min(cls.retry_delay * (2 ** min(job.attempts - 1, 16)), cls.max_retry_delay)
+
+    @classmethod
+    def exhausted(cls, db, stat):
+        """Return the failed jobs for stat that have used up their attempts, ordered by item."""
+        with db.managed_session() as session:
+            return (
+                session.query(cls)
+                .filter(cls.stat == stat, cls.status == cls.failed, cls.attempts >= cls.max_attempts)
+                .order_by(cls.item)
+                .all()
+            )
+
+
+class DataCoverage(GarminDb.Base, idbutils.DbObject):
+    """Class that records which days have data for each stat and which importer the data came from, so that missing days can be found quickly."""
+
+    __tablename__ = 'data_coverage'
+
+    db = GarminDb
+    table_version = 1
+
+    stat = Column(String, nullable=False)
+    day = Column(DateTime, nullable=False)
+    source = Column(String)
+    timestamp = Column(DateTime)
+
+    __table_args__ = (PrimaryKeyConstraint("stat", "day"),)
+
+    @classmethod
+    def __day(cls, day):
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        return datetime.datetime.combine(day, datetime.time.min)
+
+    @classmethod
+    def s_add_days(cls, session, stat, days, source):
+        """Record that stat has data for the given days."""
+        now = datetime.datetime.now()
+        for day in {cls.__day(day) for day in days}:
+            session.merge(cls(stat=stat, day=day, source=source, timestamp=now))
+
+    @classmethod
+    def add_days(cls, db, stat, days, source):
+        """Record that stat has data for the given days."""
+        with db.managed_session() as session:
+            cls.s_add_days(session, stat, days, source)
+
+    @classmethod
+    def has_stat(cls, db, stat):
+        """Return True if any days have been recorded for stat."""
+        with db.managed_session() as session:
+            return session.query(cls.day).filter(cls.stat == stat).first() is not None
+
+    @classmethod
+    def seed(cls, db, stat, data_db, table, not_none_col):
+        """Record the days that already have data in table, for databases that were populated before coverage was recorded."""
+        with data_db.managed_session() as session:
+            day_col = func.date(table.time_col)
+            days = [StatsByDay._to_day(row[0]) for row in session.query(day_col).filter(not_none_col != None).distinct().all()]  # noqa
+        logger.info("Seeding %s coverage with %d days from %s", stat, len(days), table.__tablename__)
+        cls.add_days(db, stat, days, table.__tablename__)
+
+    @classmethod
+    def missing_ranges(cls, db, stat, start, end):
+        """
+        Return a list of (date, days) tuples for the ranges of days from start up to, but not including, end that have no data for stat.
+
+        Days that stat was downloaded for are covered even if they had no data, so that days without data for sparse stats, like weight, aren't requested again.
+        """
+        with db.managed_session() as session:
+            covered = {row.day.date() for row in session.query(cls.day).filter(cls.stat == stat, cls.day >= cls.__day(start), cls.day < cls.__day(end))}
+            downloaded = (
+                session.query(DownloadJob.item)
+                .filter(DownloadJob.stat == stat, DownloadJob.status == DownloadJob.done, DownloadJob.item >= start.isoformat(), DownloadJob.item < end.isoformat())
+            )
+            covered.update(datetime.date.fromisoformat(row.item) for row in downloaded)
+        ranges = []
+        next_day = start
+        for day in sorted(covered) + [end]:
+            if day > next_day:
+                ranges.append((next_day, (day - next_day).days))
+            next_day = day + datetime.timedelta(days=1)
+        return ranges
+
+
 class Weight(GarminDb.Base, idbutils.DbObject):
     """Class representing a weight entry."""
 
@@ -195,12 +553,25 @@ class Weight(GarminDb.Base, idbutils.DbObject):
         """Return a dictionary of aggregate statistics for the given time period."""
         return {
             'weight_avg': cls.s_get_col_avg(session, cls.weight, start_ts, end_ts, True),
+            'weight_count': cls._s_get_col_func_query(session, cls.weight, func.count, start_ts, end_ts, True).scalar(),
             'weight_min': cls.s_get_col_min(session, cls.weight, start_ts, end_ts, True),
             'weight_max': cls.s_get_col_max(session, cls.weight, start_ts, end_ts)
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .col_avg('weight_avg', cls.weight, True)
+            .col_count('weight_count', cls.weight, True)
+            .col_min('weight_min', cls.weight, True)
+            .col_max('weight_max', cls.weight)
+            .s_get(session, days)
+        )
 
-class Stress(GarminDb.Base, idbutils.DbObject):
+
+class Stress(GarminDb.Base, IndexedDbObject):
     """Class representing a stress reading."""
 
     __tablename__ = 'stress'
@@ -211,13 +582,22 @@ class Stress(GarminDb.Base, idbutils.DbObject):
     timestamp = Column(DateTime, primary_key=True, unique=True)
     stress = Column(Integer, nullable=False)
 
+    # covers the stats queries, which skip readings <= 0
+    __table_args__ = (Index('ix_stress_timestamp_stress', 'timestamp', 'stress', sqlite_where=stress > 0, postgresql_where=stress > 0),)
+
     @classmethod
     def get_stats(cls, session, start_ts, end_ts):
         """Return a dictionary of aggregate statistics for the given time period."""
         return {
             'stress_avg': cls.s_get_col_avg(session, cls.stress, start_ts, end_ts, True),
+            'stress_count': cls._s_get_col_func_query(session, cls.stress, func.count, start_ts, end_ts, True).scalar(),
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        return StatsByDay(cls).col_avg('stress_avg', cls.stress, True).col_count('stress_count', cls.stress, True).s_get(session, days)
+
 
 class Sleep(GarminDb.Base, idbutils.DbObject):
     """Class representing a sleep session."""
@@ -253,8 +633,22 @@ class Sleep(GarminDb.Base, idbutils.DbObject):
             'rem_sleep_max' : cls.s_get_time_col_max(session, cls.rem_sleep, start_ts, end_ts),
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .time_col_avg('sleep_avg', cls.total_sleep)
+            .time_col_min('sleep_min', cls.total_sleep)
+            .time_col_max('sleep_max', cls.total_sleep)
+            .time_col_avg('rem_sleep_avg', cls.rem_sleep)
+            .time_col_min('rem_sleep_min', cls.rem_sleep)
+            .time_col_max('rem_sleep_max', cls.rem_sleep)
+            .s_get(session, days)
+        )
+
 
-class SleepEvents(GarminDb.Base, idbutils.DbObject):
+class SleepEvents(GarminDb.Base, IndexedDbObject):
     """Table that stores events recorded during sleep."""
 
     __tablename__ = 'sleep_events'
@@ -266,6 +660,8 @@ class SleepEvents(GarminDb.Base, idbutils.DbObject):
     event = Column(String)
     duration = Column(Time, nullable=False, default=datetime.time.min)
 
+    __table_args__ = (Index('ix_sleep_events_event_timestamp', 'event', 'timestamp', 'duration'),)
+
     @classmethod
     def get_wake_time(cls, db, day_date):
         """Return the wake time for a given date."""
@@ -282,7 +678,10 @@ class SleepEvents(GarminDb.Base, idbutils.DbObject):
         day_stop_ts = datetime.datetime.combine(day_date, datetime.time.max)
         result = cls._s_query(session, cls._time_from_secs(func.sum(cls._secs_from_time(cls.duration))), None, day_start_ts, day_stop_ts,
                               cls._secs_from_time(cls.duration)).filter(cls.event == sleep_level).scalar()
-        return datetime.datetime.strptime(result, '%H:%M:%S').time() if result is not None else datetime.time.min
+        if result is None:
+            return datetime.time.min
+        # the result is converted to a time by the column type on some databases and returned as a string on others
+        return result if isinstance(result, datetime.time) else datetime.datetime.strptime(result, '%H:%M:%S').time()
 
     @classmethod
     def get_day_stats(cls, session, day_date):
@@ -303,7 +702,7 @@ class SleepEvents(GarminDb.Base, idbutils.DbObject):
         }
 
 
-class RestingHeartRate(GarminDb.Base, idbutils.DbObject):
+class RestingHeartRate(GarminDb.Base, IndexedDbObject):
     """Class representing a daily resting heart rate reading."""
 
     __tablename__ = 'resting_hr'
@@ -315,15 +714,33 @@ class RestingHeartRate(GarminDb.Base, idbutils.DbObject):
     day = Column(DateTime, primary_key=True)
     resting_heart_rate = Column(Float)
 
+    # covers the stats queries, which skip readings <= 0
+    __table_args__ = (
+        Index('ix_resting_hr_day_resting_heart_rate', 'day', 'resting_heart_rate', sqlite_where=resting_heart_rate > 0, postgresql_where=resting_heart_rate > 0),
+    )
+
     @classmethod
     def get_stats(cls, session, start_ts, end_ts):
         """Return a dictionary of aggregate statistics for the given time period."""
         return {
             'rhr_avg': cls.s_get_col_avg(session, cls.resting_heart_rate, start_ts, end_ts, ignore_le_zero=True),
+            'rhr_count': cls._s_get_col_func_query(session, cls.resting_heart_rate, func.count, start_ts, end_ts, ignore_le_zero=True).scalar(),
             'rhr_min': cls.s_get_col_min(session, cls.resting_heart_rate, start_ts, end_ts, ignore_le_zero=True),
             'rhr_max': cls.s_get_col_max(session, cls.resting_heart_rate, start_ts, end_ts),
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .col_avg('rhr_avg', cls.resting_heart_rate, ignore_le_zero=True)
+            .col_count('rhr_count', cls.resting_heart_rate, ignore_le_zero=True)
+            .col_min('rhr_min', cls.resting_heart_rate, ignore_le_zero=True)
+            .col_max('rhr_max', cls.resting_heart_rate)
+            .s_get(session, days)
+        )
+
 
 class Hrv(GarminDb.Base, idbutils.DbObject):
     """Class representing daily Heart Rate Variability (HRV) data."""
@@ -449,9 +866,11 @@ class DailySummary(GarminDb.Base, idbutils.DbObject):
         """Return a dictionary of aggregate statistics for the given time period."""
         return {
             'rhr_avg'                   : cls.s_get_col_avg(session, cls.rhr, start_ts, end_ts),
+            'rhr_count'                 : cls._s_get_col_func_query(session, cls.rhr, func.count, start_ts, end_ts).scalar(),
             'rhr_min'                   : cls.s_get_col_min(session, cls.rhr, start_ts, end_ts),
             'rhr_max'                   : cls.s_get_col_max(session, cls.rhr, start_ts, end_ts),
             'stress_avg'                : cls.s_get_col_avg(session, cls.stress_avg, start_ts, end_ts),
+            'stress_count'              : cls._s_get_col_func_query(session, cls.stress_avg, func.count, start_ts, end_ts).scalar(),
             'steps'                     : cls.s_get_col_sum(session, cls.steps, start_ts, end_ts),
             'steps_goal'                : cls.s_get_col_sum(session, cls.step_goal, start_ts, end_ts),
             'floors'                    : cls.s_get_col_sum(session, cls.floors_up, start_ts, end_ts),
@@ -488,6 +907,49 @@ class DailySummary(GarminDb.Base, idbutils.DbObject):
         stats['day'] = day_ts
         return stats
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        stats_by_day = (
+            StatsByDay(cls)
+            .col_avg('rhr_avg', cls.rhr)
+            .col_count('rhr_count', cls.rhr)
+            .col_min('rhr_min', cls.rhr)
+            .col_max('rhr_max', cls.rhr)
+            .col_avg('stress_avg', cls.stress_avg)
+            .col_count('stress_count', cls.stress_avg)
+            .col_sum('steps', cls.steps)
+            .col_sum('steps_goal', cls.step_goal)
+            .col_sum('floors', cls.floors_up)
+            .col_sum('floors_goal', cls.floors_goal)
+            .time_col_avg('intensity_time', cls.intensity_time)
+            .time_col_avg('moderate_activity_time', cls.moderate_activity_time)
+            .time_col_sum('vigorous_activity_time', cls.vigorous_activity_time)
+            .time_col_avg('intensity_time_goal', cls.intensity_time_goal)
+            .col_sum('calories_goal', cls.calories_goal)
+            .col_avg('calories_avg', cls.calories_total)
+            .col_avg('calories_bmr_avg', cls.calories_bmr)
+            .col_avg('calories_active_avg', cls.calories_active)
+            .col_avg('calories_consumed_avg', cls.calories_consumed)
+            .col_sum('hydration_goal', cls.hydration_goal)
+            .col_avg('hydration_avg', cls.hydration_intake)
+            .col_sum('hydration_intake', cls.hydration_intake)
+            .col_avg('sweat_loss_avg', cls.sweat_loss)
+            .col_sum('sweat_loss', cls.sweat_loss)
+            .col_avg('spo2_avg', cls.spo2_avg)
+            .col_min('spo2_min', cls.spo2_min)
+            .col_avg('rr_waking_avg', cls.rr_waking_avg)
+            .col_max('rr_max', cls.rr_max)
+            .col_min('rr_min', cls.rr_min)
+            .col_avg('bb_max', cls.bb_max)
+            .col_avg('bb_min', cls.bb_min)
+            .s_get(session, days)
+        )
+        for stats in stats_by_day.values():
+            # intensity_time_goal is a weekly goal, so the daily value is 1/7 of the weekly goal
+            stats['intensity_time_goal'] = cls._time_from_secs(cls._secs_from_time(stats['intensity_time_goal']) / 7)
+        return stats_by_day
+
     @classmethod
     def get_monthly_stats(cls, session, first_day_ts, last_day_ts):
         """Return a dictionary of aggregate statistics for the given month."""
@@ -6,11 +6,12 @@ __license__ = "GPL"
 
 import logging
 import datetime
-from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy import Column, Integer, DateTime, func
 
 import idbutils
 
 from ..summarydb import SummaryBase
+from .stats_by_day import StatsByDay
 
 
 logger = logging.getLogger(__name__)
@@ -115,7 +116,20 @@ class IntensityHR(GarminSummaryDb.Base, idbutils.DbObject):
     def get_stats(cls, session, start_ts, end_ts):
         """Return a dictionary of aggregate statistics for the given time period."""
         return {
-            'inactive_hr_avg' : cls.s_get_col_avg_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
-            'inactive_hr_min' : cls.s_get_col_min_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
-            'inactive_hr_max' : cls.s_get_col_max_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
+            'inactive_hr_avg'   : cls.s_get_col_avg_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
+            'inactive_hr_count' : cls._s_get_col_func_for_value(session, cls.heart_rate, func.count, cls.intensity, 0, start_ts, end_ts, True),
+            'inactive_hr_min'   : cls.s_get_col_min_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
+            'inactive_hr_max'   : cls.s_get_col_max_for_value(session, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
         }
+
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dictionaries of aggregate statistics for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .col_avg('inactive_hr_avg', cls.heart_rate, True, cls.intensity == 0)
+            .col_count('inactive_hr_count', cls.heart_rate, True, cls.intensity == 0)
+            .col_min('inactive_hr_min', cls.heart_rate, True, cls.intensity == 0)
+            .col_max('inactive_hr_max', cls.heart_rate, True, cls.intensity == 0)
+            .s_get(session, days)
+        )
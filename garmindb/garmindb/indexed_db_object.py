@@ -0,0 +1,29 @@
+"""Database object mixin that adds a table's declared indexes to existing databases."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import logging
+
+import idbutils
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedDbObject(idbutils.DbObject):
+    """
+    Database object mixin for tables with indexes beyond the primary key.
+
+    create_all() only adds indexes when it creates the table, so indexes declared after a database was built are created here when the
+    table is set up. Adding an index doesn't change the table's contents, so existing databases are migrated without a rebuild.
+    """
+
+    @classmethod
+    def setup(cls, db):
+        """Initialize per table data and create any of the table's indexes that are missing from the database."""
+        super().setup(db)
+        for index in cls.__table__.indexes:
+            logger.debug("%s: checking index %s", cls.__name__, index.name)
+            index.create(db.engine, checkfirst=True)
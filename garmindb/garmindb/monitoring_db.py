@@ -7,12 +7,15 @@ __license__ = "GPL"
 
 import logging
 import datetime
-from sqlalchemy import Column, Integer, DateTime, Time, Float, Enum, FLOAT, UniqueConstraint, PrimaryKeyConstraint
+from sqlalchemy import Column, Integer, DateTime, Time, Float, Enum, FLOAT, UniqueConstraint, PrimaryKeyConstraint, Index, func
 from sqlalchemy.ext.hybrid import hybrid_property
 
 import fitfile
 import idbutils
 
+from .stats_by_day import StatsByDay
+from .indexed_db_object import IndexedDbObject
+
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +60,7 @@ class MonitoringInfo(MonitoringDb.Base, idbutils.DbObject):
         return stats
 
 
-class MonitoringHeartRate(MonitoringDb.Base, idbutils.DbObject):
+class MonitoringHeartRate(MonitoringDb.Base, IndexedDbObject):
     """Class that reprsents a database table holding resting heart rate data."""
 
     __tablename__ = 'monitoring_hr'
@@ -68,15 +71,33 @@ class MonitoringHeartRate(MonitoringDb.Base, idbutils.DbObject):
     timestamp = Column(DateTime, primary_key=True)
     heart_rate = Column(Integer, nullable=False)
 
+    # covers the stats queries, which skip readings <= 0
+    __table_args__ = (
+        Index('ix_monitoring_hr_timestamp_heart_rate', 'timestamp', 'heart_rate', sqlite_where=heart_rate > 0, postgresql_where=heart_rate > 0),
+    )
+
     @classmethod
     def get_stats(cls, session, start_ts, end_ts):
         """Return a dict of stats for table entries within the time span."""
         return {
             'hr_avg' : cls.s_get_col_avg(session, cls.heart_rate, start_ts, end_ts, True),
+            'hr_count' : cls._s_get_col_func_query(session, cls.heart_rate, func.count, start_ts, end_ts, True).scalar(),
             'hr_min' : cls.s_get_col_min(session, cls.heart_rate, start_ts, end_ts, True),
             'hr_max' : cls.s_get_col_max(session, cls.heart_rate, start_ts, end_ts),
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dicts of stats for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .col_avg('hr_avg', cls.heart_rate, True)
+            .col_count('hr_count', cls.heart_rate, True)
+            .col_min('hr_min', cls.heart_rate, True)
+            .col_max('hr_max', cls.heart_rate)
+            .s_get(session, days)
+        )
+
     @classmethod
     def get_resting_heartrate(cls, db, wake_ts):
         """Return a resting heart rate value for the day specified."""
@@ -118,6 +139,17 @@ class MonitoringIntensity(MonitoringDb.Base, idbutils.DbObject):
             'vigorous_activity_time'    : cls.s_get_time_col_sum(session, cls.vigorous_activity_time, start_ts, end_ts),
         }
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dicts of stats for each of the given days."""
+        return (
+            StatsByDay(cls)
+            .time_col_sum('intensity_time', cls.intensity_time)
+            .time_col_sum('moderate_activity_time', cls.moderate_activity_time)
+            .time_col_sum('vigorous_activity_time', cls.vigorous_activity_time)
+            .s_get(session, days)
+        )
+
 
 class MonitoringClimb(MonitoringDb.Base, idbutils.DbObject):
     """Class representing monitoring data about elvation gained."""
@@ -142,17 +174,25 @@ class MonitoringClimb(MonitoringDb.Base, idbutils.DbObject):
     )
 
     @classmethod
-    def get_stats(cls, session, func, start_ts, end_ts, measurement_system):
-        """Return a dict of stats for table entries within the time span."""
-        cum_ascent = func(session, cls.cum_ascent, start_ts, end_ts)
+    def _floors(cls, cum_ascent, measurement_system):
         if cum_ascent:
             if measurement_system is fitfile.field_enums.DisplayMeasure.metric:
-                floors = cum_ascent / cls.feet_to_floors
-            else:
-                floors = cum_ascent / cls.meters_to_floors
-        else:
-            floors = 0
-        return {'floors' : floors}
+                return cum_ascent / cls.feet_to_floors
+            return cum_ascent / cls.meters_to_floors
+        return 0
+
+    @classmethod
+    def get_stats(cls, session, func, start_ts, end_ts, measurement_system):
+        """Return a dict of stats for table entries within the time span."""
+        return {'floors' : cls._floors(func(session, cls.cum_ascent, start_ts, end_ts), measurement_system)}
+
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days, measurement_system):
+        """Return a dict, keyed by day, of dicts of stats for each of the given days."""
+        stats_by_day = StatsByDay(cls).col_max('cum_ascent', cls.cum_ascent).s_get(session, days)
+        for stats in stats_by_day.values():
+            stats['floors'] = cls._floors(stats.pop('cum_ascent'), measurement_system)
+        return stats_by_day
 
     @classmethod
     def get_daily_stats(cls, session, day_ts, measurement_system):
@@ -184,7 +224,7 @@ class MonitoringClimb(MonitoringDb.Base, idbutils.DbObject):
         return stats
 
 
-class Monitoring(MonitoringDb.Base, idbutils.DbObject):
+class Monitoring(MonitoringDb.Base, IndexedDbObject):
     """A table containing monitoring data."""
 
     __tablename__ = 'monitoring'
@@ -203,7 +243,12 @@ class Monitoring(MonitoringDb.Base, idbutils.DbObject):
     strokes = Column(Integer)
     cycles = Column(Float)
 
-    __table_args__ = (PrimaryKeyConstraint("timestamp", "activity_type"),)
+    __table_args__ = (
+        PrimaryKeyConstraint("timestamp", "activity_type"),
+        # covers the per activity type calories queries and the per day steps and calories stats
+        Index('ix_monitoring_activity_type_timestamp', 'activity_type', 'timestamp', 'active_calories'),
+        Index('ix_monitoring_timestamp_steps', 'timestamp', 'steps', 'active_calories'),
+    )
 
     @classmethod
     def s_get_from_dict(cls, session, values_dict):
@@ -235,6 +280,17 @@ class Monitoring(MonitoringDb.Base, idbutils.DbObject):
         stats['day'] = day_ts
         return stats
 
+    @classmethod
+    def s_get_daily_stats_for_days(cls, session, days):
+        """Return a dict, keyed by day, of dicts of stats for each of the given days."""
+        stats_by_day = StatsByDay(cls).col_max('steps', cls.steps).col_max('active_calories', cls.active_calories).s_get(session, days)
+        for stats in stats_by_day.values():
+            # get_active_calories() doesn't filter the per day maximum by activity type, so for a single day each of the running, cycling,
+            # and walking values it adds up is the day's maximum. Keep the daily values the same as get_daily_stats().
+            active_calories = stats.pop('active_calories')
+            stats['calories_active_avg'] = 3 * (active_calories if active_calories is not None else 0)
+        return stats_by_day
+
     @classmethod
     def get_weekly_stats(cls, session, first_day_ts):
         """Return a dict of stats for table entries for the given week."""
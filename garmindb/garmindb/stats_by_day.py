@@ -0,0 +1,115 @@
+"""Object for computing aggregate statistics of a table for many days with a single query."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import datetime
+from sqlalchemy import func, case, and_
+
+
+class StatsByDay():
+    """Computes aggregate statistics of a table for every day in a list of days with one GROUP BY date(timestamp) query."""
+
+    def __init__(self, table):
+        """Return an instance of StatsByDay for the given table."""
+        self.table = table
+        self.cols = {}
+        self.defaults = {}
+        self.time_col_names = []
+
+    def __add(self, name, stat_col, default=None):
+        self.cols[name] = stat_col
+        self.defaults[name] = default
+        return self
+
+    @classmethod
+    def __filtered(cls, col, condition):
+        # aggregate functions skip NULLs, so rows that don't match the condition are left out of the aggregate
+        return case((condition, col)) if condition is not None else col
+
+    @classmethod
+    def __condition(cls, col, ignore_le_zero, where):
+        conditions = [condition for condition in [where, col > 0 if ignore_le_zero else None] if condition is not None]
+        if len(conditions) > 1:
+            return and_(*conditions)
+        return conditions[0] if conditions else None
+
+    def col_avg(self, name, col, ignore_le_zero=False, where=None):
+        """Add the average value of a column, like s_get_col_avg, to the stats."""
+        return self.__add(name, func.avg(self.__filtered(col, self.__condition(col, ignore_le_zero, where))))
+
+    def col_min(self, name, col, ignore_le_zero=False, where=None):
+        """Add the minimum value of a column, like s_get_col_min, to the stats."""
+        return self.__add(name, func.min(self.__filtered(col, self.__condition(col, ignore_le_zero, where))))
+
+    def col_max(self, name, col, ignore_le_zero=False, where=None):
+        """Add the maximum value of a column, like s_get_col_max, to the stats."""
+        return self.__add(name, func.max(self.__filtered(col, self.__condition(col, ignore_le_zero, where))))
+
+    def col_count(self, name, col, ignore_le_zero=False, where=None):
+        """Add the number of values of a column that an average with the same arguments is computed from to the stats."""
+        return self.__add(name, func.count(self.__filtered(col, self.__condition(col, ignore_le_zero, where))), 0)
+
+    def col_sum(self, name, col):
+        """Add the sum of a column, like s_get_col_sum, to the stats."""
+        return self.__add(name, func.sum(col))
+
+    def row_count(self, name):
+        """Add the number of rows, like s_row_count_for_period, to the stats."""
+        return self.__add(name, func.count(), 0)
+
+    def __time_col_func(self, name, col, stat_func):
+        secs = self.table._secs_from_time(col)
+        self.time_col_names.append(name)
+        return self.__add(name, self.table._time_from_secs(stat_func(self.__filtered(secs, secs > 0))), datetime.time.min)
+
+    def time_col_avg(self, name, col):
+        """Add the average value of a time column, like s_get_time_col_avg, to the stats."""
+        return self.__time_col_func(name, col, func.avg)
+
+    def time_col_min(self, name, col):
+        """Add the minimum value of a time column, like s_get_time_col_min, to the stats."""
+        return self.__time_col_func(name, col, func.min)
+
+    def time_col_max(self, name, col):
+        """Add the maximum value of a time column, like s_get_time_col_max, to the stats."""
+        return self.__time_col_func(name, col, func.max)
+
+    def time_col_sum(self, name, col):
+        """Add the sum of a time column, like s_get_time_col_sum, to the stats."""
+        return self.__time_col_func(name, col, func.sum)
+
+    @classmethod
+    def _to_day(cls, value):
+        # sqlite returns date() results as strings, other databases return dates
+        if isinstance(value, str):
+            return datetime.datetime.strptime(value, '%Y-%m-%d')
+        return datetime.datetime.combine(value, datetime.time.min)
+
+    @classmethod
+    def _to_time(cls, value):
+        if value is None:
+            return datetime.time.min
+        if isinstance(value, datetime.time):
+            return value
+        if isinstance(value, datetime.timedelta):
+            total = int(value.total_seconds()) % 86400
+            return datetime.time(total // 3600, (total % 3600) // 60, total % 60)
+        return datetime.datetime.strptime(value, '%H:%M:%S').time()
+
+    def __row_to_stats(self, row):
+        return {name: self._to_time(row[name]) if name in self.time_col_names else row[name] for name in self.cols}
+
+    def s_get(self, session, days):
+        """Return a dict, keyed by day, of the stats for each of the given days. Days without data get the values of an empty time period."""
+        if not days:
+            return {}
+        day_col = func.date(self.table.time_col)
+        query = (
+            session.query(day_col.label('_day'), *[col.label(name) for name, col in self.cols.items()])
+            .filter(self.table.during(min(days), max(days) + datetime.timedelta(1)))
+            .group_by(day_col)
+        )
+        stats_by_day = {self._to_day(row._mapping['_day']): self.__row_to_stats(row._mapping) for row in query.all()}
+        return {day: dict(stats_by_day.get(day, self.defaults), day=day) for day in days}
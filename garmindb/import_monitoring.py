@@ -11,10 +11,12 @@ import datetime
 import enum
 
 import fitfile
-from idbutils import JsonFileProcessor, Conversions
+from idbutils import Conversions
 
-from .garmindb import GarminDb, Attributes, Weight, Sleep, SleepEvents, RestingHeartRate, DailySummary, Hrv
+from .garmindb import GarminDb, MonitoringDb, Attributes, Weight, Sleep, SleepEvents, RestingHeartRate, DailySummary, Hrv
 from .fit_data import FitData
+from .ledger_json_file_processor import LedgerJsonFileProcessor
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -22,9 +24,11 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
 
-class GarminWeightData(JsonFileProcessor):
+class GarminWeightData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect weight data into a database."""
 
+    coverage_stat = 'weight'
+
     def __init__(self, db_params, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminWeightData.
@@ -39,9 +43,9 @@ class GarminWeightData(JsonFileProcessor):
 
         """
         logger.info("Processing weight data")
-        super().__init__(r'weight_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
+        super().__init__(db_params, r'weight_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
         self.measurement_system = measurement_system
-        self.garmin_db = GarminDb(db_params)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {'startDate': self._parse_date}
 
     def _process_json(self, json_data):
@@ -53,6 +57,7 @@ class GarminWeightData(JsonFileProcessor):
                 'weight': weight.kgs_or_lbs(self.measurement_system)
             }
             Weight.insert_or_update(self.garmin_db, point)
+            self._mark_covered(point['day'])
             return 1
         return 0
 
@@ -60,6 +65,9 @@ class GarminWeightData(JsonFileProcessor):
 class GarminMonitoringFitData(FitData):
     """Class for importing monitoring FIT files into a database."""
 
+    import_db = MonitoringDb
+    coverage_stat = 'monitoring'
+
     def __init__(self, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminMonitoringFitData.
@@ -78,6 +86,8 @@ class GarminMonitoringFitData(FitData):
 class GarminSleepFitData(FitData):
     """Class for importing sleep FIT files into a database."""
 
+    coverage_stat = 'sleep'
+
     def __init__(self, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminSleepFitData.
@@ -128,9 +138,11 @@ class RemSleepActivityLevels(enum.Enum):
     awake = 3.0
 
 
-class GarminSleepData(JsonFileProcessor):
+class GarminSleepData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect sleep data into a database."""
 
+    coverage_stat = 'sleep'
+
     def __init__(self, db_params, input_dir, latest, debug):
         """
         Return an instance of GarminSleepData.
@@ -144,8 +156,8 @@ class GarminSleepData(JsonFileProcessor):
 
         """
         logger.info("Processing sleep data")
-        super().__init__(r'sleep_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
-        self.garmin_db = GarminDb(db_params)
+        super().__init__(db_params, r'sleep_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {
             'calendarDate': self._parse_date,
             'sleepTimeSeconds': fitfile.conversions.secs_to_dt_time,
@@ -207,6 +219,7 @@ class GarminSleepData(JsonFileProcessor):
             'qualifier': qualifier
         }
         Sleep.insert_or_update(self.garmin_db, day_data, ignore_none=True)
+        self._mark_covered(date)
         sleep_levels = json_data.get('sleepLevels')
         if sleep_levels is None:
             return 0
@@ -223,12 +236,15 @@ class GarminSleepData(JsonFileProcessor):
                 'duration': duration
             }
             SleepEvents.insert_or_update(self.garmin_db, level_data, ignore_none=True)
+            self._mark_dirty(start_local)
         return len(sleep_levels)
 
 
-class GarminRhrData(JsonFileProcessor):
+class GarminRhrData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect resting heart rate data into a database."""
 
+    coverage_stat = 'rhr'
+
     def __init__(self, db_params, input_dir, latest, debug):
         """
         Return an instance of GarminRhrData.
@@ -242,8 +258,8 @@ class GarminRhrData(JsonFileProcessor):
 
         """
         logger.info("Processing rhr data")
-        super().__init__(r'rhr_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
-        self.garmin_db = GarminDb(db_params)
+        super().__init__(db_params, r'rhr_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {'statisticsStartDate': self._parse_date}
 
     def _process_json(self, json_data):
@@ -257,11 +273,12 @@ class GarminRhrData(JsonFileProcessor):
                 }
                 RestingHeartRate.insert_or_update(
                     self.garmin_db, point, ignore_none=True)
+                self._mark_covered(point['day'])
                 return 1
         return 0
 
 
-class GarminProfile(JsonFileProcessor):
+class GarminProfile(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect profile data into a database."""
 
     def __init__(self, db_params, file_regex, input_dir, debug):
@@ -277,8 +294,8 @@ class GarminProfile(JsonFileProcessor):
 
         """
         logger.info("Processing profile data")
-        super().__init__(file_regex, input_dir=input_dir, latest=False, debug=debug)
-        self.garmin_db = GarminDb(db_params)
+        super().__init__(db_params, file_regex, input_dir=input_dir, latest=False, debug=debug)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {'calendarDate': self._parse_date}
 
     def _process_json(self, json_data):
@@ -374,9 +391,11 @@ class GarminSocialProfile(GarminProfile):
         }
 
 
-class GarminSummaryData(JsonFileProcessor):
+class GarminSummaryData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect daily summary data into a database."""
 
+    coverage_stat = 'daily_summary'
+
     def __init__(self, db_params, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminSummaryData.
@@ -391,10 +410,10 @@ class GarminSummaryData(JsonFileProcessor):
 
         """
         logger.info("Processing daily summary data")
-        super().__init__(r'daily_summary_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug, recursive=True)
+        super().__init__(db_params, r'daily_summary_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug, recursive=True)
         self.input_dir = input_dir
         self.measurement_system = measurement_system
-        self.garmin_db = GarminDb(db_params)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {
             'calendarDate': self._parse_date,
             'moderateIntensityMinutes': fitfile.conversions.min_to_dt_time,
@@ -437,12 +456,15 @@ class GarminSummaryData(JsonFileProcessor):
         }
         DailySummary.insert_or_update(
             self.garmin_db, summary, ignore_none=True)
+        self._mark_covered(summary['day'])
         return 1
 
 
-class GarminHydrationData(JsonFileProcessor):
+class GarminHydrationData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect daily summary data into a database."""
 
+    coverage_stat = 'hydration'
+
     def __init__(self, db_params, input_dir, latest, measurement_system, debug):
         """
         Return an instance of GarminHydrationData.
@@ -457,10 +479,10 @@ class GarminHydrationData(JsonFileProcessor):
 
         """
         logger.debug("Processing daily hydration data")
-        super().__init__(r'hydration_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug, recursive=True)
+        super().__init__(db_params, r'hydration_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug, recursive=True)
         self.input_dir = input_dir
         self.measurement_system = measurement_system
-        self.garmin_db = GarminDb(db_params)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {
             'calendarDate': self._parse_date
         }
@@ -478,12 +500,15 @@ class GarminHydrationData(JsonFileProcessor):
         root_logger.debug("Processing daily hydration data %r", summary)
         DailySummary.insert_or_update(
             self.garmin_db, summary, ignore_none=True)
+        self._mark_covered(summary['day'])
         return 1
 
 
-class GarminHrvData(JsonFileProcessor):
+class GarminHrvData(LedgerJsonFileProcessor):
     """Class for importing JSON formatted Garmin Connect heart rate variability (HRV) data into a database."""
 
+    coverage_stat = 'hrv'
+
     def __init__(self, db_params, input_dir, latest, debug):
         """
         Return an instance of GarminHrvData.
@@ -496,8 +521,8 @@ class GarminHrvData(JsonFileProcessor):
         debug (Boolean): enable debug logging
 
         """
-        super().__init__(r'hrv_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
-        self.garmin_db = GarminDb(db_params)
+        super().__init__(db_params, r'hrv_\d{4}-\d{2}-\d{2}\.json', input_dir=input_dir, latest=latest, debug=debug)
+        self.garmin_db = DbRegistry.get(GarminDb, db_params)
         self.conversions = {'calendarDate': self._parse_date}
 
     def _process_json(self, json_data):
@@ -519,4 +544,5 @@ class GarminHrvData(JsonFileProcessor):
             'status': self._get_field(hrv_summary, 'status', str)
         }
         Hrv.insert_or_update(self.garmin_db, point, ignore_none=True)
+        self._mark_covered(point['day'])
         return 1
@@ -0,0 +1,88 @@
+"""Class for parsing JSON formatted health data into a database that skips files that have already been imported."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+
+import datetime
+
+from idbutils import JsonFileProcessor
+
+from .garmindb import GarminDb, ImportLedger, DirtyRange, DataCoverage
+from .db_registry import DbRegistry
+
+
+class _ImportedFileNames():
+    """The file names handed to JsonFileProcessor._process_files() that collects the names of the files that data was imported from."""
+
+    def __init__(self, processor, file_names):
+        self.processor = processor
+        self.file_names = file_names
+        self.imported = []
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def __iter__(self):
+        for file_name in self.file_names:
+            total_updates = self.processor.total_updates
+            yield file_name
+            # The file has been processed once the next one is asked for. Files that saved no data or failed to parse are imported again next time.
+            if self.processor.total_updates > total_updates:
+                self.imported.append(file_name)
+
+
+class LedgerJsonFileProcessor(JsonFileProcessor):
+    """Class for parsing JSON formatted health data into a database that only parses new or changed files."""
+
+    # the database the imported data is written to, used to invalidate import ledger entries when the database changes
+    import_db = GarminDb
+    # the stat that the days with imported data are recorded as covered for
+    coverage_stat = None
+
+    def __init__(self, db_params, file_regex, input_file=None, input_dir=None, latest=True, debug=False, recursive=False):
+        """
+        Return an instance of LedgerJsonFileProcessor.
+
+        Parameters:
+        ----------
+            db_params (dict): configuration data for accessing the database
+            file_regex (string): only process files that match this regex
+            input_file (string): file (full path) to check for data
+            input_dir (string): directory (full path) to check for data files
+            latest (Boolean): check for latest files only
+            debug (Boolean): enable debug logging
+            recursive (Boolean): check the search directory recursively
+
+        """
+        super().__init__(file_regex, input_file=input_file, input_dir=input_dir, latest=latest, debug=debug, recursive=recursive)
+        self.ledger_db = DbRegistry.get(GarminDb, db_params)
+        self.file_names = ImportLedger.changed_files(self.ledger_db, self.file_names, self.__class__.__name__, self.import_db)
+        self.dirty_days = set()
+        self.covered_days = set()
+
+    def _mark_dirty(self, start, end=None):
+        """Record that data for the days from start to end, or just the start day, was imported so that those days are summarized again."""
+        start_day = start.date() if isinstance(start, datetime.datetime) else start
+        end_day = (end.date() if isinstance(end, datetime.datetime) else end) if end is not None else start_day
+        self.dirty_days.update(start_day + datetime.timedelta(days=day) for day in range((end_day - start_day).days + 1))
+
+    def _mark_covered(self, day):
+        """Record that data for coverage_stat was imported for the day, the day is also marked dirty."""
+        self._mark_dirty(day)
+        self.covered_days.add(day.date() if isinstance(day, datetime.datetime) else day)
+
+    def process(self):
+        """Import the new and changed files into the database and record the files and the days they changed."""
+        file_names = self.file_names
+        self.file_names = _ImportedFileNames(self, file_names)
+        try:
+            super().process()
+        finally:
+            imported_file_names = self.file_names.imported
+            self.file_names = file_names
+            ImportLedger.record(self.ledger_db, imported_file_names, self.__class__.__name__, self.import_db)
+            DirtyRange.add_days(self.ledger_db, self.dirty_days, self.__class__.__name__)
+            if self.coverage_stat is not None:
+                DataCoverage.add_days(self.ledger_db, self.coverage_stat, self.covered_days, self.__class__.__name__)
@@ -12,10 +12,11 @@ import datetime
 import fitfile
 import idbutils
 
-from .garmindb import File
 from .garmindb import MonitoringDb, Monitoring, MonitoringInfo, MonitoringHeartRate, MonitoringIntensity, MonitoringClimb, MonitoringRespirationRate, MonitoringPulseOx, \
     MonitoringHrvValue, MonitoringHrvStatus
 from .fit_file_processor import FitFileProcessor
+from .fit_file_import_context import FitFileImportContext
+from .db_registry import DbRegistry
 
 
 logger = logging.getLogger(__file__)
@@ -28,17 +29,15 @@ class MonitoringFitFileProcessor(FitFileProcessor):
 
     def write_file(self, fit_file):
         """Given a Fit File object, write all of its messages to the DB."""
-        self.monitoring_fit_file_plugins = [plugin for plugin in self.plugin_manager.get_file_processors('MonitoringFit', fit_file).values()]
-        if len(self.monitoring_fit_file_plugins):
-            root_logger.info("Loaded %d activity plugins %r for file %s", len(self.activity_fit_file_plugins), self.activity_fit_file_plugins, fit_file)
-        # Create the db after setting up the plugins so that plugin tables are handled properly
-        self.garmin_mon_db = MonitoringDb(self.db_params, self.debug - 1)
+        plugins = self._file_plugins('MonitoringFit', fit_file)
+        if len(plugins):
+            root_logger.info("Loaded %d monitoring plugins %r for file %s", len(plugins), plugins, fit_file)
+        self.import_context = FitFileImportContext(fit_file, plugins)
+        # Get the db after setting up the plugins so that any new plugin tables are created
+        self.garmin_mon_db = DbRegistry.get(MonitoringDb, self.db_params, self.debug - 1)
         with self.garmin_db.managed_session() as self.garmin_db_session, self.garmin_mon_db.managed_session() as self.garmin_mon_db_session:
             self._write_message_types(fit_file, fit_file.message_types)
 
-    def _plugin_dispatch(self, handler_name, *args, **kwargs):
-        return super()._plugin_dispatch(self.monitoring_fit_file_plugins, handler_name, *args, **kwargs)
-
     @classmethod
     def __unpack_tuple(cls, entry, name, value, index):
         if type(value) is tuple:
@@ -49,19 +48,19 @@ class MonitoringFitFileProcessor(FitFileProcessor):
         if isinstance(activity_types, list):
             for index, activity_type in enumerate(activity_types):
                 entry = {
-                    'file_id'                   : File.s_get_id(self.garmin_db_session, fit_file.filename),
+                    'file_id'                   : self.import_context.s_db_file_id(self.garmin_db_session),
                     'timestamp'                 : message_fields.local_timestamp,
                     'activity_type'             : activity_type,
                     'resting_metabolic_rate'    : message_fields.get('resting_metabolic_rate')
                 }
                 self.__unpack_tuple(entry, 'cycles_to_distance', message_fields.cycles_to_distance, index)
                 self.__unpack_tuple(entry, 'cycles_to_calories', message_fields.cycles_to_calories, index)
-                MonitoringInfo.s_insert_or_update(self.garmin_mon_db_session, entry)
+                self._upsert(self.garmin_mon_db_session, MonitoringInfo, entry)
 
     def _write_monitoring_entry(self, fit_file, message_fields):
         # Only include not None values so that we match and update only if a table's columns if it has values.
         entry = idbutils.list_and_dict.dict_filter_none_values(message_fields)
-        timestamp = fit_file.utc_datetime_to_local(message_fields.timestamp)
+        timestamp = self.import_context.local_datetime(message_fields.timestamp)
         # Hack: daily monitoring summaries appear at 00:00:00 localtime for the PREVIOUS day. Subtract a second so they appear in the previous day.
         if timestamp.time() == datetime.time.min:
             timestamp = timestamp - datetime.timedelta(seconds=1)
@@ -70,16 +69,16 @@ class MonitoringFitFileProcessor(FitFileProcessor):
         try:
             intersection = MonitoringHeartRate.intersection(entry)
             if len(intersection) > 1 and intersection['heart_rate'] > 0:
-                MonitoringHeartRate.s_insert_or_update(self.garmin_mon_db_session, intersection)
+                self._upsert(self.garmin_mon_db_session, MonitoringHeartRate, intersection)
             intersection = MonitoringIntensity.intersection(entry)
             if len(intersection) > 1:
-                MonitoringIntensity.s_insert_or_update(self.garmin_mon_db_session, intersection)
+                self._upsert(self.garmin_mon_db_session, MonitoringIntensity, intersection)
             intersection = MonitoringClimb.intersection(entry)
             if len(intersection) > 1:
-                MonitoringClimb.s_insert_or_update(self.garmin_mon_db_session, intersection)
+                self._upsert(self.garmin_mon_db_session, MonitoringClimb, intersection)
             intersection = Monitoring.intersection(entry)
             if len(intersection) > 1:
-                Monitoring.s_insert_or_update(self.garmin_mon_db_session, intersection)
+                self._upsert(self.garmin_mon_db_session, Monitoring, intersection)
         except ValueError:
             logger.error("write_monitoring_entry: ValueError for %r: %s", entry, traceback.format_exc())
         except Exception:
@@ -90,11 +89,11 @@ class MonitoringFitFileProcessor(FitFileProcessor):
         rr = message_fields.get('respiration_rate')
         if rr > 0:
             respiration = {
-                'timestamp' : fit_file.utc_datetime_to_local(message_fields.timestamp),
+                'timestamp' : self.import_context.local_datetime(message_fields.timestamp),
                 'rr'        : rr,
             }
             if fit_file.type is fitfile.FileType.monitoring_b:
-                MonitoringRespirationRate.s_insert_or_update(self.garmin_mon_db_session, respiration)
+                self._upsert(self.garmin_mon_db_session, MonitoringRespirationRate, respiration)
             else:
                 raise ValueError(f'Unexpected file type {repr(fit_file.type)} for respiration message')
 
@@ -104,10 +103,10 @@ class MonitoringFitFileProcessor(FitFileProcessor):
             pulse_ox = message_fields.get('pulse_ox')
             if pulse_ox is not None:
                 pulse_ox_entry = {
-                    'timestamp': fit_file.utc_datetime_to_local(message_fields.timestamp),
+                    'timestamp': self.import_context.local_datetime(message_fields.timestamp),
                     'pulse_ox': pulse_ox,
                 }
-                MonitoringPulseOx.s_insert_or_update(self.garmin_mon_db_session, pulse_ox_entry)
+                self._upsert(self.garmin_mon_db_session, MonitoringPulseOx, pulse_ox_entry)
         else:
             raise ValueError(f'Unexpected file type {repr(fit_file.type)} for pulse ox')
 
@@ -118,17 +117,17 @@ class MonitoringFitFileProcessor(FitFileProcessor):
         if hrv_value is not None and hrv_value > 0:
             # HRV values are scaled by 128 in the FIT file
             hrv_entry = {
-                'timestamp': fit_file.utc_datetime_to_local(message_fields.timestamp),
+                'timestamp': self.import_context.local_datetime(message_fields.timestamp),
                 'hrv': hrv_value / 128.0,  # Convert to milliseconds
             }
-            MonitoringHrvValue.s_insert_or_update(self.garmin_mon_db_session, hrv_entry)
+            self._upsert(self.garmin_mon_db_session, MonitoringHrvValue, hrv_entry)
 
     def _write_hrv_status_summary_entry(self, fit_file, message_fields):
         """Write an HRV status summary entry to the database."""
         logger.debug("hrv_status_summary message: %r", message_fields)
         # HRV values are scaled by 128 in the FIT file
         hrv_status_entry = {
-            'timestamp': fit_file.utc_datetime_to_local(message_fields.timestamp),
+            'timestamp': self.import_context.local_datetime(message_fields.timestamp),
             'weekly_average': message_fields.get('weekly_average', 0) / 128.0 if message_fields.get('weekly_average') else None,
             'last_night': message_fields.get('last_night', 0) / 128.0 if message_fields.get('last_night') else None,
             'last_night_average': message_fields.get('last_night_average', 0) / 128.0 if message_fields.get('last_night_average') else None,
@@ -137,4 +136,4 @@ class MonitoringFitFileProcessor(FitFileProcessor):
             'status': message_fields.get('status'),
             'reading_count': message_fields.get('reading_count'),
         }
-        MonitoringHrvStatus.s_insert_or_update(self.garmin_mon_db_session, hrv_status_entry)
+        self._upsert(self.garmin_mon_db_session, MonitoringHrvStatus, hrv_status_entry)
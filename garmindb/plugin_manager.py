@@ -8,27 +8,117 @@ import logging
 
 import idbutils
 
-from .garmindb import ActivitiesDb, Activities
+from .garmindb import ActivitiesDb, Activities, MonitoringDb, Monitoring
+from .activity_fit_plugin_base import ActivityFitPluginBase
+from .monitoring_fit_plugin_base import MonitoringFitPluginBase
 
 
 logger = logging.getLogger(__file__)
 
 
+class FilePlugins():
+    """The plugins that handle a file with their hooks resolved into a list of functions per hook."""
+
+    def __init__(self, plugins=None, hooks=None):
+        """Return a new FilePlugins instance for a dict of plugins, keyed by name, and a dict of hook function lists, keyed by hook name."""
+        self.plugins = plugins or {}
+        self.hooks = hooks or {}
+
+    def dispatch(self, hook_name, *args, **kwargs):
+        """Call the hook of each plugin that implements it and return a dict of the merged results."""
+        result = {}
+        for function in self.hooks.get(hook_name, ()):
+            result.update(function(*args, **kwargs))
+        return result
+
+    def __len__(self):
+        """Return the number of plugins."""
+        return len(self.plugins)
+
+    def __repr__(self):
+        """Return a string representation of a FilePlugins instance."""
+        return f'{self.__class__.__name__}({list(self.plugins.values())!r})'
+
+
 class PluginManager(idbutils.PluginManager):
     """Loads python file based plugins that extend GarminDb."""
 
+    # the hooks the FIT file processors call for each type of plugin
+    hook_names = {
+        'ActivityFit'   : ['write_session_entry', 'write_lap_entry', 'write_split_entry', 'write_record_entry', 'write_steps_entry', 'write_cycle_entry',
+                           'write_paddle_entry', 'write_rock_climbing_entry'],
+    }
+    # for each type of plugin: the methods used to check if a plugin handles a file and to initialize it, and the db and table it's initialized with
+    file_matchers = {
+        'ActivityFit'   : ('matches_activity_file', 'init_activity', ActivitiesDb, Activities),
+        'MonitoringFit' : ('matches_monitoring_file', 'init_monitoring', MonitoringDb, Monitoring),
+    }
+    # the base class of each type of plugin, its method that checks if a plugin handles a file only looks at the properties in the file signature
+    plugin_base_classes = {
+        'ActivityFit'   : ActivityFitPluginBase,
+        'MonitoringFit' : MonitoringFitPluginBase,
+    }
+    no_plugins = FilePlugins()
+
     def __init__(self, plugin_dir, db_params):
         """Load python file based plugins from plugin_dir."""
         logger.info("Loading GarminDb plugins from %s", plugin_dir)
         super().__init__(plugin_dir, {'db_params': db_params})
+        self.plugin_hooks = {file_type: {name: self.__resolve_hooks(file_type, plugin) for name, plugin in plugins.items()} for file_type, plugins in self.plugins.items()}
+        self.file_plugins_cache = {}
+        self.cacheable_file_types = {file_type for file_type, plugins in self.plugins.items()
+                                     if file_type in self.file_matchers and self.__base_matchers(file_type, plugins)}
+
+    @classmethod
+    def __resolve_hooks(cls, file_type, plugin):
+        hooks = {}
+        for hook_name in cls.hook_names.get(file_type, []):
+            function = getattr(plugin, hook_name, None)
+            if function is not None:
+                hooks[hook_name] = function
+        return hooks
+
+    @classmethod
+    def __base_matchers(cls, file_type, plugins):
+        # matches can only be cached if all of the plugins use the base class method to check if they handle a file
+        matches_func_name = cls.file_matchers[file_type][0]
+        base_matches_func = getattr(cls.plugin_base_classes[file_type], matches_func_name).__func__
+        return all(getattr(getattr(plugin, matches_func_name), '__func__', None) is base_matches_func for plugin in plugins.values())
+
+    @classmethod
+    def __file_signature(cls, file_type, fit_file):
+        # the file properties that the plugin base classes match files on
+        return (file_type, repr(fit_file.dev_application_ids), fit_file.sport_type, fit_file.sub_sport_type, tuple(sorted(fit_file.dev_fields)))
+
+    def __match_file(self, file_type, fit_file):
+        matches_func_name, init_func_name, db_class, table = self.file_matchers[file_type]
+        plugins = {}
+        hooks = {}
+        for plugin_name, plugin in self.plugins[file_type].items():
+            if getattr(plugin, matches_func_name)(fit_file):
+                logger.info("%s plugin %s matches file %s", file_type, plugin_name, fit_file)
+                getattr(plugin, init_func_name)(db_class, table)
+                plugins[plugin_name] = plugin
+                for hook_name, function in self.plugin_hooks[file_type][plugin_name].items():
+                    hooks.setdefault(hook_name, []).append(function)
+        return FilePlugins(plugins, hooks)
+
+    def get_file_plugins(self, file_type, fit_file):
+        """Return a FilePlugins instance with the plugins of type file_type that handle the file.
+
+        Matches are cached by the file properties they are based on, unless a plugin has its own method for checking if it handles a file.
+        """
+        if file_type not in self.plugins:
+            return self.no_plugins
+        if file_type not in self.cacheable_file_types:
+            return self.__match_file(file_type, fit_file)
+        signature = self.__file_signature(file_type, fit_file)
+        file_plugins = self.file_plugins_cache.get(signature)
+        if file_plugins is None:
+            file_plugins = self.__match_file(file_type, fit_file)
+            self.file_plugins_cache[signature] = file_plugins
+        return file_plugins
 
     def get_file_processors(self, file_type, fit_file):
         """Return a dict of all plugins that handle file_type."""
-        result = {}
-        if file_type in self.plugins:
-            for plugin_name, plugin in self.plugins[file_type].items():
-                if plugin.matches_activity_file(fit_file):
-                    logger.info("Activity Fit plugin %s matches file %s", plugin_name, fit_file)
-                    plugin.init_activity(ActivitiesDb, Activities)
-                    result[plugin_name] = plugin
-        return result
+        return dict(self.get_file_plugins(file_type, fit_file).plugins)
@@ -0,0 +1,44 @@
+"""Token bucket rate limiter for limiting the rate of requests made to a web service."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import time
+import threading
+
+
+class RateLimiter():
+    """A thread safe token bucket. Tokens are added at a fixed rate up to the size of the bucket and each request takes one token."""
+
+    def __init__(self, rate, burst=1):
+        """
+        Return a new RateLimiter instance.
+
+        Parameters:
+        ----------
+        rate (float): the number of requests per second allowed on average, 0 or None for no limit
+        burst (int): the number of requests that can be made back to back after being idle
+
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """Wait until a request can be made and take a token for it."""
+        if not self.rate:
+            return
+        with self.lock:
+            self.__refill(time.monotonic())
+            # Take the token now, even if it's not available yet, so that waiting threads are served in order.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
@@ -11,6 +11,7 @@ import fitfile
 
 from .garmindb import SleepEvents
 from .fit_file_processor import FitFileProcessor
+from .fit_file_import_context import FitFileImportContext
 
 
 logger = logging.getLogger(__file__)
@@ -25,17 +26,18 @@ class SleepFitFileProcessor(FitFileProcessor):
         """Given a Fit File object, write all of its messages to the DB."""
         self.last_sleep_event = None
         self.last_sleep_level = None
+        self.import_context = FitFileImportContext(fit_file)
         with self.garmin_db.managed_session() as self.garmin_db_session:
             self._write_message_types(fit_file, fit_file.message_types)
 
     def _write_sleep_level_entry(self, fit_file, message_fields):
         logger.debug("sleep level message: %r", message_fields)
-        timestamp = fit_file.utc_datetime_to_local(message_fields.timestamp)
+        timestamp = self.import_context.local_datetime(message_fields.timestamp)
         sleep_level = message_fields.get('sleep_level')
         if sleep_level.value > fitfile.field_enums.SleepActivityLevel.unknown.value and self.last_sleep_event is not None and \
            (sleep_level is not fitfile.field_enums.SleepActivityLevel.awake or self.last_sleep_level is not fitfile.field_enums.SleepActivityLevel.awake):
             sleep_event = {
-                'timestamp' : fit_file.utc_datetime_to_local(self.last_sleep_event),
+                'timestamp' : self.import_context.local_datetime(self.last_sleep_event),
                 'event'     : sleep_level.name,
                 'duration'  : fitfile.conversions.timedelta_to_time(timestamp - self.last_sleep_event)
             }
@@ -0,0 +1,76 @@
+"""Apply configured PRAGMA settings to every connection made to the SQLite databases."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import os
+import re
+import sqlite3
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+class SqlitePragmas():
+    """Keeps the PRAGMA settings for each database directory and sets them on each new SQLite connection to a database in that directory."""
+
+    # journal_mode is set first since some of the other pragmas depend on the journal mode
+    pragma_order = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout']
+    value_regex = re.compile(r'^-?\w+$')
+    pragmas_by_dir = {}
+
+    @classmethod
+    def __pragmas_list(cls, pragmas):
+        for name, value in pragmas.items():
+            if not cls.value_regex.match(name) or not cls.value_regex.match(str(value)):
+                raise ValueError(f'Bad SQLite pragma setting {name}: {value}')
+        return sorted(pragmas.items(), key=lambda item: cls.pragma_order.index(item[0]) if item[0] in cls.pragma_order else len(cls.pragma_order))
+
+    @classmethod
+    def register(cls, db_params):
+        """Use the pragmas in the database parameters, if any, for all connections to SQLite databases in the parameter's directory."""
+        pragmas = getattr(db_params, 'sqlite_pragmas', None)
+        if db_params.db_type == 'sqlite' and pragmas:
+            cls.pragmas_by_dir[os.path.realpath(db_params.db_path)] = cls.__pragmas_list(pragmas)
+
+    @classmethod
+    def apply(cls, dbapi_connection):
+        """Set the pragmas registered for the connection's database directory on a new connection."""
+        filename = dbapi_connection.execute('PRAGMA database_list').fetchone()[2]
+        if not filename:
+            return
+        pragmas = cls.pragmas_by_dir.get(os.path.dirname(os.path.realpath(filename)))
+        if pragmas:
+            logger.debug("Setting pragmas %r for %s", pragmas, filename)
+            for name, value in pragmas:
+                dbapi_connection.execute(f'PRAGMA {name}={value}').fetchall()
+
+    @classmethod
+    def checkpoint(cls, filename):
+        """Move any changes in the database's write ahead log into the database file so that the file can be copied on its own."""
+        connection = sqlite3.connect(filename)
+        try:
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        finally:
+            connection.close()
+
+    @classmethod
+    def delete_db(cls, db, db_params):
+        """Delete a database and the write ahead log files it leaves behind so that they aren't used by a new database with the same name."""
+        db.delete_db(db_params)
+        if db_params.db_type == 'sqlite':
+            filename = os.path.join(db_params.db_path, f'{db.db_name}.db')
+            for suffix in ['-wal', '-shm']:
+                if os.path.exists(filename + suffix):
+                    os.remove(filename + suffix)
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        SqlitePragmas.apply(dbapi_connection)
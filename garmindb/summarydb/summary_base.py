@@ -5,7 +5,7 @@ __copyright__ = "Copyright Tom Goetz"
 __license__ = "GPL"
 
 import datetime
-from sqlalchemy import Column, Float, Time, Integer, func
+from sqlalchemy import Column, Float, Time, Integer, func, case, cast, and_
 from sqlalchemy.ext.hybrid import hybrid_property
 
 import fitfile.conversions as conversions
@@ -16,7 +16,7 @@ class SummaryBase(DbObject):
     """Base class for implementing summary database objects."""
 
     view_version = 10
-    _table_version = 6
+    _table_version = 7
     _col_units = {'hr_avg': 'bpm', 'hr_min': 'bpm', 'hr_max': 'bpm', 'rhr_avg': 'bpm', 'rhr_min': 'bpm', 'rhr_max': 'bpm', 'rr_waking_avg': 'brpm', 'rr_max': 'brpm',
                   'rr_min': 'brpm'}
 
@@ -68,6 +68,92 @@ class SummaryBase(DbObject):
     rr_min = Column(Float)
     bb_max = Column(Integer)
     bb_min = Column(Integer)
+    # the number of samples the averages were computed from
+    hr_count = Column(Integer)
+    rhr_count = Column(Integer)
+    inactive_hr_count = Column(Integer)
+    weight_count = Column(Integer)
+    stress_count = Column(Integer)
+
+    # How each column of a period summary is computed from the daily summaries of the days in the period. Daily values that are already
+    # totals or per day maximums are summed, averages of samples are weighted by the day's sample count, averages of per day values count
+    # each day once, and everything else is rolled up with the same function that was used to compute the daily value.
+    _rollup_weighted_avg_cols = {'hr_avg': 'hr_count', 'rhr_avg': 'rhr_count', 'inactive_hr_avg': 'inactive_hr_count', 'weight_avg': 'weight_count',
+                                 'stress_avg': 'stress_count'}
+    _rollup_sum_cols = ['steps', 'steps_goal', 'floors', 'floors_goal', 'calories_goal', 'activities', 'activities_calories', 'activities_distance',
+                        'hydration_goal', 'hydration_intake', 'sweat_loss'] + list(_rollup_weighted_avg_cols.values())
+    _rollup_avg_cols = ['calories_avg', 'calories_bmr_avg', 'calories_active_avg', 'calories_consumed_avg', 'hydration_avg', 'sweat_loss_avg', 'spo2_avg',
+                        'rr_waking_avg', 'bb_max', 'bb_min']
+    _rollup_min_cols = ['hr_min', 'rhr_min', 'inactive_hr_min', 'weight_min', 'spo2_min', 'rr_min']
+    _rollup_max_cols = ['hr_max', 'rhr_max', 'inactive_hr_max', 'weight_max', 'rr_max']
+    _rollup_time_avg_cols = ['sleep_avg', 'rem_sleep_avg']
+    _rollup_time_min_cols = ['sleep_min', 'rem_sleep_min']
+    _rollup_time_max_cols = ['sleep_max', 'rem_sleep_max']
+    _rollup_time_sum_cols = ['intensity_time', 'moderate_activity_time', 'vigorous_activity_time', 'intensity_time_goal']
+
+    @classmethod
+    def __rollup_time_secs(cls, col_name):
+        # Like s_get_time_col_*, zero times are days without data.
+        secs = cls._secs_from_time(getattr(cls, col_name))
+        return case((secs > 0, secs))
+
+    @classmethod
+    def __rollup_weighted_avg(cls, col_name, count_col_name):
+        col = getattr(cls, col_name)
+        # days summarized before sample counts were kept count once
+        weight = func.coalesce(getattr(cls, count_col_name), 1)
+        return func.sum(cast(col, Float) * weight) / func.sum(case((col.isnot(None), weight)))
+
+    @classmethod
+    def __rollup_cols(cls):
+        cols = {col_name: func.sum(getattr(cls, col_name)) for col_name in cls._rollup_sum_cols}
+        cols.update({col_name: cls.__rollup_weighted_avg(col_name, count_col_name) for col_name, count_col_name in cls._rollup_weighted_avg_cols.items()})
+        cols.update({col_name: func.avg(getattr(cls, col_name)) for col_name in cls._rollup_avg_cols})
+        cols.update({col_name: func.min(getattr(cls, col_name)) for col_name in cls._rollup_min_cols})
+        cols.update({col_name: func.max(getattr(cls, col_name)) for col_name in cls._rollup_max_cols})
+        cols.update({col_name: func.avg(cls.__rollup_time_secs(col_name)) for col_name in cls._rollup_time_avg_cols})
+        cols.update({col_name: func.min(cls.__rollup_time_secs(col_name)) for col_name in cls._rollup_time_min_cols})
+        cols.update({col_name: func.max(cls.__rollup_time_secs(col_name)) for col_name in cls._rollup_time_max_cols})
+        cols.update({col_name: func.sum(cls.__rollup_time_secs(col_name)) for col_name in cls._rollup_time_sum_cols})
+        return cols
+
+    @classmethod
+    def __secs_to_time(cls, secs):
+        return conversions.secs_to_dt_time(round(secs)) if secs else datetime.time.min
+
+    @classmethod
+    def __rollup_row_to_stats(cls, row, weekly):
+        time_col_names = cls._rollup_time_avg_cols + cls._rollup_time_min_cols + cls._rollup_time_max_cols
+        stats = {col_name: cls.__secs_to_time(value) if col_name in time_col_names else value for col_name, value in row.items() if not col_name.startswith('_')}
+        for col_name in cls._rollup_time_sum_cols:
+            total = row[col_name] or 0
+            # Time columns hold less than a day, so longer periods report the weekly average, which is also what the goal is set as.
+            stats[col_name] = cls.__secs_to_time(total if weekly else total * 7 / row['_days'])
+        return stats
+
+    @classmethod
+    def s_rollup(cls, session, periods, weekly=True):
+        """
+        Return a dictionary, keyed by the first day of each period, of aggregate statistics computed from the daily summaries of the days in the period.
+
+        The daily summaries are aggregated by the database with one query for all of the periods. Periods without daily summaries are left out.
+
+        Parameters:
+        ----------
+            session: the session for the database holding the daily summaries
+            periods (list): tuples of the first day of each period and the first day after the period
+            weekly (Boolean): if True the time totals, like intensity time, are totals for the period, else they are the average per week
+
+        """
+        if not periods:
+            return {}
+        period_col = case(*[(and_(cls.time_col >= start, cls.time_col < end), index) for index, (start, end) in enumerate(periods)])
+        query = (
+            session.query(period_col.label('_period'), func.count().label('_days'), *[col.label(col_name) for col_name, col in cls.__rollup_cols().items()])
+            .filter(cls.time_col >= min(start for start, _ in periods), cls.time_col < max(end for _, end in periods))
+            .group_by(period_col)
+        )
+        return {periods[row._mapping['_period']][0]: cls.__rollup_row_to_stats(row._mapping, weekly) for row in query.all() if row._mapping['_period'] is not None}
 
     @hybrid_property
     def intensity_time_mins(self):
@@ -6,6 +6,9 @@ __license__ = "GPL"
 
 import re
 from functools import cached_property
+from xml.sax.saxutils import XMLGenerator
+import xml.etree.ElementTree as ET
+import dateutil.parser
 
 import tcxfile
 from idbutils import Location
@@ -39,7 +42,8 @@ class Tcx(tcxfile.Tcx):
         """Add a creator element."""
         super().add_creator(product, serial_number, product_id, version)
 
-    def __manufacturer_from_product(self, product):
+    @classmethod
+    def __manufacturer_from_product(cls, product):
         for manufacturer in Device.Manufacturer:
             if manufacturer.name.lower() in product.lower():
                 return manufacturer
@@ -50,32 +54,38 @@ class Tcx(tcxfile.Tcx):
             if re.search(regex, product, re.IGNORECASE):
                 return manufacturer
 
-    def _manufacturer_from_product(self, product):
-        if product in self.__product_to_manufactuer_cache:
-            return self.__product_to_manufactuer_cache[product]
-        manufacturer = self.__manufacturer_from_product(product)
+    @classmethod
+    def _manufacturer_from_product(cls, product):
+        if product in cls.__product_to_manufactuer_cache:
+            return cls.__product_to_manufactuer_cache[product]
+        manufacturer = cls.__manufacturer_from_product(product)
         if manufacturer is not None:
-            self.__product_to_manufactuer_cache[product] = manufacturer
+            cls.__product_to_manufactuer_cache[product] = manufacturer
         return manufacturer
 
-    def get_manufacturer_and_product(self):
-        """Return the product and interperlated manufacturer from the parsed TCX file."""
-        product = super().creator_product
+    @classmethod
+    def _manufacturer_and_product(cls, product):
         if not product:
             return (None, None)
-        return (self._manufacturer_from_product(product), product)
+        return (cls._manufacturer_from_product(product), product)
+
+    @classmethod
+    def _serial_number(cls, serial_number, product):
+        if not serial_number or serial_number == '0':
+            (manufactuer, product) = cls._manufacturer_and_product(product)
+            if (manufactuer, product) in cls.__default_device_serial_numbers:
+                return cls.__default_device_serial_numbers[(manufactuer, product)]
+            return Device.unknown_device_serial_number
+        return serial_number
+
+    def get_manufacturer_and_product(self):
+        """Return the product and interperlated manufacturer from the parsed TCX file."""
+        return self._manufacturer_and_product(super().creator_product)
 
     @cached_property
     def serial_number(self):
         """Return the serial number of the device that recorded the parsed TCX file."""
-        serial_number = super().creator_serialnumber
-        if not serial_number or serial_number == '0':
-            (manufactuer, product) = self.get_manufacturer_and_product()
-            if (manufactuer, product) in self.__default_device_serial_numbers:
-                serial_number = self.__default_device_serial_numbers[(manufactuer, product)]
-            else:
-                serial_number = Device.unknown_device_serial_number
-        return serial_number
+        return self._serial_number(super().creator_serialnumber, super().creator_product)
 
     @cached_property
     def start_loc(self):
@@ -126,3 +136,166 @@ class Tcx(tcxfile.Tcx):
     def get_point_speed(self, point):
         """Return the speed readings in the point."""
         return Speed.from_mps(super().get_point_speed(point))
+
+
+class TcxReader():
+    """Read a TCX file with an incremental parser into lists of laps and points without building the XML tree."""
+
+    __ns = f'{{{tcxfile.Tcx.default_namespace}}}'
+    __ae_ns = f'{{{tcxfile.Tcx.namespaces["ae"][1]}}}'
+
+    def __init__(self):
+        """Return an instance of TcxReader."""
+        self.sport = None
+        self.product = None
+        self.serial_number = None
+        self.laps = []
+
+    @classmethod
+    def __value(cls, element, path, type_func, default=None):
+        text = element.findtext(path)
+        if text is not None:
+            try:
+                return type_func(text.strip())
+            except ValueError:
+                pass
+        return default
+
+    @classmethod
+    def __point(cls, element):
+        ns = cls.__ns
+        return {
+            'time'      : cls.__value(element, f'{ns}Time', dateutil.parser.isoparse),
+            'location'  : Location(cls.__value(element, f'{ns}Position/{ns}LatitudeDegrees', float),
+                                   cls.__value(element, f'{ns}Position/{ns}LongitudeDegrees', float)),
+            'altitude'  : cls.__value(element, f'{ns}AltitudeMeters', float),
+            'hr'        : cls.__value(element, f'{ns}HeartRateBpm/{ns}Value', int),
+            'speed'     : cls.__value(element, f'.//{cls.__ae_ns}Speed', float),
+        }
+
+    @classmethod
+    def __lap(cls, element, points):
+        ns = cls.__ns
+        return {
+            'duration'  : cls.__value(element, f'{ns}TotalTimeSeconds', float, 0),
+            'distance'  : cls.__value(element, f'{ns}DistanceMeters', float, 0),
+            'calories'  : cls.__value(element, f'{ns}Calories', int, 0),
+            'cadence'   : cls.__value(element, f'{ns}Cadence', int),
+            'points'    : points,
+        }
+
+    def read(self, filename):
+        """Parse a TCX file and return self."""
+        ns = self.__ns
+        points = []
+        for event, element in ET.iterparse(filename, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == f'{ns}Activity':
+                    self.sport = element.get('Sport')
+            elif element.tag == f'{ns}Trackpoint':
+                points.append(self.__point(element))
+                element.clear()
+            elif element.tag == f'{ns}Lap':
+                self.laps.append(self.__lap(element, points))
+                points = []
+                element.clear()
+            elif element.tag == f'{ns}Creator':
+                self.product = element.findtext(f'{ns}Name')
+                self.serial_number = element.findtext(f'{ns}UnitId')
+        return self
+
+    @property
+    def points(self):
+        """Return all of the points of all of the laps."""
+        return [point for lap in self.laps for point in lap['points']]
+
+    def get_manufacturer_and_product(self):
+        """Return the product and interperlated manufacturer of the device that recorded the TCX file."""
+        return Tcx._manufacturer_and_product(self.product)
+
+    def get_serial_number(self):
+        """Return the serial number of the device that recorded the TCX file."""
+        return Tcx._serial_number(self.serial_number, self.product)
+
+
+class TcxWriter():
+    """Write a TCX file a lap and trackpoint at a time without building the XML document in memory."""
+
+    def __init__(self, file):
+        """Return an instance of TcxWriter that writes to the given binary file object."""
+        self.xml = XMLGenerator(file, encoding='UTF-8', short_empty_elements=True)
+
+    def __start(self, tag, attrs={}):
+        self.xml.startElement(tag, attrs)
+
+    def __end(self, tag):
+        self.xml.endElement(tag)
+
+    def __element(self, tag, text):
+        self.__start(tag)
+        self.xml.characters(str(text))
+        self.__end(tag)
+
+    def start_activity(self, sport, start_dt):
+        """Write the start of the file and the activity."""
+        self.xml.startDocument()
+        self.__start('TrainingCenterDatabase', {
+            'xmlns'     : tcxfile.Tcx.default_namespace,
+            'xmlns:ae'  : tcxfile.Tcx.namespaces['ae'][1],
+            'xmlns:xsi' : tcxfile.Tcx.namespaces['xsi'][1]
+        })
+        self.__start('Activities')
+        self.__start('Activity', {'Sport': sport})
+        self.__element('Id', start_dt.isoformat())
+
+    def start_lap(self, start_dt, end_dt, distance, calories):
+        """Write the start of a lap, the lap's points are written next."""
+        self.__start('Lap', {'StartTime': start_dt.isoformat()})
+        self.__element('TotalTimeSeconds', (end_dt - start_dt).total_seconds())
+        meters = distance.to_meters()
+        if meters:
+            self.__element('DistanceMeters', meters)
+        if calories:
+            self.__element('Calories', calories)
+        self.__start('Track')
+
+    def add_point(self, dt, location, alititude, heart_rate, speed):
+        """Write a point of the current lap."""
+        self.__start('Trackpoint')
+        self.__element('Time', dt.isoformat())
+        if location.lat_deg is not None and location.long_deg is not None:
+            self.__start('Position')
+            self.__element('LatitudeDegrees', location.lat_deg)
+            self.__element('LongitudeDegrees', location.long_deg)
+            self.__end('Position')
+        meters = alititude.to_meters()
+        if meters is not None:
+            self.__element('AltitudeMeters', meters)
+        if heart_rate is not None:
+            self.__start('HeartRateBpm')
+            self.__element('Value', heart_rate)
+            self.__end('HeartRateBpm')
+        mps = speed.to_mps()
+        if mps is not None:
+            self.__start('Extensions')
+            self.__start('ae:ActivityTrackpointExtension')
+            self.__element('ae:Speed', mps)
+            self.__end('ae:ActivityTrackpointExtension')
+            self.__end('Extensions')
+        self.__end('Trackpoint')
+
+    def end_lap(self):
+        """Write the end of the current lap."""
+        self.__end('Track')
+        self.__end('Lap')
+
+    def end_activity(self, product, serial_number):
+        """Write the creator, the end of the activity, and the end of the file."""
+        self.__start('Creator', {'xsi:type': 'Device_t'})
+        self.__element('Name', product)
+        self.__element('UnitId', serial_number)
+        self.__end('Creator')
+        self.__end('Activity')
+        self.__end('Activities')
+        self.__end('TrainingCenterDatabase')
+        self.xml.endDocument()
@@ -0,0 +1,78 @@
+"""Class that buffers rows for a table and writes them to the database in batches."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import logging
+
+from sqlalchemy.dialects import sqlite, postgresql
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpsertBuffer():
+    """Buffers rows for a table and writes them in batches with INSERT ... ON CONFLICT DO UPDATE. Only non-None values are written like s_insert_or_update."""
+
+    dialect_inserts = {
+        'sqlite'        : sqlite.insert,
+        'postgresql'    : postgresql.insert,
+    }
+
+    def __init__(self, session, table, batch_size=1000):
+        """
+        Return a new UpsertBuffer instance.
+
+        Parameters:
+        ----------
+        session (Session): the session to write the rows with
+        table (DbObject): the table to write the rows to
+        batch_size (int): the number of rows to buffer before writing them
+
+        """
+        self.session = session
+        self.table = table
+        self.batch_size = batch_size
+        self.pk_col_names = [col.name for col in table.__table__.primary_key.columns]
+        self.col_names = [col.name for col in table.__table__.columns]
+        self.rows = {}
+
+    def add(self, values_dict):
+        """Buffer a row. Rows with the same primary key are merged so that the last non-None value for each column wins."""
+        values = {key: value for key, value in values_dict.items() if value is not None and key in self.col_names}
+        pk = tuple(values[col_name] for col_name in self.pk_col_names)
+        row = self.rows.get(pk)
+        if row is None:
+            self.rows[pk] = values
+        else:
+            row.update(values)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def __upsert(self, insert, col_names, rows):
+        statement = insert(self.table)
+        update_col_names = [col_name for col_name in col_names if col_name not in self.pk_col_names]
+        if update_col_names:
+            statement = statement.on_conflict_do_update(index_elements=self.pk_col_names, set_={col_name: statement.excluded[col_name] for col_name in update_col_names})
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=self.pk_col_names)
+        self.session.execute(statement, rows)
+
+    def flush(self):
+        """Write all buffered rows to the database."""
+        if not self.rows:
+            return
+        insert = self.dialect_inserts.get(self.session.get_bind().dialect.name)
+        if insert is None:
+            for row in self.rows.values():
+                self.table.s_insert_or_update(self.session, row)
+        else:
+            # executemany needs the same columns for every row, so write rows with the same set of columns together.
+            rows_by_cols = {}
+            for row in self.rows.values():
+                rows_by_cols.setdefault(tuple(row), []).append(row)
+            for col_names, rows in rows_by_cols.items():
+                self.__upsert(insert, col_names, rows)
+        logger.debug("Wrote %d rows to %s", len(self.rows), self.table.__tablename__)
+        self.rows = {}
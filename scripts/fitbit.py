@@ -12,7 +12,7 @@ import logging
 
 
 from garmindb.fitbitdb import FitBitDb, FitBitData, Analyze
-from garmindb import GarminConnectConfigManager
+from garmindb import GarminConnectConfigManager, DbRegistry
 from garmindb.version import format_version
 
 
@@ -46,11 +46,11 @@ def main(argv):
     else:
         root_logger.setLevel(logging.INFO)
 
-    gc_config = GarminConnectConfigManager(args.config)
+    gc_config = GarminConnectConfigManager(args.config, 'import')
     db_params = gc_config.get_db_params()
 
     if args.delete_db or args.rebuild_db:
-        FitBitDb.delete_db(db_params)
+        DbRegistry.delete_db(FitBitDb, db_params)
         if args.delete_db:
             sys.exit()
 
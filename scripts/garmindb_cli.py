@@ -18,9 +18,12 @@ import os
 import tempfile
 import zipfile
 import glob
+import queue
+import threading
 
 from garmindb import python_version_check, log_version, format_version
-from garmindb.garmindb import GarminDb, Attributes, Sleep, Weight, RestingHeartRate, Hrv, MonitoringDb, MonitoringHeartRate, ActivitiesDb, GarminSummaryDb
+from garmindb.garmindb import GarminDb, ImportLedger, DataCoverage, Attributes, Sleep, Weight, RestingHeartRate, Hrv, DailySummary, MonitoringDb, MonitoringHeartRate, \
+    ActivitiesDb, GarminSummaryDb
 from garmindb.summarydb import SummaryDb
 
 from garmindb import Download, Copy, Analyze
@@ -28,9 +31,9 @@ from garmindb import FitFileProcessor, ActivityFitFileProcessor, MonitoringFitFi
 from garmindb import GarminUserSettings, GarminSocialProfile, GarminPersonalInformation, GarminWeightData, GarminSummaryData, GarminMonitoringFitData, GarminSleepFitData, \
     GarminSleepData, GarminRhrData, GarminSettingsFitData, GarminHydrationData
 from garmindb import GarminJsonSummaryData, GarminJsonDetailsData, GarminTcxData, GarminActivitiesFitData
-from garmindb import ActivityExporter
+from garmindb import ActivityExporter, ActivityRecordArrays
 
-from garmindb import GarminConnectConfigManager, PluginManager
+from garmindb import GarminConnectConfigManager, PluginManager, SqlitePragmas, DbRegistry
 from garmindb import Statistics
 from garmindb import OpenWithBaseCamp, OpenWithGoogleEarth
 
@@ -56,8 +59,12 @@ class GarminDbMain():
 
     summary_dbs = [GarminSummaryDb, SummaryDb]
 
+    # weight and monitoring are imported before the other stats as they were before pipelining
+    import_order = [Statistics.weight, Statistics.monitoring, Statistics.sleep, Statistics.rhr, Statistics.hrv, Statistics.activities]
+
     def __init__(self, config_path=None):
-        self.gc_config = GarminConnectConfigManager(config_path)
+        # the CLI mostly imports and analyzes data
+        self.gc_config = GarminConnectConfigManager(config_path, 'import')
         self.plugin_manager = PluginManager(self.gc_config.get_plugins_dir(), self.gc_config.get_db_params())
 
     def __get_date_and_days(self, db, latest, table, col, stat_name):
@@ -81,34 +88,61 @@ class GarminDbMain():
             sys.exit()
         return (date, days)
 
-
-    def copy_data(self, overwrite, latest, stats):
-        """Copy data from a mounted Garmin USB device to files."""
+    def __get_date_ranges(self, date, days, latest, stat, stat_name, data_db, table, not_none_col):
+        """Return a list of (date, days) ranges to download. When downloading the latest data, also download the days that are missing before it."""
+        ranges = [(date, days)] if days > 0 else []
+        if latest:
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            if not DataCoverage.has_stat(garmin_db, stat):
+                DataCoverage.seed(garmin_db, stat, data_db, table, not_none_col)
+            start_date, _ = self.gc_config.stat_start_date(stat_name)
+            missing_ranges = DataCoverage.missing_ranges(garmin_db, stat, start_date, date)
+            if missing_ranges:
+                logger.info("Downloading %d days of missing %s data", sum(missing_days for _, missing_days in missing_ranges), stat)
+            ranges = missing_ranges + ranges
+        return ranges
+
+    def copy_data(self, overwrite, latest, stats, stat_done=None):
+        """Copy data from a mounted Garmin USB device to files. If given, stat_done is called with each stat once its data has been copied."""
         logger.info("___Copying Data___")
         copy = Copy(self.gc_config)
 
         settings_dir = self.gc_config.get_fit_files_dir()
         root_logger.info("Copying settings to %s", settings_dir)
-        copy.copy_settings(settings_dir)
+        copied_files = copy.copy_settings(settings_dir)
+        root_logger.info("Copied %d new or changed settings files", len(copied_files))
 
         if Statistics.activities in stats:
             activities_dir = self.gc_config.get_activities_dir()
             root_logger.info("Copying activities to %s", activities_dir)
-            copy.copy_activities(activities_dir, latest)
+            copied_files = copy.copy_activities(activities_dir, latest)
+            root_logger.info("Copied %d new or changed activity files", len(copied_files))
+            if stat_done:
+                stat_done(Statistics.activities)
 
         if Statistics.monitoring in stats:
             monitoring_dir = self.gc_config.get_monitoring_dir(datetime.datetime.now().year)
             root_logger.info("Copying monitoring to %s", monitoring_dir)
-            copy.copy_monitoring(monitoring_dir, latest)
+            copied_files = copy.copy_monitoring(monitoring_dir, latest)
+            root_logger.info("Copied %d new or changed monitoring files", len(copied_files))
+            if stat_done:
+                stat_done(Statistics.monitoring)
 
         if Statistics.sleep in stats:
             monitoring_dir = self.gc_config.get_monitoring_dir(datetime.datetime.now().year)
             root_logger.info("Copying sleep to %s", monitoring_dir)
-            copy.copy_sleep(monitoring_dir, latest)
+            copied_files = copy.copy_sleep(monitoring_dir, latest)
+            root_logger.info("Copied %d new or changed sleep files", len(copied_files))
+            if stat_done:
+                stat_done(Statistics.sleep)
+
 
+    def download_data(self, overwrite, latest, stats, stat_done=None):
+        """
+        Download selected activity types from Garmin Connect and save the data in files. Overwrite previously downloaded data if indicated.
 
-    def download_data(self, overwrite, latest, stats):
-        """Download selected activity types from Garmin Connect and save the data in files. Overwrite previously downloaded data if indicated."""
+        If given, stat_done is called with each stat once its data has been downloaded.
+        """
         logger.info("___Downloading %s Data___", 'Latest' if latest else 'All')
 
         download = Download(self.gc_config)
@@ -124,55 +158,74 @@ class GarminDbMain():
             activities_dir = self.gc_config.get_activities_dir()
             root_logger.info("Fetching %d activities to %s", activity_count, activities_dir)
             download.get_activity_types(activities_dir, overwrite)
-            download.get_activities(activities_dir, activity_count, overwrite)
+            download.get_activities(activities_dir, activity_count, overwrite, latest)
+            if stat_done:
+                stat_done(Statistics.activities)
 
         if Statistics.monitoring in stats:
-            date, days = self.__get_date_and_days(MonitoringDb(self.gc_config.get_db_params()), latest, MonitoringHeartRate, MonitoringHeartRate.heart_rate, 'monitoring')
-            if days > 0:
-                monitoring_dir = self.gc_config.get_monitoring_base_dir()
-                root_logger.info("Date range to update: %s (%d) to %s", date, days, monitoring_dir)
-                download.get_daily_summaries(self.gc_config.get_monitoring_dir, date, days, overwrite)
-                download.get_hydration(self.gc_config.get_monitoring_dir, date, days, overwrite)
-                download.get_monitoring(self.gc_config.get_monitoring_dir, date, days)
-                root_logger.info("Saved monitoring files for %s (%d) to %s for processing", date, days, monitoring_dir)
+            monitoring_db = DbRegistry.get(MonitoringDb, self.gc_config.get_db_params())
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            date, days = self.__get_date_and_days(monitoring_db, latest, MonitoringHeartRate, MonitoringHeartRate.heart_rate, 'monitoring')
+            monitoring_dir = self.gc_config.get_monitoring_base_dir()
+            for range_date, range_days in self.__get_date_ranges(date, days, latest, 'daily_summary', 'monitoring', garmin_db, DailySummary, DailySummary.day):
+                root_logger.info("Date range to update: %s (%d) to %s", range_date, range_days, monitoring_dir)
+                download.get_daily_summaries(self.gc_config.get_monitoring_dir, range_date, range_days, overwrite)
+            for range_date, range_days in self.__get_date_ranges(date, days, latest, 'hydration', 'monitoring', garmin_db, DailySummary, DailySummary.hydration_intake):
+                download.get_hydration(self.gc_config.get_monitoring_dir, range_date, range_days, overwrite)
+            monitoring_ranges = self.__get_date_ranges(date, days, latest, 'monitoring', 'monitoring', monitoring_db, MonitoringHeartRate, MonitoringHeartRate.heart_rate)
+            for range_date, range_days in monitoring_ranges:
+                download.get_monitoring(self.gc_config.get_monitoring_dir, range_date, range_days)
+                root_logger.info("Saved monitoring files for %s (%d) to %s for processing", range_date, range_days, monitoring_dir)
+            if stat_done:
+                stat_done(Statistics.monitoring)
 
         if Statistics.sleep in stats:
-            date, days = self.__get_date_and_days(GarminDb(self.gc_config.get_db_params()), latest, Sleep, Sleep.total_sleep, 'sleep')
-            if days > 0:
-                sleep_dir = self.gc_config.get_sleep_dir()
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            date, days = self.__get_date_and_days(garmin_db, latest, Sleep, Sleep.total_sleep, 'sleep')
+            sleep_dir = self.gc_config.get_sleep_dir()
+            for date, days in self.__get_date_ranges(date, days, latest, 'sleep', 'sleep', garmin_db, Sleep, Sleep.total_sleep):
                 root_logger.info("Date range to update: %s (%d) to %s", date, days, sleep_dir)
                 download.get_sleep(sleep_dir, date, days, overwrite)
                 root_logger.info("Saved sleep files for %s (%d) to %s for processing", date, days, sleep_dir)
+            if stat_done:
+                stat_done(Statistics.sleep)
 
         if Statistics.weight in stats:
-            date, days = self.__get_date_and_days(GarminDb(self.gc_config.get_db_params()), latest, Weight, Weight.weight, 'weight')
-            if days > 0:
-                weight_dir = self.gc_config.get_weight_dir()
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            date, days = self.__get_date_and_days(garmin_db, latest, Weight, Weight.weight, 'weight')
+            weight_dir = self.gc_config.get_weight_dir()
+            for date, days in self.__get_date_ranges(date, days, latest, 'weight', 'weight', garmin_db, Weight, Weight.weight):
                 root_logger.info("Date range to update: %s (%d) to %s", date, days, weight_dir)
                 download.get_weight(weight_dir, date, days, overwrite)
                 root_logger.info("Saved weight files for %s (%d) to %s for processing", date, days, weight_dir)
+            if stat_done:
+                stat_done(Statistics.weight)
 
         if Statistics.rhr in stats:
-            date, days = self.__get_date_and_days(GarminDb(self.gc_config.get_db_params()), latest, RestingHeartRate, RestingHeartRate.resting_heart_rate, 'rhr')
-            if days > 0:
-                rhr_dir = self.gc_config.get_rhr_dir()
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            date, days = self.__get_date_and_days(garmin_db, latest, RestingHeartRate, RestingHeartRate.resting_heart_rate, 'rhr')
+            rhr_dir = self.gc_config.get_rhr_dir()
+            for date, days in self.__get_date_ranges(date, days, latest, 'rhr', 'rhr', garmin_db, RestingHeartRate, RestingHeartRate.resting_heart_rate):
                 root_logger.info("Date range to update: %s (%d) to %s", date, days, rhr_dir)
                 download.get_rhr(rhr_dir, date, days, overwrite)
                 root_logger.info("Saved rhr files for %s (%d) to %s for processing", date, days, rhr_dir)
+            if stat_done:
+                stat_done(Statistics.rhr)
 
         if Statistics.hrv in stats:
-            date, days = self.__get_date_and_days(GarminDb(self.gc_config.get_db_params()), latest, Hrv, Hrv.day, 'hrv')
-            if days > 0:
-                hrv_dir = self.gc_config.get_rhr_dir() # HRV tends to be in the same place as RHR or monitoring
+            garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+            date, days = self.__get_date_and_days(garmin_db, latest, Hrv, Hrv.day, 'hrv')
+            hrv_dir = self.gc_config.get_rhr_dir() # HRV tends to be in the same place as RHR or monitoring
+            for date, days in self.__get_date_ranges(date, days, latest, 'hrv', 'hrv', garmin_db, Hrv, Hrv.day):
                 root_logger.info("Date range to update: %s (%d) to %s", date, days, hrv_dir)
                 download.get_hrv(hrv_dir, date, days, overwrite)
                 root_logger.info("Saved hrv files for %s (%d) to %s for processing", date, days, hrv_dir)
+            if stat_done:
+                stat_done(Statistics.hrv)
 
 
-    def import_data(self, debug, latest, stats):
-        """Import previously downloaded Garmin data into the database."""
-        logger.info("___Importing %s Data___", 'Latest' if latest else 'All')
-
+    def __import_settings(self, debug):
+        """Import the user profile and settings and return the measurement system."""
         # Import the user profile and/or settings FIT file first so that we can get the measurement system and some other things sorted out first.
         fit_files_dir = self.gc_config.get_fit_files_dir()
         gus = GarminUserSettings(self.gc_config.get_db_params(), fit_files_dir, debug)
@@ -191,17 +244,19 @@ class GarminDbMain():
         if gsfd.file_count() > 0:
             gsfd.process_files(FitFileProcessor(self.gc_config.get_db_params(), self.plugin_manager, debug))
 
-        gdb = GarminDb(self.gc_config.get_db_params())
-        measurement_system = Attributes.measurements_type(gdb)
+        gdb = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+        return Attributes.measurements_type(gdb)
 
-        if Statistics.weight in stats:
+    def __import_stat(self, debug, latest, stat, measurement_system):
+        """Import previously downloaded Garmin data for one stat into the database."""
+        if stat == Statistics.weight:
             weight_dir = self.gc_config.get_weight_dir()
             gwd = GarminWeightData(self.gc_config.get_db_params(), weight_dir, latest, measurement_system, debug)
             if gwd.file_count() > 0:
                 gwd.process()
 
         monitoring_dir = self.gc_config.get_monitoring_base_dir()
-        if Statistics.monitoring in stats:
+        if stat == Statistics.monitoring:
             gsd = GarminSummaryData(self.gc_config.get_db_params(), monitoring_dir, latest, measurement_system, debug)
             if gsd.file_count() > 0:
                 gsd.process()
@@ -212,9 +267,9 @@ class GarminDbMain():
 
             gfd = GarminMonitoringFitData(monitoring_dir, latest, measurement_system, debug)
             if gfd.file_count() > 0:
-                gfd.process_files(MonitoringFitFileProcessor(self.gc_config.get_db_params(), self.plugin_manager, debug))
+                gfd.process_files(MonitoringFitFileProcessor(self.gc_config.get_db_params(), self.plugin_manager, debug), self.gc_config.import_workers())
 
-        if Statistics.sleep in stats:
+        if stat == Statistics.sleep:
             # If we have sleep data from Garmin connect, use it, otherwise process FIT sleep files.
             gsd = GarminSleepData(self.gc_config.get_db_params(), self.gc_config.get_sleep_dir(), latest, debug)
             if gsd.file_count() > 0:
@@ -222,27 +277,28 @@ class GarminDbMain():
             else:
                 gsd = GarminSleepFitData(monitoring_dir, latest=False, measurement_system=measurement_system, debug=2)
                 if gsd.file_count() > 0:
-                    gsd.process_files(SleepFitFileProcessor(self.gc_config.get_db_params()))
+                    gsd.process_files(SleepFitFileProcessor(self.gc_config.get_db_params()), self.gc_config.import_workers())
 
-        if Statistics.rhr in stats:
+        if stat == Statistics.rhr:
             rhr_dir = self.gc_config.get_rhr_dir()
             grhrd = GarminRhrData(self.gc_config.get_db_params(), rhr_dir, latest, debug)
             if grhrd.file_count() > 0:
                 grhrd.process()
 
-        if Statistics.hrv in stats:
+        if stat == Statistics.hrv:
             from garmindb import GarminHrvData
             hrv_dir = self.gc_config.get_rhr_dir()
             ghrvd = GarminHrvData(self.gc_config.get_db_params(), hrv_dir, latest, debug)
             if ghrvd.file_count() > 0:
                 ghrvd.process()
 
-        if Statistics.activities in stats:
+        if stat == Statistics.activities:
             activities_dir = self.gc_config.get_activities_dir()
+            record_arrays = ActivityRecordArrays(self.gc_config.get_activity_record_arrays_dir()) if self.gc_config.activity_record_arrays() else None
             # Tcx fields are less precise than the JSON files, so load Tcx first and overwrite with better JSON values.
             gtd = GarminTcxData(activities_dir, latest, measurement_system, debug)
             if gtd.file_count() > 0:
-                gtd.process_files(self.gc_config.get_db_params())
+                gtd.process_files(self.gc_config.get_db_params(), self.gc_config.import_workers(), record_arrays)
 
             gjsd = GarminJsonSummaryData(self.gc_config.get_db_params(), activities_dir, latest, measurement_system, debug)
             if gjsd.file_count() > 0:
@@ -254,14 +310,60 @@ class GarminDbMain():
 
             gfd = GarminActivitiesFitData(activities_dir, latest, measurement_system, debug)
             if gfd.file_count() > 0:
-                gfd.process_files(ActivityFitFileProcessor(self.gc_config.get_db_params(), self.plugin_manager, debug))
-
+                gfd.process_files(ActivityFitFileProcessor(self.gc_config.get_db_params(), self.plugin_manager, debug, record_arrays), self.gc_config.import_workers())
 
-    def analyze_data(self, debug):
+    def import_data(self, debug, latest, stats):
+        """Import previously downloaded Garmin data into the database."""
+        logger.info("___Importing %s Data___", 'Latest' if latest else 'All')
+        measurement_system = self.__import_settings(debug)
+        for stat in self.import_order:
+            if stat in stats:
+                self.__import_stat(debug, latest, stat, measurement_system)
+
+    def pipeline_data(self, copy, download, debug, overwrite, latest, stats):
+        """Copy and/or download data and import the data for each stat as soon as it has been acquired, while the data for the next stat is acquired."""
+        logger.info("___Acquiring and Importing %s Data___", 'Latest' if latest else 'All')
+        acquired_stats = queue.Queue()
+        errors = []
+
+        def acquire():
+            try:
+                if copy:
+                    self.copy_data(overwrite, latest, stats, None if download else acquired_stats.put)
+                if download:
+                    self.download_data(overwrite, latest, stats, acquired_stats.put)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                acquired_stats.put(None)
+
+        acquirer = threading.Thread(target=acquire, name='acquire')
+        acquirer.start()
+        measurement_system = None
+        imported_stats = set()
+        for stat in iter(acquired_stats.get, None):
+            # The settings and profile are copied and downloaded before any stat is.
+            if not imported_stats:
+                measurement_system = self.__import_settings(debug)
+            self.__import_stat(debug, latest, stat, measurement_system)
+            imported_stats.add(stat)
+        acquirer.join()
+        if errors:
+            raise errors[0]
+        # Import the selected stats that weren't acquired, i.e. weight, rhr, and hrv files that were downloaded earlier when only copying.
+        remaining_stats = [stat for stat in self.import_order if stat in stats and stat not in imported_stats]
+        if remaining_stats:
+            if not imported_stats:
+                measurement_system = self.__import_settings(debug)
+            for stat in remaining_stats:
+                self.__import_stat(debug, latest, stat, measurement_system)
+
+
+    def analyze_data(self, debug, full=False):
         """Analyze the downloaded and imported Garmin data and create summary tables."""
-        logger.info("___Analyzing Data___")
+        logger.info("___Analyzing %s Data___", 'All' if full else 'Changed')
         analyze = Analyze(self.gc_config, debug - 1)
-        analyze.summary()
+        analyze.summary(full)
         analyze.create_dynamic_views()
 
 
@@ -272,24 +374,36 @@ class GarminDbMain():
         logger.info("Backiping up dbs %s to %s", dbs, backupfile)
         with zipfile.ZipFile(backupfile, 'w') as backupzip:
             for db in dbs:
+                # the DBs may be in WAL mode, get all committed changes into the DB file before copying it
+                SqlitePragmas.checkpoint(db)
                 backupzip.write(db)
 
 
     def delete_dbs(self, delete_db_list=[GarminDb, MonitoringDb, ActivitiesDb, GarminSummaryDb, SummaryDb]):
         """Delete selected database files, or all if none selected."""
         for db in delete_db_list:
-            db.delete_db(self.gc_config.get_db_params())
+            DbRegistry.delete_db(db, self.gc_config.get_db_params())
+        # The import ledger lives in the Garmin DB, forget the files imported into the deleted DBs so they will be imported again.
+        if GarminDb not in delete_db_list:
+            ImportLedger.delete_for_dbs(DbRegistry.get(GarminDb, self.gc_config.get_db_params()), [db.db_name for db in delete_db_list])
 
 
     def export_activity(self, debug, directory, export_activity_id):
         """Export an activity given its database id."""
-        garmin_db = GarminDb(self.gc_config.get_db_params())
+        garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
         measurement_system = Attributes.measurements_type(garmin_db)
         ae = ActivityExporter(directory, export_activity_id, measurement_system, debug)
         ae.process(self.gc_config.get_db_params())
         return ae.write('activity_%s.tcx' % export_activity_id)
 
 
+    def export_activities(self, debug, directory, export_activity_ids):
+        """Export activities given their database ids."""
+        garmin_db = DbRegistry.get(GarminDb, self.gc_config.get_db_params())
+        measurement_system = Attributes.measurements_type(garmin_db)
+        return ActivityExporter.export(self.gc_config.get_db_params(), directory, export_activity_ids, measurement_system, debug, self.gc_config.export_workers())
+
+
     def basecamp_activity(self, debug, export_activity_id):
         """Export an activity given its database id."""
         file_with_path = self.export_activity(debug, tempfile.mkdtemp(), export_activity_id)
@@ -320,7 +434,7 @@ def main(argv):
     modes_group.add_argument("--analyze", help="Analyze data in the db and create summary and derived tables.", dest='analyze_data', action="store_true", default=False)
     modes_group.add_argument("--rebuild_db", help="Delete Garmin DB db files and rebuild the database.", action="store_true", default=False)
     modes_group.add_argument("--delete_db", help="Delete Garmin DB db files for the selected activities.", action="store_true", default=False)
-    modes_group.add_argument("-e", "--export-activity", help="Export an activity to a TCX file based on the activity\'s id", type=int)
+    modes_group.add_argument("-e", "--export-activity", help="Export one or more activities to TCX files based on the activity\'s id", type=int, nargs='+')
     modes_group.add_argument("--basecamp-activity", help="Export an activity to Garmin BaseCamp", type=int)
     modes_group.add_argument("-g", "--google-earth-activity", help="Export an activity to Google Earth", type=int)
     # stat types to operate on
@@ -336,6 +450,10 @@ def main(argv):
     modifiers_group.add_argument("-l", "--latest", help="Only download and/or import the latest data.", action="store_true", default=False)
     modifiers_group.add_argument("-o", "--overwrite", help="Overwrite existing files when downloading. The default is to only download missing files.",
                                  action="store_true", default=False)
+    modifiers_group.add_argument("-p", "--pipeline", help="Import the data for each stat as soon as it has been copied or downloaded, while the next stat is acquired.",
+                                 action="store_true", default=False)
+    modifiers_group.add_argument("--full", help="Recalculate all summary tables when analyzing. The default is to only recalculate days changed by imports.",
+                                 action="store_true", default=False)
     args = parser.parse_args()
 
     log_version(sys.argv[0])
@@ -363,22 +481,25 @@ def main(argv):
     if args.rebuild_db:
         garminDbMain.delete_dbs([GarminDbMain.stats_to_db_map[stat] for stat in garminDbMain.gc_config.enabled_stats()] + garminDbMain.summary_dbs)
         garminDbMain.import_data(args.trace, args.latest, garminDbMain.gc_config.enabled_stats())
-        garminDbMain.analyze_data(args.trace)
+        garminDbMain.analyze_data(args.trace, True)
 
-    if args.copy_data:
-        garminDbMain.copy_data(args.overwrite, args.latest, stats)
+    if args.pipeline and args.import_data and (args.copy_data or args.download_data):
+        garminDbMain.pipeline_data(args.copy_data, args.download_data, args.trace, args.overwrite, args.latest, stats)
+    else:
+        if args.copy_data:
+            garminDbMain.copy_data(args.overwrite, args.latest, stats)
 
-    if args.download_data:
-        garminDbMain.download_data(args.overwrite, args.latest, stats)
+        if args.download_data:
+            garminDbMain.download_data(args.overwrite, args.latest, stats)
 
-    if args.import_data:
-        garminDbMain.import_data(args.trace, args.latest, stats)
+        if args.import_data:
+            garminDbMain.import_data(args.trace, args.latest, stats)
 
     if args.analyze_data:
-        garminDbMain.analyze_data(args.trace)
+        garminDbMain.analyze_data(args.trace, args.full)
 
     if args.export_activity:
-        garminDbMain.export_activity(args.trace, os.getcwd(), args.export_activity)
+        garminDbMain.export_activities(args.trace, os.getcwd(), args.export_activity)
 
     if args.basecamp_activity:
         garminDbMain.basecamp_activity(args.trace, args.basecamp_activity)
@@ -10,7 +10,7 @@ import sys
 import argparse
 import logging
 
-from garmindb import GarminConnectConfigManager, format_version
+from garmindb import GarminConnectConfigManager, DbRegistry, format_version
 from garmindb.mshealthdb import MSHealthDb, MSHealthData, MSVaultData, Analyze
 
 
@@ -43,11 +43,11 @@ def main(argv):
     else:
         root_logger.setLevel(logging.INFO)
 
-    gc_config = GarminConnectConfigManager(args.config)
+    gc_config = GarminConnectConfigManager(args.config, 'import')
     db_params = gc_config.get_db_params()
 
     if args.delete_db or args.rebuild_db:
-        MSHealthDb.delete_db(db_params)
+        DbRegistry.delete_db(MSHealthDb, db_params)
         if args.delete_db:
             sys.exit()
 
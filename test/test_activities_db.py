@@ -7,11 +7,17 @@ __license__ = "GPL"
 
 import unittest
 import logging
+import datetime
+import tempfile
+import os
+import types
+import textwrap
 
 import fitfile
 
-from garmindb import GarminActivitiesFitData, GarminTcxData, GarminJsonSummaryData, GarminJsonDetailsData, ActivityFitFileProcessor, GarminConnectConfigManager, PluginManager
-from garmindb.garmindb import GarminDb, Device, File, DeviceInfo
+from garmindb import GarminActivitiesFitData, GarminTcxData, GarminJsonSummaryData, GarminJsonDetailsData, ActivityFitFileProcessor, GarminConnectConfigManager, PluginManager, \
+    ActivityRecordArrays, DbRegistry
+from garmindb.garmindb import GarminDb, Device, File, DeviceInfo, ImportLedger
 from garmindb.garmindb import ActivitiesDb, Activities, ActivityLaps, ActivitySplits, ActivityRecords, StepsActivities, PaddleActivities, CycleActivities, ClimbingActivities
 
 from test_db_base import TestDBBase
@@ -62,6 +68,54 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
         self.assertGreater(PaddleActivities.row_count(self.garmin_act_db), 0)
         self.assertGreater(CycleActivities.row_count(self.garmin_act_db), 0)
 
+    def __load_plugin(self, name, plugin_source):
+        with tempfile.TemporaryDirectory() as plugin_dir:
+            with open(os.path.join(plugin_dir, f'{name}_plugin.py'), 'w') as file:
+                file.write(textwrap.dedent(plugin_source))
+            return PluginManager(plugin_dir, self.test_db_params)
+
+    def test_plugin_matches_cached(self):
+        plugin_manager = self.__load_plugin('cached_match', """
+            import fitfile
+            from garmindb import ActivityFitPluginBase
+
+
+            class cached_match(ActivityFitPluginBase):
+                _tables = {}
+                _sport = fitfile.Sport.running.value
+
+                def write_record_entry(self, session, fit_file, activity_id, message_fields, record_num):
+                    return {'cadence': 1}
+        """)
+        run = types.SimpleNamespace(dev_application_ids=[], sport_type=fitfile.Sport.running, sub_sport_type=None, dev_fields={})
+        walk = types.SimpleNamespace(dev_application_ids=[], sport_type=fitfile.Sport.walking, sub_sport_type=None, dev_fields={})
+        run_plugins = plugin_manager.get_file_plugins('ActivityFit', run)
+        self.assertIs(plugin_manager.get_file_plugins('ActivityFit', run), run_plugins)
+        self.assertEqual(len(run_plugins), 1)
+        self.assertEqual(run_plugins.dispatch('write_record_entry', None, run, '1', {}, 0), {'cadence': 1})
+        self.assertEqual(run_plugins.dispatch('write_lap_entry', None, run, '1', {}, 0), {})
+        walk_plugins = plugin_manager.get_file_plugins('ActivityFit', walk)
+        self.assertEqual(len(walk_plugins), 0)
+        self.assertEqual(walk_plugins.dispatch('write_record_entry', None, walk, '1', {}, 0), {})
+        self.assertIs(plugin_manager.get_file_plugins('MonitoringFit', run), PluginManager.no_plugins)
+
+    def test_plugin_own_matches_not_cached(self):
+        plugin_manager = self.__load_plugin('own_match', """
+            from garmindb import ActivityFitPluginBase
+
+
+            class own_match(ActivityFitPluginBase):
+                _tables = {}
+
+                @classmethod
+                def matches_activity_file(cls, fit_file):
+                    return fit_file.product == 'edge'
+        """)
+        edge = types.SimpleNamespace(dev_application_ids=[], sport_type=None, sub_sport_type=None, dev_fields={}, product='edge')
+        watch = types.SimpleNamespace(dev_application_ids=[], sport_type=None, sub_sport_type=None, dev_fields={}, product='fenix')
+        self.assertEqual(len(plugin_manager.get_file_plugins('ActivityFit', edge)), 1)
+        self.assertEqual(len(plugin_manager.get_file_plugins('ActivityFit', watch)), 0)
+
     def check_activities_fields(self, fields_list):
         self.check_not_none_cols(self.test_act_db, {Activities : fields_list})
 
@@ -109,7 +163,7 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
             gjsd.process()
 
     def tcx_file_import(self):
-        ActivitiesDb.delete_db(self.test_db_params)
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
         gtd = GarminTcxData('test_files/tcx', latest=False, measurement_system=self.measurement_system, debug=2)
         if gtd.file_count() > 0:
             gtd.process_files(self.test_db_params)
@@ -119,7 +173,7 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
     #
     @unittest.skipIf(not do_fit_import_test, "Skipping fit import test")
     def test_fit_file_import(self):
-        ActivitiesDb.delete_db(self.test_db_params)
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
         self.fit_file_import()
         self.check_activities_fields([Activities.start_time, Activities.stop_time, Activities.elapsed_time])
         self.check_activities()
@@ -127,20 +181,20 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
 
     @unittest.skipIf(not do_tcx_import_tests, "Skipping tcx import test")
     def test_tcx_file_import(self):
-        ActivitiesDb.delete_db(self.test_db_params)
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
         self.tcx_file_import()
         self.check_activities_fields([Activities.sport, Activities.laps])
 
     @unittest.skipIf(not do_summary_import_tests, "Skipping summary import test")
     def test_summary_json_file_import(self):
-        ActivitiesDb.delete_db(self.test_db_params)
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
         self.summary_json_file_import()
         self.check_activities_fields([Activities.name, Activities.type, Activities.sport, Activities.sub_sport])
         self.check_activities_field_value(Activities.avg_speed, 0, 50)
 
     @unittest.skipIf(not do_details_import_tests, "Skipping details import test")
     def test_details_json_file_import(self):
-        ActivitiesDb.delete_db(self.test_db_params)
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
         self.details_json_file_import()
 
     @unittest.skipIf(not do_multiple_import_tests, "Skipping multiple import test")
@@ -152,6 +206,48 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
         self.fit_file_import()
         self.check_activities_fields([Activities.start_time, Activities.stop_time, Activities.elapsed_time])
 
+    def __fit_file_import_rows(self, workers):
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
+        ImportLedger.delete_for_dbs(DbRegistry.get(GarminDb, self.test_db_params), [ActivitiesDb.db_name])
+        gfd = GarminActivitiesFitData('test_files/fit/activity', latest=False, measurement_system=self.measurement_system, debug=2)
+        if gfd.file_count() < 2:
+            self.skipTest('Skipping parallel fit import test, fewer than two test files')
+        gfd.process_files(ActivityFitFileProcessor(self.test_db_params, self.plugin_manager), workers)
+        test_act_db = DbRegistry.get(ActivitiesDb, self.test_db_params)
+        rows = {}
+        with test_act_db.managed_session() as session:
+            for table in [Activities, ActivityLaps, ActivityRecords, StepsActivities, PaddleActivities, CycleActivities]:
+                columns = table.__table__.columns
+                rows[table.__tablename__] = [tuple(getattr(row, column.name) for column in columns)
+                                             for row in session.query(table).order_by(*table.__table__.primary_key.columns).all()]
+        return rows
+
+    def test_fit_file_import_parallel(self):
+        serial_rows = self.__fit_file_import_rows(1)
+        parallel_rows = self.__fit_file_import_rows(2)
+        for table_name, rows in serial_rows.items():
+            self.assertEqual(parallel_rows[table_name], rows, table_name)
+
+    @unittest.skipIf(not ActivityRecordArrays.available(), "Skipping activity record arrays test, numpy isn't installed")
+    def test_activity_record_arrays(self):
+        DbRegistry.delete_db(ActivitiesDb, self.test_db_params)
+        test_act_db = ActivitiesDb(self.test_db_params)
+        start = datetime.datetime(2020, 1, 1, 10)
+        with test_act_db.managed_session() as session:
+            session.add(Activities(activity_id='1', start_time=start))
+            for record in range(10):
+                session.add(ActivityRecords(activity_id='1', record=record, timestamp=start + datetime.timedelta(seconds=record), hr=100 + record,
+                                            position_lat=(42.0 if record else None), position_long=-71.0))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            record_arrays = ActivityRecordArrays(temp_dir)
+            self.assertIsNone(record_arrays.read('1'))
+            arrays = record_arrays.get(test_act_db, '1')
+            self.assertEqual(list(arrays), ActivityRecordArrays.columns)
+            self.assertEqual(arrays['hr'].tolist(), [100.0 + record for record in range(10)])
+            self.assertEqual(arrays['timestamp'][-1].item(), start + datetime.timedelta(seconds=9))
+            arrays = record_arrays.read('1')
+            self.assertEqual(int((arrays['position_lat'] != arrays['position_lat']).sum()), 1)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,57 @@
+"""Test the garmindb_cli script."""
+
+__author__ = "Tom Goetz"
+__copyright__ = "Copyright Tom Goetz"
+__license__ = "GPL"
+
+import os
+import unittest
+import importlib.util
+
+from garmindb import Statistics
+
+
+spec = importlib.util.spec_from_file_location('garmindb_cli', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'garmindb_cli.py'))
+garmindb_cli = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(garmindb_cli)
+
+
+class TestCli(unittest.TestCase):
+    """Class for testing the garmindb_cli script."""
+
+    def __pipeline_imported_stats(self, copy, download, stats):
+        # Skip __init__ so that the test doesn't depend on the user's config and plugins. Acquiring only reports the stats it handles.
+        main = garmindb_cli.GarminDbMain.__new__(garmindb_cli.GarminDbMain)
+        imported_stats = []
+
+        def copy_data(overwrite, latest, stats, stat_done=None):
+            for stat in [Statistics.activities, Statistics.monitoring, Statistics.sleep]:
+                if stat in stats and stat_done:
+                    stat_done(stat)
+
+        def download_data(overwrite, latest, stats, stat_done=None):
+            for stat in [Statistics.activities, Statistics.monitoring, Statistics.sleep, Statistics.weight]:
+                if stat in stats and stat_done:
+                    stat_done(stat)
+
+        main.copy_data = copy_data
+        main.download_data = download_data
+        main._GarminDbMain__import_settings = lambda debug: 'metric'
+        main._GarminDbMain__import_stat = lambda debug, latest, stat, measurement_system: imported_stats.append(stat)
+        main.pipeline_data(copy, download, 0, False, True, stats)
+        return imported_stats
+
+    def test_pipeline_imports_all_stats(self):
+        stats = [Statistics.activities, Statistics.monitoring, Statistics.sleep, Statistics.weight, Statistics.rhr, Statistics.hrv]
+        for copy, download in [(True, False), (False, True), (True, True)]:
+            imported_stats = self.__pipeline_imported_stats(copy, download, stats)
+            self.assertCountEqual(imported_stats, stats, f'copy {copy} download {download}')
+
+    def test_pipeline_imports_selected_stats(self):
+        stats = [Statistics.sleep, Statistics.rhr]
+        imported_stats = self.__pipeline_imported_stats(True, False, stats)
+        self.assertEqual(imported_stats, stats)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -9,7 +9,10 @@ import unittest
 import logging
 import sys
 
+from sqlalchemy import text
+
 from garmindb import GarminConnectConfigManager
+from garmindb.garmindb import GarminDb
 
 
 root_logger = logging.getLogger()
@@ -50,5 +53,16 @@ class TestConfig(unittest.TestCase):
         expected_db_path = self.homedir + os.sep + 'HealthData' + os.sep + 'DBs'
         self.assertEqual(db_params.db_path, expected_db_path, f"expected {expected_db_path} actual {db_params.db_path}")
 
+    def test_sqlite_pragmas(self):
+        db_params = GarminConnectConfigManager(sqlite_pragmas_preset='import').get_db_params(test_db=True)
+        expected_pragmas = self.gc_config.get_node_value_default('db', 'sqlite_pragmas', GarminConnectConfigManager.default_sqlite_pragmas)['import']
+        self.assertEqual(db_params.sqlite_pragmas, expected_pragmas)
+        garmin_db = GarminDb(db_params)
+        with garmin_db.managed_session() as session:
+            for name in ['journal_mode', 'cache_size', 'mmap_size']:
+                value = session.execute(text(f'PRAGMA {name}')).scalar()
+                self.assertEqual(str(value).lower(), str(expected_pragmas[name]).lower(), f'pragma {name}')
+        garmin_db.engine.dispose()
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -6,12 +6,17 @@ __license__ = "GPL"
 
 import unittest
 import logging
+import os
+import datetime
+import tempfile
 # from sqlalchemy.exc import LookupError
 
 import fitfile
+import idbutils
+from sqlalchemy import inspect, text
 
-from garmindb import GarminConnectConfigManager
-from garmindb.garmindb import GarminDb, File, Attributes
+from garmindb import GarminConnectConfigManager, DbRegistry, LedgerJsonFileProcessor
+from garmindb.garmindb import GarminDb, MonitoringDb, File, Attributes, ImportLedger, DirtyRange, DownloadJob, DataCoverage, Weight
 
 
 root_logger = logging.getLogger()
@@ -122,6 +127,163 @@ class TestGarminDbObjects(unittest.TestCase):
             result = Attributes.measurements_type(self.garmin_db)
             self.assertEqual(result, value)
 
+    def test_import_ledger(self):
+        importer = 'TestImporter'
+        with tempfile.TemporaryDirectory() as test_dir:
+            file_names = [test_dir + os.sep + f'file_{index}.json' for index in range(3)]
+            for file_name in file_names:
+                with open(file_name, 'w') as file:
+                    file.write(file_name)
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, MonitoringDb), file_names)
+            ImportLedger.record(self.garmin_db, file_names, importer, MonitoringDb)
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, MonitoringDb), [])
+            # touching a file without changing its contents doesn't make it changed
+            os.utime(file_names[0], (0, 0))
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, MonitoringDb), [])
+            with open(file_names[1], 'a') as file:
+                file.write('changed')
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, MonitoringDb), [file_names[1]])
+            # files imported by one importer are new to another importer or when imported into another database
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, 'OtherImporter', MonitoringDb), file_names)
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, GarminDb), file_names)
+            ImportLedger.delete_for_dbs(self.garmin_db, [MonitoringDb.db_name])
+            self.assertEqual(ImportLedger.changed_files(self.garmin_db, file_names, importer, MonitoringDb), file_names)
+
+    def test_ledger_json_file_processor(self):
+        class TestJsonFileProcessor(LedgerJsonFileProcessor):
+            conversions = {}
+
+            def _process_json(self, json_data):
+                return json_data['updates']
+
+        with tempfile.TemporaryDirectory() as test_dir:
+            contents = ['{"updates": 1}', '{"updates": 0}', '{"updates": ']
+            for index, content in enumerate(contents):
+                with open(test_dir + os.sep + f'file_{index}.json', 'w') as file:
+                    file.write(content)
+            db_params = GarminConnectConfigManager().get_db_params(test_db=True)
+            TestJsonFileProcessor(db_params, r'.*\.json', input_dir=test_dir, latest=False).process()
+            # only files that data was imported from are recorded as imported
+            file_names = TestJsonFileProcessor(db_params, r'.*\.json', input_dir=test_dir, latest=False).file_names
+            self.assertEqual(sorted(os.path.basename(file_name) for file_name in file_names), ['file_1.json', 'file_2.json'])
+
+    def test_dirty_range(self):
+        DirtyRange.clear(self.garmin_db, datetime.datetime.now())
+        days = [datetime.date(2020, 2, 27), datetime.date(2020, 2, 28), datetime.date(2020, 2, 29), datetime.date(2020, 3, 5)]
+        DirtyRange.add_days(self.garmin_db, days, 'TestImporter')
+        # consecutive days are recorded as one range
+        self.assertEqual(DirtyRange.row_count(self.garmin_db), 2)
+        DirtyRange.add(self.garmin_db, datetime.datetime(2020, 3, 6, 23, 0), datetime.datetime(2020, 3, 5, 1, 0), 'OtherImporter')
+        self.assertEqual(DirtyRange.get_days(self.garmin_db), days + [datetime.date(2020, 3, 6)])
+        DirtyRange.clear(self.garmin_db, datetime.datetime.now())
+        self.assertEqual(DirtyRange.get_days(self.garmin_db), [])
+
+    def test_download_job(self):
+        stat = 'test_stat'
+        with self.garmin_db.managed_session() as session:
+            session.query(DownloadJob).filter(DownloadJob.stat == stat).delete()
+        DownloadJob.queue(self.garmin_db, stat, ['2020-01-02', '2020-01-01'])
+        self.assertEqual([job.item for job in DownloadJob.due(self.garmin_db, stat)], ['2020-01-01', '2020-01-02'])
+        DownloadJob.record(self.garmin_db, stat, ['2020-01-01'])
+        DownloadJob.record(self.garmin_db, stat, ['2020-01-02'], 'Failed')
+        # the failed job is not due until its retry time
+        self.assertEqual(DownloadJob.due(self.garmin_db, stat), [])
+        with self.garmin_db.managed_session() as session:
+            failed_job = DownloadJob.s_get_stat(session, stat)['2020-01-02']
+            self.assertEqual((failed_job.status, failed_job.attempts, failed_job.last_error), (DownloadJob.failed, 1, 'Failed'))
+        # done jobs are only queued again when redone
+        DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'])
+        self.assertEqual(DownloadJob.due(self.garmin_db, stat), [])
+        DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'], redo=['2020-01-01'])
+        self.assertEqual([job.item for job in DownloadJob.due(self.garmin_db, stat)], ['2020-01-01'])
+
+    def test_download_job_missing_file(self):
+        stat = 'test_stat_files'
+        with self.garmin_db.managed_session() as session:
+            session.query(DownloadJob).filter(DownloadJob.stat == stat).delete()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'test.fit')
+            with open(filename, 'w') as file:
+                file.write('test')
+
+            def missing(job):
+                return not os.path.isfile(filename)
+            DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'], missing=missing)
+            DownloadJob.record(self.garmin_db, stat, ['2020-01-01'])
+            DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'], missing=missing)
+            self.assertEqual(DownloadJob.due(self.garmin_db, stat), [])
+            # the job is run again once the file it downloaded is deleted
+            os.remove(filename)
+            DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'], missing=missing)
+            self.assertEqual([job.item for job in DownloadJob.due(self.garmin_db, stat)], ['2020-01-01'])
+
+    def test_download_job_exhausted(self):
+        stat = 'test_stat_exhausted'
+        with self.garmin_db.managed_session() as session:
+            session.query(DownloadJob).filter(DownloadJob.stat == stat).delete()
+        DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'])
+        for _ in range(DownloadJob.max_attempts):
+            DownloadJob.record(self.garmin_db, stat, ['2020-01-01'], 'Failed')
+        self.assertEqual([job.item for job in DownloadJob.exhausted(self.garmin_db, stat)], ['2020-01-01'])
+        with self.garmin_db.managed_session() as session:
+            job = DownloadJob.s_get_stat(session, stat)['2020-01-01']
+            self.assertGreaterEqual(job.next_retry, datetime.datetime.now() + DownloadJob.exhausted_retry_delay - datetime.timedelta(minutes=1))
+        # redoing the job resets its attempts
+        DownloadJob.queue(self.garmin_db, stat, ['2020-01-01'], redo=['2020-01-01'])
+        self.assertEqual(DownloadJob.exhausted(self.garmin_db, stat), [])
+        self.assertEqual([(job.item, job.attempts) for job in DownloadJob.due(self.garmin_db, stat)], [('2020-01-01', 0)])
+
+    def test_data_coverage(self):
+        stat = 'test_coverage_stat'
+        with self.garmin_db.managed_session() as session:
+            session.query(DataCoverage).filter(DataCoverage.stat == stat).delete()
+            session.query(DownloadJob).filter(DownloadJob.stat == stat).delete()
+        self.assertFalse(DataCoverage.has_stat(self.garmin_db, stat))
+        start = datetime.date(2020, 1, 1)
+        DataCoverage.add_days(self.garmin_db, stat, [start + datetime.timedelta(days=day) for day in [2, 3, 6]], 'test')
+        self.assertTrue(DataCoverage.has_stat(self.garmin_db, stat))
+        missing_ranges = DataCoverage.missing_ranges(self.garmin_db, stat, start, start + datetime.timedelta(days=10))
+        self.assertEqual(missing_ranges, [(start, 2), (start + datetime.timedelta(days=4), 2), (start + datetime.timedelta(days=7), 3)])
+        # days that were downloaded but had no data are covered
+        downloaded_day = (start + datetime.timedelta(days=4)).isoformat()
+        DownloadJob.queue(self.garmin_db, stat, [downloaded_day])
+        DownloadJob.record(self.garmin_db, stat, [downloaded_day])
+        missing_ranges = DataCoverage.missing_ranges(self.garmin_db, stat, start, start + datetime.timedelta(days=10))
+        self.assertEqual(missing_ranges, [(start, 2), (start + datetime.timedelta(days=5), 1), (start + datetime.timedelta(days=7), 3)])
+
+    def test_indexes_added_to_existing_db(self):
+        with tempfile.TemporaryDirectory() as db_dir:
+            db_params = idbutils.DbParams(db_type='sqlite', db_path=db_dir)
+            garmin_db = GarminDb(db_params)
+            with garmin_db.managed_session() as session:
+                session.execute(text('DROP INDEX ix_stress_timestamp_stress'))
+            self.assertNotIn('ix_stress_timestamp_stress', [index['name'] for index in inspect(garmin_db.engine).get_indexes('stress')])
+            garmin_db = GarminDb(db_params)
+            self.assertIn('ix_stress_timestamp_stress', [index['name'] for index in inspect(garmin_db.engine).get_indexes('stress')])
+            garmin_db.engine.dispose()
+
+    def test_db_registry(self):
+        with tempfile.TemporaryDirectory() as db_dir:
+            db_params = idbutils.DbParams(db_type='sqlite', db_path=db_dir)
+            garmin_db = DbRegistry.get(GarminDb, db_params)
+            self.assertIs(DbRegistry.get(GarminDb, idbutils.DbParams(db_type='sqlite', db_path=db_dir)), garmin_db)
+            self.assertIsNot(DbRegistry.get(MonitoringDb, db_params), garmin_db)
+            DbRegistry.delete_db(GarminDb, db_params)
+            self.assertFalse(os.path.exists(os.path.join(db_dir, 'garmin.db')))
+            self.assertIsNot(DbRegistry.get(GarminDb, db_params), garmin_db)
+            DbRegistry.close(GarminDb, db_params)
+            DbRegistry.close(MonitoringDb, db_params)
+
+    def test_daily_stats_for_days(self):
+        days = [datetime.datetime(1990, 1, 1) + datetime.timedelta(day) for day in range(5)]
+        for index, day in enumerate(days[:3]):
+            Weight.insert_or_update(self.garmin_db, {'day': day, 'weight': 70.0 + index})
+        with self.garmin_db.managed_session() as session:
+            stats_by_day = Weight.s_get_daily_stats_for_days(session, days)
+            self.assertEqual(list(stats_by_day), days)
+            for day in days:
+                self.assertEqual(stats_by_day[day], Weight.get_daily_stats(session, day))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -14,6 +14,8 @@ from garmindb import GarminConnectConfigManager, GarminMonitoringFitData, Garmin
 from garmindb.garmindb import GarminDb, File, Device, DeviceInfo, DailySummary
 from garmindb.garmindb import MonitoringDb, Monitoring, MonitoringInfo, MonitoringHeartRate, MonitoringIntensity, MonitoringClimb
 
+from garmindb.upsert_buffer import UpsertBuffer
+
 from test_db_base import TestDBBase
 
 
@@ -92,6 +94,25 @@ class TestMonitoringDB(TestDBBase, unittest.TestCase):
         }
         self.check_not_none_cols(GarminDb(db_params), table_not_none_cols_dict)
 
+    def test_upsert_buffer(self):
+        test_mon_db = MonitoringDb(self.gc_config.get_db_params(test_db=True))
+        timestamp = datetime.datetime(2000, 1, 1, 12, 0, 0)
+        activity_type = fitfile.field_enums.ActivityType.walking
+        with test_mon_db.managed_session() as session:
+            upsert_buffer = UpsertBuffer(session, Monitoring, batch_size=2)
+            upsert_buffer.add({'timestamp' : timestamp, 'activity_type' : activity_type, 'steps' : 10, 'active_calories' : 5})
+            upsert_buffer.add({'timestamp' : timestamp, 'activity_type' : activity_type, 'steps' : 20, 'active_calories' : None})
+            upsert_buffer.flush()
+            upsert_buffer.add({'timestamp' : timestamp, 'activity_type' : activity_type, 'steps' : None, 'active_calories' : 7})
+            upsert_buffer.add({'timestamp' : timestamp + datetime.timedelta(minutes=1), 'activity_type' : activity_type, 'steps' : 30})
+        with test_mon_db.managed_session() as session:
+            monitoring = Monitoring.s_get_from_dict(session, {'timestamp' : timestamp, 'activity_type' : activity_type})
+            self.assertEqual(monitoring.steps, 20)
+            self.assertEqual(monitoring.active_calories, 7)
+            self.assertEqual(monitoring.duration, datetime.time.min)
+            monitoring = Monitoring.s_get_from_dict(session, {'timestamp' : timestamp + datetime.timedelta(minutes=1), 'activity_type' : activity_type})
+            self.assertEqual(monitoring.steps, 30)
+
     def check_day_steps(self, data):
         last_steps = {}
         last_steps_timestamp = None
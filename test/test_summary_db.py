@@ -6,8 +6,9 @@ __license__ = "GPL"
 
 import unittest
 import logging
+import datetime
 
-from garmindb import summarydb, GarminConnectConfigManager
+from garmindb import summarydb, GarminConnectConfigManager, DbRegistry
 
 from test_summary_db_base import TestSummaryDBBase
 
@@ -32,6 +33,40 @@ class TestSummaryDB(TestSummaryDBBase, unittest.TestCase):
         }
         super().setUpClass(db, table_dict)
 
+    def test_rollup(self):
+        db_params = GarminConnectConfigManager().get_db_params(test_db=True)
+        DbRegistry.delete_db(summarydb.SummaryDb, db_params)
+        sum_db = DbRegistry.get(summarydb.SummaryDb, db_params)
+        days = [
+            summarydb.DaysSummary(day=datetime.datetime(2024, 2, 28), steps=1000, hr_avg=60.0, hr_count=300, hr_max=120.0, stress_avg=20, stress_count=1,
+                                  sleep_avg=datetime.time(7), intensity_time=datetime.time(0, 30)),
+            summarydb.DaysSummary(day=datetime.datetime(2024, 2, 29), steps=3000, hr_avg=70.0, hr_count=100, hr_max=150.0, stress_avg=25, stress_count=2,
+                                  sleep_avg=datetime.time.min, intensity_time=datetime.time(0, 40)),
+            summarydb.DaysSummary(day=datetime.datetime(2024, 3, 1), steps=None, hr_avg=None, hr_max=None, sleep_avg=datetime.time(8),
+                                  intensity_time=datetime.time.min),
+        ]
+        with sum_db.managed_session() as session:
+            session.add_all(days)
+        week = (datetime.datetime(2024, 2, 26), datetime.datetime(2024, 3, 4))
+        february = (datetime.datetime(2024, 2, 1), datetime.datetime(2024, 3, 1))
+        march = (datetime.datetime(2024, 3, 1), datetime.datetime(2024, 4, 1))
+        with sum_db.managed_session() as session:
+            stats = summarydb.DaysSummary.s_rollup(session, [week])[week[0]]
+            self.assertEqual(stats['steps'], 4000)
+            # averages are weighted by the number of samples behind each day's average
+            self.assertEqual(stats['hr_avg'], 62.5)
+            self.assertEqual(stats['hr_count'], 400)
+            self.assertEqual(stats['hr_max'], 150.0)
+            self.assertAlmostEqual(stats['stress_avg'], 70 / 3)
+            self.assertEqual(stats['sleep_avg'], datetime.time(7, 30))
+            self.assertEqual(stats['intensity_time'], datetime.time(1, 10))
+            self.assertEqual(stats['weight_avg'], None)
+            stats = summarydb.DaysSummary.s_rollup(session, [february, march], weekly=False)
+            self.assertEqual(list(stats), [february[0], march[0]])
+            self.assertEqual(stats[february[0]]['intensity_time'], datetime.time(4, 5))
+            self.assertEqual(stats[march[0]]['steps'], None)
+            self.assertEqual(stats[march[0]]['sleep_avg'], datetime.time(8))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -6,10 +6,14 @@ __license__ = "GPL"
 
 import unittest
 import logging
+import os
+import datetime
+import tempfile
 
-from idbutils import FileProcessor
+from idbutils import FileProcessor, Location
+from fitfile import Distance, Speed
 
-from garmindb import Tcx
+from garmindb import Tcx, TcxWriter, TcxReader
 
 
 root_logger = logging.getLogger()
@@ -44,6 +48,30 @@ class TestTcxFile(unittest.TestCase):
         for file_name in file_names:
             self.check_activity_file(file_name)
 
+    def test_write_tcx(self):
+        start = datetime.datetime(2020, 1, 1, 10)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'activity.tcx')
+            with open(filename, 'wb') as file:
+                tcx = TcxWriter(file)
+                tcx.start_activity('running', start)
+                for lap in range(2):
+                    lap_start = start + datetime.timedelta(minutes=lap)
+                    tcx.start_lap(lap_start, lap_start + datetime.timedelta(minutes=1), Distance.from_meters(100.0), 10)
+                    for second in range(0, 60, 10):
+                        tcx.add_point(lap_start + datetime.timedelta(seconds=second), Location(42.0, -71.0), Distance.from_meters(10.0), 120, Speed.from_mps(2.0))
+                    tcx.end_lap()
+                tcx.end_activity('Forerunner', 123)
+            self.check_activity_file(filename)
+            tcx = Tcx()
+            tcx.read(filename)
+            self.assertEqual((tcx.sport, tcx.lap_count, len(tcx.points), tcx.serial_number), ('running', 2, 12, '123'))
+            self.assertEqual(tcx.distance.to_meters(), 200.0)
+            tcx_reader = TcxReader().read(filename)
+            self.assertEqual((tcx_reader.sport, len(tcx_reader.laps), len(tcx_reader.points), tcx_reader.get_serial_number()), ('running', 2, 12, '123'))
+            self.assertEqual([point['time'] for point in tcx_reader.points], [tcx.get_point_time(point) for point in tcx.points])
+            self.assertEqual({point['speed'] for point in tcx_reader.points}, {2.0})
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)